@@ -0,0 +1,448 @@
+"""Benchmark de la recuperación que usa `agente_legal` sobre los códigos de `documentos/`.
+
+Evalúa un conjunto etiquetado de preguntas -> artículos esperados (`benchmark/preguntas.jsonl`)
+con distintas configuraciones: estrategia de fragmentación, `num_documents`, búsqueda híbrida
+o vectorial, motor (instantánea local en proceso o PgVector), índice ANN y cuantización de los
+vectores de la primera pasada (float16, int8, binario o reducido, con reordenación sobre los
+vectores completos). Por defecto usa un
+embedder falso y determinista (hashing de palabras), de modo que corre sin red ni API keys;
+con `--embedder openai` mide con los embeddings reales.
+
+Métricas por configuración: recall@k, acierto@k, MRR, latencia p50/p95/p99 de la búsqueda y
+tokens inyectados por consulta (contenido de los documentos devueltos). Con cuantización,
+además, el tamaño del índice que recorre la primera pasada y el solapamiento del top-k de la
+búsqueda solo vectorial con el de float32 (también en las configuraciones híbridas, donde los
+candidatos de texto completo ocultarían una primera pasada vectorial rota).
+
+Uso:
+    python benchmark_recuperacion.py                                   # local, embedder falso
+    python benchmark_recuperacion.py --estrategias articulos,fijo --k 3,5,10 --busquedas hibrida,vector
+    python benchmark_recuperacion.py --backend pgvector --indices hnsw,ivfflat
+    python benchmark_recuperacion.py --cuantizaciones float32,int8,binario,reducido --busquedas hibrida,vector
+    python benchmark_recuperacion.py --guardar benchmark/referencia.json
+    python benchmark_recuperacion.py --comparar benchmark/referencia.json   # sale con código 1 si empeora
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from agno.document import Document
+from agno.document.chunking.fixed import FixedSizeChunking
+from agno.embedder.base import Embedder
+from agno.utils.log import log_info, logger
+
+from configuracion import DOCUMENTOS_PATH
+from fragmentador_legal import fragmentar_articulos
+from indice_articulos import entradas_de_codigo, normalizar, normalizar_numero
+from motor_ingesta import extraer_paginas, hash_contenido
+
+PREGUNTAS_PATH = Path(__file__).parent / "benchmark" / "preguntas.jsonl"
+
+# Palabras vacías que solo añaden ruido al embedder falso
+PALABRAS_VACIAS = frozenset(
+    "a al ante con de del el en es la las lo los mi me o para por que qué se si su sus un una y como cual cuál "
+    "cuando cuándo donde dónde hay le les mas más ni no sin sobre son tiene ya".split()
+)
+
+
+@dataclass
+class EmbedderFalso(Embedder):
+    """Embedder determinista para CI: hashing de raíces de palabras y bigramas, normalizado."""
+
+    id: str = "falso-hashing"
+    dimensions: int = 512
+
+    def _rasgos(self, texto: str) -> List[str]:
+        palabras = [p[:6] for p in normalizar(texto).split() if p not in PALABRAS_VACIAS and len(p) > 1]
+        return palabras + [f"{a}_{b}" for a, b in zip(palabras, palabras[1:])]
+
+    def get_embedding(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for rasgo in self._rasgos(text):
+            digest = hashlib.blake2b(rasgo.encode(), digest_size=8).digest()
+            valor = int.from_bytes(digest, "little")
+            vector[valor % self.dimensions] += 1.0 if (valor >> 32) & 1 else -1.0
+        norma = np.linalg.norm(vector)
+        return (vector / norma if norma else vector).tolist()
+
+    def get_embedding_and_usage(self, text: str):
+        return self.get_embedding(text), None
+
+
+@dataclass
+class Pregunta:
+    pregunta: str
+    esperados: List[Tuple[str, str]]
+
+
+@dataclass
+class Configuracion:
+    estrategia: str = "articulos"
+    busqueda: str = "hibrida"
+    k: int = 5
+    backend: str = "local"
+    indice: Optional[str] = None
+    cuantizacion: str = "float32"
+
+    @property
+    def nombre(self) -> str:
+        indice = f"/{self.indice}" if self.indice else ""
+        # float32 sin sufijo, para que las referencias guardadas sigan siendo comparables
+        cuantizacion = f"/{self.cuantizacion}" if self.cuantizacion != "float32" else ""
+        return f"{self.backend}{indice}{cuantizacion}/{self.estrategia}/{self.busqueda}/k={self.k}"
+
+    @property
+    def nombre_float32(self) -> str:
+        return replace(self, cuantizacion="float32").nombre
+
+
+@dataclass
+class Resultado:
+    configuracion: str
+    preguntas: int
+    recall: float
+    acierto: float
+    mrr: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    tokens_por_consulta: float
+    fragmentos: int
+    fallidas: List[str] = field(default_factory=list)
+    # Bytes del índice que recorre la primera pasada de la búsqueda vectorial
+    bytes_indice: Optional[int] = None
+    # Fracción del top-k de la búsqueda solo vectorial que coincide con la de float32
+    solapamiento: Optional[float] = None
+
+
+def cargar_preguntas(ruta: Path = PREGUNTAS_PATH) -> List[Pregunta]:
+    with open(ruta, encoding="utf-8") as f:
+        return [Pregunta(d["pregunta"], [tuple(e) for e in d["esperados"]]) for d in map(json.loads, filter(str.strip, f))]
+
+
+def fragmentar_corpus(estrategia: str, paginas: Dict[str, List[Document]]) -> List[Document]:
+    """Fragmentos del corpus con la estrategia dada ("articulos" o "fijo", la de PDFKnowledgeBase)."""
+    documentos: List[Document] = []
+    for codigo, paginas_codigo in paginas.items():
+        if estrategia == "articulos":
+            fragmentos = fragmentar_articulos(codigo, paginas_codigo)
+        elif estrategia == "fijo":
+            fragmentos = [f for pagina in paginas_codigo for f in FixedSizeChunking().chunk(pagina)]
+        else:
+            raise ValueError(f"Estrategia de fragmentación desconocida: {estrategia}")
+        for fragmento in fragmentos:
+            fragmento.name = codigo
+            fragmento.id = f"{codigo}_{hash_contenido(fragmento.content)}"
+        documentos.extend(fragmentos)
+    return list({doc.id: doc for doc in documentos}.values())
+
+
+def firmas_articulos(paginas: Dict[str, List[Document]], preguntas: Sequence[Pregunta]) -> Dict[Tuple[str, str], str]:
+    """Fragmento de texto característico de cada artículo esperado.
+
+    Sirve para reconocer el artículo en fragmentos sin metadatos (p. ej. los de tamaño fijo, donde
+    el encabezado "Art. N.-" puede quedar desplazado o partido). Se toman palabras del cuerpo lejos
+    de la primera línea.
+    """
+    esperados = {(codigo, normalizar_numero(numero)) for p in preguntas for codigo, numero in p.esperados}
+    firmas = {}
+    for codigo in {codigo for codigo, _ in esperados}:
+        entradas = entradas_de_codigo(codigo, paginas.get(codigo, []))
+        for clave in esperados:
+            entrada = entradas.get(clave[1]) if clave[0] == codigo else None
+            if entrada is None:
+                continue
+            palabras = normalizar(entrada["texto"]).split()
+            firmas[clave] = " ".join(palabras[15:27] if len(palabras) >= 30 else palabras[-8:])
+    return firmas
+
+
+def coincidencias(documento: Document, esperados: set, firmas: Dict[Tuple[str, str], str]) -> set:
+    """Artículos esperados que contiene un fragmento."""
+    numero = (documento.meta_data or {}).get("articulo")
+    if numero is not None:
+        return {(documento.name, normalizar_numero(numero))} & esperados
+    contenido = normalizar(documento.content or "")
+    return {clave for clave in esperados if clave[0] == documento.name and clave in firmas and firmas[clave] in contenido}
+
+
+def embeber(documentos: List[Document], embedder: Embedder) -> None:
+    if isinstance(embedder, EmbedderFalso):
+        for doc in documentos:
+            doc.embedding = embedder.get_embedding(doc.content)
+    else:
+        from motor_ingesta import EmbedderPorLotes
+
+        EmbedderPorLotes(getattr(embedder, "embedder", embedder)).embeber(documentos)
+
+
+def construir_backend(configuracion: Configuracion, documentos: List[Document], embedder: Embedder, directorio: Path):
+    """Vector DB de la configuración con los documentos ya cargados."""
+    if configuracion.backend == "local":
+        from recuperacion_local import VectorDbLocal, directorio_snapshot, snapshot_desde_documentos
+
+        ruta = directorio / configuracion.estrategia
+        if directorio_snapshot(ruta) is None:
+            snapshot_desde_documentos(documentos, ruta, embedder)
+        # La copia compacta que falte en la instantánea se calcula al cargarla
+        return VectorDbLocal(ruta=ruta, embedder=embedder, cuantizacion=configuracion.cuantizacion)
+
+    if configuracion.backend == "pgvector":
+        from agno.vectordb.pgvector import SearchType
+
+        from configuracion import ESQUEMA_CONOCIMIENTO, db_url
+        from indices_vectoriales import PgVectorIndexado, configurar_indice, construir_indices
+        from motor_ingesta import escribir_filas
+
+        vector_db = PgVectorIndexado(
+            table_name=f"benchmark_{configuracion.estrategia}_{embedder.dimensions}",
+            schema=ESQUEMA_CONOCIMIENTO,
+            db_url=db_url,
+            search_type=SearchType.hybrid,
+            embedder=embedder,
+            vector_index=configurar_indice(configuracion.indice or "ninguno"),
+            cuantizacion=configuracion.cuantizacion,
+        )
+        if not vector_db.exists() or vector_db.get_count() != len(documentos):
+            vector_db.drop()
+            vector_db.create()
+            escribir_filas(vector_db, documentos)
+        if vector_db.vector_index is not None:
+            vector_db.resumen_indices = construir_indices(vector_db, reconstruir=True)
+        return vector_db
+
+    raise ValueError(f"Backend desconocido: {configuracion.backend}")
+
+
+def bytes_indice(vector_db) -> Optional[int]:
+    """Tamaño de los vectores de la primera pasada: matriz (o copia compacta) local o índice ANN en Postgres."""
+    if hasattr(vector_db, "bytes_indice"):
+        return vector_db.bytes_indice()
+    resumen = getattr(vector_db, "resumen_indices", None)
+    if resumen is None:
+        return None
+    from indices_vectoriales import tamano_indices
+
+    return tamano_indices(vector_db).get(resumen["indice"])
+
+
+def contador_tokens():
+    """Tokens cl100k; sin el vocabulario descargado (CI sin red) se estiman como caracteres / 4."""
+    try:
+        import tiktoken
+
+        codificador = tiktoken.get_encoding("cl100k_base")
+        return lambda texto: len(codificador.encode(texto))
+    except Exception as e:
+        logger.warning(f"tiktoken no disponible ({e.__class__.__name__}); se estiman los tokens como caracteres / 4")
+        return lambda texto: len(texto) // 4
+
+
+def evaluar(
+    configuracion: Configuracion,
+    preguntas: Sequence[Pregunta],
+    vector_db,
+    fragmentos: int,
+    firmas: Optional[Dict[Tuple[str, str], str]] = None,
+    contar=None,
+    referencia: Optional[List[List[str]]] = None,
+    ids: Optional[List[List[str]]] = None,
+) -> Resultado:
+    """Métricas de una configuración.
+
+    `ids` recibe el top-k de la búsqueda solo vectorial de cada pregunta y `referencia` es el de
+    float32; en las configuraciones híbridas esa búsqueda se hace aparte, fuera de la medición.
+    """
+    contar = contar or contador_tokens()
+    buscar = vector_db.hybrid_search if configuracion.busqueda == "hibrida" else vector_db.vector_search
+    # Calentamiento: carga la instantánea / abre conexiones fuera de la medición
+    buscar(preguntas[0].pregunta, limit=configuracion.k)
+
+    latencias, recalls, aciertos, rangos, tokens, fallidas = [], [], [], [], [], []
+    for pregunta in preguntas:
+        inicio = time.perf_counter()
+        documentos = buscar(pregunta.pregunta, limit=configuracion.k)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        if ids is not None:
+            vectoriales = documentos if configuracion.busqueda == "vector" else vector_db.vector_search(pregunta.pregunta, limit=configuracion.k)
+            ids.append([doc.id for doc in vectoriales])
+
+        esperados = {(codigo, normalizar_numero(numero)) for codigo, numero in pregunta.esperados}
+        encontrados, primer_rango = set(), None
+        for rango, doc in enumerate(documentos, start=1):
+            relevantes = coincidencias(doc, esperados, firmas or {})
+            if relevantes and primer_rango is None:
+                primer_rango = rango
+            encontrados |= relevantes
+        recalls.append(len(encontrados) / len(esperados))
+        aciertos.append(1.0 if encontrados else 0.0)
+        rangos.append(1.0 / primer_rango if primer_rango else 0.0)
+        tokens.append(sum(contar(doc.content or "") for doc in documentos))
+        if not encontrados:
+            fallidas.append(pregunta.pregunta)
+
+    return Resultado(
+        configuracion=configuracion.nombre,
+        preguntas=len(preguntas),
+        recall=round(float(np.mean(recalls)), 4),
+        acierto=round(float(np.mean(aciertos)), 4),
+        mrr=round(float(np.mean(rangos)), 4),
+        p50_ms=round(float(np.percentile(latencias, 50)), 3),
+        p95_ms=round(float(np.percentile(latencias, 95)), 3),
+        p99_ms=round(float(np.percentile(latencias, 99)), 3),
+        tokens_por_consulta=round(float(np.mean(tokens)), 1),
+        fragmentos=fragmentos,
+        fallidas=fallidas,
+        bytes_indice=bytes_indice(vector_db),
+        solapamiento=_solapamiento(ids, referencia) if ids is not None and referencia is not None else None,
+    )
+
+
+def _solapamiento(ids: List[List[str]], referencia: List[List[str]]) -> float:
+    fracciones = [len(set(a) & set(b)) / len(b) for a, b in zip(ids, referencia) if b]
+    return round(float(np.mean(fracciones)), 4) if fracciones else 1.0
+
+
+def ejecutar(
+    configuraciones: Sequence[Configuracion],
+    preguntas: Sequence[Pregunta],
+    embedder: Embedder,
+    ruta_documentos: Path = DOCUMENTOS_PATH,
+    procesos: Optional[int] = None,
+) -> List[Resultado]:
+    """Ejecuta todas las configuraciones leyendo, fragmentando y embebiendo cada estrategia una sola vez."""
+    codigos = {codigo for pregunta in preguntas for codigo, _ in pregunta.esperados}
+    rutas = [ruta for ruta in sorted(Path(ruta_documentos).glob("**/*.pdf")) if ruta.stem in codigos]
+    faltantes = codigos - {ruta.stem for ruta in rutas}
+    if faltantes:
+        logger.warning(f"Códigos del dataset sin PDF en {ruta_documentos}: {sorted(faltantes)}")
+    if not rutas:
+        raise FileNotFoundError(f"No hay PDFs de los códigos del dataset en {ruta_documentos}")
+    paginas = {ruta.stem: docs for ruta, docs in extraer_paginas(rutas, procesos=procesos).items()}
+    contar = contador_tokens()
+    firmas = firmas_articulos(paginas, preguntas) if any(c.estrategia != "articulos" for c in configuraciones) else {}
+
+    resultados = []
+    corpus: Dict[str, List[Document]] = {}
+    backends: Dict[tuple, object] = {}
+    # Top-k por pregunta de cada configuración, para comparar las cuantizadas con float32
+    tops: Dict[str, List[List[str]]] = {}
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as directorio:
+        for configuracion in configuraciones:
+            if configuracion.estrategia not in corpus:
+                documentos = fragmentar_corpus(configuracion.estrategia, paginas)
+                log_info(f"Estrategia {configuracion.estrategia}: {len(documentos)} fragmentos")
+                embeber(documentos, embedder)
+                corpus[configuracion.estrategia] = documentos
+            clave = (configuracion.backend, configuracion.estrategia, configuracion.indice, configuracion.cuantizacion)
+            if clave not in backends:
+                backends[clave] = construir_backend(configuracion, corpus[configuracion.estrategia], embedder, Path(directorio))
+            ids = tops.setdefault(configuracion.nombre, [])
+            referencia = tops.get(configuracion.nombre_float32) if configuracion.cuantizacion != "float32" else None
+            resultado = evaluar(
+                configuracion, preguntas, backends[clave], len(corpus[configuracion.estrategia]), firmas, contar, referencia, ids
+            )
+            resultados.append(resultado)
+            log_info(f"{resultado.configuracion}: recall={resultado.recall} mrr={resultado.mrr} p95={resultado.p95_ms}ms")
+    return resultados
+
+
+def comparar(resultados: Sequence[Resultado], referencia: Dict[str, Dict], tolerancia: float, factor_latencia: float) -> List[str]:
+    """Regresiones frente a una ejecución guardada: caída de recall/MRR o latencia p95 mayor."""
+    regresiones = []
+    for resultado in resultados:
+        base = referencia.get(resultado.configuracion)
+        if base is None:
+            continue
+        for metrica in ("recall", "acierto", "mrr"):
+            if getattr(resultado, metrica) < base[metrica] - tolerancia:
+                regresiones.append(f"{resultado.configuracion}: {metrica} {base[metrica]} -> {getattr(resultado, metrica)}")
+        if base["p95_ms"] > 0 and resultado.p95_ms > base["p95_ms"] * factor_latencia:
+            regresiones.append(f"{resultado.configuracion}: p95 {base['p95_ms']}ms -> {resultado.p95_ms}ms")
+    return regresiones
+
+
+def imprimir(resultados: Sequence[Resultado]) -> None:
+    print(
+        f"{'configuración':<48} {'recall':>7} {'acierto':>8} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'tokens':>8} {'índice MB':>10} {'vec/f32':>7}"
+    )
+    for r in resultados:
+        tamano = f"{r.bytes_indice / 1024 / 1024:>10.2f}" if r.bytes_indice is not None else f"{'-':>10}"
+        solapamiento = f"{r.solapamiento:>7.3f}" if r.solapamiento is not None else f"{'-':>7}"
+        print(
+            f"{r.configuracion:<48} {r.recall:>7.3f} {r.acierto:>8.3f} {r.mrr:>6.3f} "
+            f"{r.p50_ms:>8.2f} {r.p95_ms:>8.2f} {r.p99_ms:>8.2f} {r.tokens_por_consulta:>8.0f} {tamano} {solapamiento}"
+        )
+
+
+def _lista(valor: str) -> List[str]:
+    return [v.strip() for v in valor.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de recuperación de la base de conocimiento legal")
+    parser.add_argument("--preguntas", type=Path, default=PREGUNTAS_PATH, help="Dataset pregunta -> artículos esperados")
+    parser.add_argument("--documentos", type=Path, default=DOCUMENTOS_PATH, help="Carpeta con los PDFs")
+    parser.add_argument("--estrategias", default="articulos", help="articulos,fijo")
+    parser.add_argument("--busquedas", default="hibrida", help="hibrida,vector")
+    parser.add_argument("--k", default="5", help="num_documents a evaluar, p. ej. 3,5,10")
+    parser.add_argument("--backend", choices=["local", "pgvector"], default="local")
+    parser.add_argument("--indices", default="", help="Con pgvector: hnsw,ivfflat,ninguno")
+    parser.add_argument(
+        "--cuantizaciones", default="float32", help="float32,float16,int8,binario,reducido (int8 solo en local)"
+    )
+    parser.add_argument("--embedder", choices=["falso", "openai"], default="falso")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--guardar", type=Path, default=None, help="Guarda los resultados como referencia")
+    parser.add_argument("--comparar", type=Path, default=None, help="Compara con una referencia guardada")
+    parser.add_argument("--tolerancia", type=float, default=0.02, help="Caída máxima admitida de recall/MRR")
+    parser.add_argument("--factor-latencia", type=float, default=2.0, help="Aumento máximo admitido de p95")
+    parser.add_argument("--json", action="store_true", help="Imprime los resultados en JSON")
+    args = parser.parse_args()
+
+    if args.embedder == "openai":
+        from configuracion import crear_embedder_consultas
+
+        embedder = crear_embedder_consultas()
+    else:
+        embedder = EmbedderFalso()
+
+    indices = _lista(args.indices) or [None]
+    # float32 primero, como referencia del solapamiento de las configuraciones cuantizadas
+    cuantizaciones = sorted(_lista(args.cuantizaciones), key=lambda c: c != "float32")
+    configuraciones = [
+        Configuracion(
+            estrategia=e, busqueda=b, k=int(k), backend=args.backend, indice=i if args.backend == "pgvector" else None, cuantizacion=c
+        )
+        for e in _lista(args.estrategias)
+        for i in (indices if args.backend == "pgvector" else [None])
+        for c in cuantizaciones
+        for b in _lista(args.busquedas)
+        for k in _lista(args.k)
+    ]
+    resultados = ejecutar(configuraciones, cargar_preguntas(args.preguntas), embedder, args.documentos, procesos=args.procesos)
+
+    if args.json:
+        print(json.dumps([asdict(r) for r in resultados], ensure_ascii=False, indent=2))
+    else:
+        imprimir(resultados)
+
+    if args.guardar:
+        args.guardar.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump({r.configuracion: asdict(r) for r in resultados}, f, ensure_ascii=False, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia, args.factor_latencia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}")
+        sys.exit(1 if regresiones else 0)
@@ -0,0 +1,443 @@
+"""Caché compartida de búsquedas web (Tavily) para `agente_buscador` y `agente_busqueda_profunda`.
+
+Cada agente tenía su propio `TavilyTools` y llamaba a la API en cada delegación, aunque varios
+usuarios preguntaran a la vez por la misma reforma. `TavilyCacheado` mantiene la misma
+herramienta (`web_search_using_tavily`) y el mismo formato de salida, pero las búsquedas pasan
+por una `CacheBusquedas` común:
+
+- la clave es la consulta normalizada más los parámetros que cambian el resultado (dominios
+  incluidos/excluidos, profundidad, número de resultados, respuesta resumida),
+- cada entrada caduca según su TTL: corto para consultas sobre novedades ("reforma", "último",
+  "2025"...) y largo para el resto, porque la legislación vigente cambia poco,
+- las búsquedas idénticas en curso se agrupan (single-flight): la segunda espera al resultado de
+  la primera en lugar de repetir la llamada. Entre hilos (`buscar`) con un `threading.Event`; en
+  el event loop del Playground (`abuscar`, que es la que usan las ejecuciones `arun`) con una
+  tarea por clave, y la llamada a Tavily se hace en un hilo para no bloquear el loop,
+- los resultados se guardan en un LRU en memoria y en un almacén local (SQLite por defecto) que
+  sobrevive a los reinicios.
+
+`BackendSimulado` reemplaza a Tavily en pruebas sin red.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Literal, Optional, Sequence, Tuple
+
+from agno.tools import Function, Toolkit
+from agno.tools.tavily import TavilyTools
+from agno.utils.log import log_debug, logger
+
+from cache_embeddings import normalizar_consulta
+from trazas import span
+
+# Términos que indican que la consulta busca novedades y no legislación consolidada
+TERMINOS_RECIENTES = re.compile(
+    r"\b(reforma[s]?|reformad[ao]s?|nuev[ao]s?|últim[ao]s?|ultim[ao]s?|reciente[s]?|actual(?:es|izad[ao]s?)?|"
+    r"hoy|noticia[s]?|anuncio[s]?|proyecto[s]? de ley|registro oficial|20\d\d)\b"
+)
+
+
+@dataclass
+class _Entrada:
+    respuesta: Dict[str, Any]
+    expira: float
+
+
+@dataclass
+class _Vuelo:
+    """Búsqueda en curso que comparten las peticiones idénticas."""
+
+    listo: threading.Event = field(default_factory=threading.Event)
+    respuesta: Optional[Dict[str, Any]] = None
+    error: Optional[BaseException] = None
+
+
+class BackendTavily:
+    """Llamada real a la API de Tavily."""
+
+    def __init__(self, api_key: Optional[str] = None):
+        from tavily import TavilyClient
+
+        self.cliente = TavilyClient(api_key=api_key)
+
+    def buscar(self, consulta: str, **parametros) -> Dict[str, Any]:
+        return self.cliente.search(query=consulta, **parametros)
+
+
+class BackendSimulado:
+    """Backend sin red para pruebas: respuestas fijas por consulta o resultados sintéticos."""
+
+    def __init__(self, respuestas: Optional[Dict[str, Dict[str, Any]]] = None, latencia: float = 0.0):
+        self.respuestas = {normalizar_consulta(k): v for k, v in (respuestas or {}).items()}
+        self.latencia = latencia
+        self.llamadas: List[Tuple[str, Dict[str, Any]]] = []
+        self._lock = threading.Lock()
+
+    def buscar(self, consulta: str, **parametros) -> Dict[str, Any]:
+        with self._lock:
+            self.llamadas.append((consulta, parametros))
+        if self.latencia:
+            time.sleep(self.latencia)
+        respuesta = self.respuestas.get(normalizar_consulta(consulta))
+        if respuesta is not None:
+            return respuesta
+        dominio = (parametros.get("include_domains") or ["www.gob.ec"])[0].lstrip(".")
+        return {
+            "query": consulta,
+            "answer": f"Resultado simulado para: {consulta}",
+            "results": [
+                {
+                    "title": f"{consulta} ({i + 1})",
+                    "url": f"https://{dominio}/simulado/{i + 1}",
+                    "content": f"Contenido simulado {i + 1} sobre {consulta}.",
+                    "score": round(1.0 - i * 0.1, 2),
+                }
+                for i in range(parametros.get("max_results", 5))
+            ],
+        }
+
+
+class _AlmacenBusquedas:
+    """Tabla `clave -> respuesta JSON` con fecha de caducidad, en SQLite o Postgres."""
+
+    def __init__(self, db_url: str, tabla: str):
+        from sqlalchemy import Column, Float, MetaData, String, Table, Text, create_engine
+
+        if db_url.startswith("sqlite:///"):
+            Path(db_url[len("sqlite:///") :]).parent.mkdir(parents=True, exist_ok=True)
+        self.engine = create_engine(db_url, pool_pre_ping=True)
+        self.dialecto = self.engine.dialect.name
+        self.tabla = Table(
+            tabla,
+            MetaData(),
+            Column("clave", String, primary_key=True),
+            Column("consulta", Text),
+            Column("respuesta", Text),
+            Column("creado", Float),
+            Column("expira", Float, index=True),
+        )
+        with self.engine.begin() as conexion:
+            self.tabla.create(conexion, checkfirst=True)
+
+    def leer(self, clave: str, ahora: float) -> Optional[_Entrada]:
+        from sqlalchemy import select
+
+        with self.engine.connect() as conexion:
+            fila = conexion.execute(
+                select(self.tabla.c.respuesta, self.tabla.c.expira).where(self.tabla.c.clave == clave, self.tabla.c.expira > ahora)
+            ).first()
+        return _Entrada(json.loads(fila[0]), fila[1]) if fila else None
+
+    def escribir(self, clave: str, consulta: str, respuesta: Dict[str, Any], expira: float) -> None:
+        if self.dialecto == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif self.dialecto == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise ValueError(f"Dialecto no soportado para la caché de búsquedas: {self.dialecto}")
+        valores = {"consulta": consulta, "respuesta": json.dumps(respuesta, ensure_ascii=False), "creado": time.time(), "expira": expira}
+        stmt = insert(self.tabla).values(clave=clave, **valores)
+        with self.engine.begin() as conexion:
+            conexion.execute(stmt.on_conflict_do_update(index_elements=["clave"], set_=valores))
+
+    def purgar(self, ahora: float) -> int:
+        with self.engine.begin() as conexion:
+            return conexion.execute(self.tabla.delete().where(self.tabla.c.expira <= ahora)).rowcount
+
+
+class CacheBusquedas:
+    """Caché de resultados de búsqueda web con TTL, agrupación de búsquedas en curso y persistencia."""
+
+    def __init__(
+        self,
+        backend: Any = None,
+        db_url: Optional[str] = None,
+        tabla: str = "cache_busquedas_web",
+        ttl_segundos: float = 12 * 3600,
+        ttl_recientes_segundos: float = 3600,
+        max_entradas: int = 2000,
+        reloj: Callable[[], float] = time.time,
+    ):
+        self.backend = backend if backend is not None else BackendTavily()
+        self.ttl_segundos = ttl_segundos
+        self.ttl_recientes_segundos = ttl_recientes_segundos
+        self.max_entradas = max_entradas
+        self.reloj = reloj
+        self._lru: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._vuelos: Dict[str, _Vuelo] = {}
+        # Búsquedas en curso de `abuscar`, por event loop (una tarea solo se puede esperar en su loop)
+        self._vuelos_async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Task]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+        self._contadores = {"aciertos_memoria": 0, "aciertos_persistente": 0, "agrupadas": 0, "fallos": 0, "errores": 0}
+        self._almacen: Optional[_AlmacenBusquedas] = None
+        if db_url:
+            try:
+                self._almacen = _AlmacenBusquedas(db_url, tabla)
+                self._almacen.purgar(self.reloj())
+            except Exception as e:
+                logger.warning(f"Almacén persistente de búsquedas web no disponible: {e}")
+
+    @staticmethod
+    def clave(consulta: str, parametros: Dict[str, Any]) -> str:
+        normalizados = {k: sorted(v) if isinstance(v, (list, tuple, set)) else v for k, v in parametros.items() if v is not None}
+        base = f"{normalizar_consulta(consulta)}|{json.dumps(normalizados, sort_keys=True)}"
+        return hashlib.sha256(base.encode()).hexdigest()
+
+    def ttl(self, consulta: str, parametros: Dict[str, Any]) -> float:
+        if parametros.get("topic") == "news" or TERMINOS_RECIENTES.search(normalizar_consulta(consulta)):
+            return self.ttl_recientes_segundos
+        return self.ttl_segundos
+
+    def _guardar_en_memoria(self, clave: str, entrada: _Entrada) -> None:
+        with self._lock:
+            self._lru[clave] = entrada
+            self._lru.move_to_end(clave)
+            while len(self._lru) > self.max_entradas:
+                self._lru.popitem(last=False)
+
+    def _buscar_en_memoria(self, clave: str) -> Optional[Dict[str, Any]]:
+        ahora = self.reloj()
+        with self._lock:
+            entrada = self._lru.get(clave)
+            if entrada is not None:
+                if entrada.expira > ahora:
+                    self._lru.move_to_end(clave)
+                    self._contadores["aciertos_memoria"] += 1
+                    return entrada.respuesta
+                del self._lru[clave]
+        return None
+
+    def _buscar_guardada(self, clave: str) -> Optional[Dict[str, Any]]:
+        respuesta = self._buscar_en_memoria(clave)
+        if respuesta is not None:
+            return respuesta
+        ahora = self.reloj()
+        if self._almacen is not None:
+            try:
+                entrada = self._almacen.leer(clave, ahora)
+            except Exception as e:
+                logger.warning(f"Error leyendo la caché persistente de búsquedas web: {e}")
+                entrada = None
+            if entrada is not None:
+                self._guardar_en_memoria(clave, entrada)
+                with self._lock:
+                    self._contadores["aciertos_persistente"] += 1
+                return entrada.respuesta
+        return None
+
+    def buscar(self, consulta: str, **parametros) -> Dict[str, Any]:
+        clave = self.clave(consulta, parametros)
+        respuesta = self._buscar_guardada(clave)
+        if respuesta is not None:
+            log_debug(f"Búsqueda web servida desde caché: {consulta}")
+            return respuesta
+
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            propio = vuelo is None
+            if propio:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self._contadores["fallos"] += 1
+            else:
+                self._contadores["agrupadas"] += 1
+
+        if not propio:
+            # Otra petición ya está haciendo la misma búsqueda
+            vuelo.listo.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.respuesta
+
+        try:
+            with span("busqueda.web", backend=type(self.backend).__name__):
+                respuesta = self.backend.buscar(consulta, **parametros)
+            expira = self.reloj() + self.ttl(consulta, parametros)
+            self._guardar_en_memoria(clave, _Entrada(respuesta, expira))
+            if self._almacen is not None:
+                try:
+                    self._almacen.escribir(clave, consulta, respuesta, expira)
+                except Exception as e:
+                    logger.warning(f"Error escribiendo la caché persistente de búsquedas web: {e}")
+            vuelo.respuesta = respuesta
+            return respuesta
+        except BaseException as e:
+            with self._lock:
+                self._contadores["errores"] += 1
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                self._vuelos.pop(clave, None)
+            vuelo.listo.set()
+
+    async def abuscar(self, consulta: str, **parametros) -> Dict[str, Any]:
+        """`buscar` para el event loop: las peticiones idénticas del mismo loop comparten una tarea.
+
+        La tarea ejecuta `buscar` en un hilo (almacén persistente y llamada a Tavily), así que el
+        loop sigue atendiendo otras peticiones y los timeouts de los miembros. Cancelar una
+        petición no cancela la búsqueda que esperan las demás.
+        """
+        clave = self.clave(consulta, parametros)
+        respuesta = self._buscar_en_memoria(clave)
+        if respuesta is not None:
+            log_debug(f"Búsqueda web servida desde caché: {consulta}")
+            return respuesta
+
+        vuelos = self._vuelos_async.setdefault(asyncio.get_running_loop(), {})
+        tarea = vuelos.get(clave)
+        if tarea is None:
+            tarea = vuelos[clave] = asyncio.ensure_future(asyncio.to_thread(self.buscar, consulta, **parametros))
+            tarea.add_done_callback(lambda t: self._terminar_vuelo_async(vuelos, clave, t))
+        else:
+            with self._lock:
+                self._contadores["agrupadas"] += 1
+        return await asyncio.shield(tarea)
+
+    @staticmethod
+    def _terminar_vuelo_async(vuelos: Dict[str, "asyncio.Task"], clave: str, tarea: "asyncio.Task") -> None:
+        if vuelos.get(clave) is tarea:
+            del vuelos[clave]
+        if not tarea.cancelled():
+            # Marca el error como recuperado aunque todas las peticiones se hayan cancelado
+            tarea.exception()
+
+    def estadisticas(self) -> Dict[str, float]:
+        """Contadores de aciertos, búsquedas agrupadas y llamadas al backend."""
+        with self._lock:
+            contadores = dict(self._contadores)
+            entradas = len(self._lru)
+        servidas = contadores["aciertos_memoria"] + contadores["aciertos_persistente"] + contadores["agrupadas"]
+        total = servidas + contadores["fallos"]
+        return {**contadores, "tasa_ahorro": round(servidas / total, 4) if total else 0.0, "entradas_memoria": entradas}
+
+
+class _ClienteCacheado:
+    """Sustituto de `TavilyClient.search` que pasa por la caché y aplica los filtros de dominio."""
+
+    def __init__(self, cache: CacheBusquedas, include_domains: Optional[Sequence[str]], exclude_domains: Optional[Sequence[str]]):
+        self.cache = cache
+        self.include_domains = list(include_domains) if include_domains else None
+        self.exclude_domains = list(exclude_domains) if exclude_domains else None
+
+    def _con_dominios(self, parametros: Dict[str, Any]) -> Dict[str, Any]:
+        if self.include_domains and not parametros.get("include_domains"):
+            parametros["include_domains"] = self.include_domains
+        if self.exclude_domains and not parametros.get("exclude_domains"):
+            parametros["exclude_domains"] = self.exclude_domains
+        return parametros
+
+    def search(self, query: str, **parametros) -> Dict[str, Any]:
+        return self.cache.buscar(query, **self._con_dominios(parametros))
+
+    async def asearch(self, query: str, **parametros) -> Dict[str, Any]:
+        return await self.cache.abuscar(query, **self._con_dominios(parametros))
+
+
+class _ClienteFijo:
+    """Cliente que devuelve una respuesta ya obtenida, para reutilizar el formato de `TavilyTools`."""
+
+    def __init__(self, respuesta: Dict[str, Any]):
+        self.respuesta = respuesta
+
+    def search(self, query: str, **parametros) -> Dict[str, Any]:
+        return self.respuesta
+
+
+class TavilyCacheado(TavilyTools):
+    """`TavilyTools` con la búsqueda servida por una `CacheBusquedas` compartida.
+
+    Con `asincrono` (por defecto, el Playground ejecuta los equipos con `arun`) la herramienta se
+    registra como corrutina: agno la espera en el loop y la búsqueda va por `CacheBusquedas.abuscar`.
+    Las ejecuciones síncronas (`run`, `print_response`) necesitan `asincrono=False`.
+    """
+
+    def __init__(
+        self,
+        cache: CacheBusquedas,
+        include_domains: Optional[Sequence[str]] = None,
+        exclude_domains: Optional[Sequence[str]] = None,
+        max_tokens: int = 6000,
+        include_answer: bool = True,
+        search_depth: Literal["basic", "advanced"] = "advanced",
+        format: Literal["json", "markdown"] = "markdown",
+        asincrono: bool = True,
+    ):
+        # No se llama a TavilyTools.__init__: crearía su propio TavilyClient (y exige la API key
+        # aunque el backend sea el simulado)
+        Toolkit.__init__(self, name="tavily_tools")
+        self.cache = cache
+        self.client = _ClienteCacheado(cache, include_domains, exclude_domains)
+        self.search_depth = search_depth
+        self.max_tokens = max_tokens
+        self.include_answer = include_answer
+        self.format = format
+        if asincrono:
+            # Mismo nombre para el modelo; Toolkit.register tomaría el de la corrutina
+            self.functions["web_search_using_tavily"] = Function(
+                name="web_search_using_tavily", entrypoint=self.aweb_search_using_tavily, sanitize_arguments=True
+            )
+        else:
+            self.register(self.web_search_using_tavily)
+
+    async def aweb_search_using_tavily(self, query: str, max_results: int = 5) -> str:
+        """Use this function to search the web for a given query.
+        This function uses the Tavily API to provide realtime online information about the query.
+
+        Args:
+            query (str): Query to search for.
+            max_results (int): Maximum number of results to return. Defaults to 5.
+
+        Returns:
+            str: JSON string of results related to the query.
+        """
+        respuesta = await self.client.asearch(
+            query=query, search_depth=self.search_depth, include_answer=self.include_answer, max_results=max_results
+        )
+        # Mismo formato que la versión síncrona, con la respuesta ya obtenida
+        vista = SimpleNamespace(
+            client=_ClienteFijo(respuesta),
+            search_depth=self.search_depth,
+            include_answer=self.include_answer,
+            max_tokens=self.max_tokens,
+            format=self.format,
+        )
+        return TavilyTools.web_search_using_tavily(vista, query, max_results=max_results)
+
+
+_cache_global: Optional[CacheBusquedas] = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache_busquedas() -> CacheBusquedas:
+    """Caché de búsquedas del proceso, compartida por todos los agentes que buscan en la web."""
+    global _cache_global
+    with _cache_lock:
+        if _cache_global is None:
+            from configuracion import (
+                BUSQUEDA_WEB_BACKEND,
+                BUSQUEDA_WEB_CACHE_MAX_ENTRADAS,
+                BUSQUEDA_WEB_CACHE_URL,
+                BUSQUEDA_WEB_TTL_HORAS,
+                BUSQUEDA_WEB_TTL_RECIENTES_HORAS,
+            )
+
+            backend = BackendSimulado() if BUSQUEDA_WEB_BACKEND == "simulado" else BackendTavily()
+            _cache_global = CacheBusquedas(
+                backend=backend,
+                db_url=BUSQUEDA_WEB_CACHE_URL or None,
+                ttl_segundos=BUSQUEDA_WEB_TTL_HORAS * 3600,
+                ttl_recientes_segundos=BUSQUEDA_WEB_TTL_RECIENTES_HORAS * 3600,
+                max_entradas=BUSQUEDA_WEB_CACHE_MAX_ENTRADAS,
+            )
+        return _cache_global
@@ -0,0 +1,190 @@
+"""Caché de embeddings de consultas para la búsqueda en la base de conocimiento.
+
+`EmbedderCacheado` envuelve al embedder de OpenAI que usa PgVector: normaliza el texto de la
+consulta, busca primero en un LRU en memoria acotado por bytes y después en una tabla de
+Postgres (o SQLite) compartida entre workers y persistente entre reinicios. Solo si ambos
+fallan se llama a la API.
+"""
+
+import hashlib
+import re
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from agno.embedder.base import Embedder
+from agno.utils.log import log_debug, logger
+
+from trazas import span
+
+
+def normalizar_consulta(texto: str) -> str:
+    """Normaliza una consulta para que variantes triviales compartan la misma entrada de caché."""
+    texto = unicodedata.normalize("NFKC", texto).lower().strip()
+    texto = re.sub(r"\s+", " ", texto)
+    # Signos de apertura/cierre y puntuación final no cambian el sentido de la pregunta
+    return texto.strip("¿?¡!.,;: ")
+
+
+class _AlmacenPersistente:
+    """Tabla `clave -> embedding` en Postgres o SQLite."""
+
+    def __init__(self, db_url: str, tabla: str, esquema: Optional[str], engine: Any = None):
+        from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, String, Table, create_engine, func, text
+
+        self.engine = engine if engine is not None else create_engine(db_url, pool_pre_ping=True)
+        self.dialecto = self.engine.dialect.name
+        if self.dialecto == "sqlite":
+            esquema = None
+        self.tabla = Table(
+            tabla,
+            MetaData(schema=esquema),
+            Column("clave", String, primary_key=True),
+            Column("modelo", String),
+            Column("dimensiones", Integer),
+            Column("embedding", LargeBinary),
+            Column("creado", DateTime(timezone=True), server_default=func.now()),
+        )
+        with self.engine.begin() as conexion:
+            if esquema is not None:
+                conexion.execute(text(f"CREATE SCHEMA IF NOT EXISTS {esquema}"))
+            self.tabla.create(conexion, checkfirst=True)
+
+    def leer(self, clave: str) -> Optional[bytes]:
+        from sqlalchemy import select
+
+        with self.engine.connect() as conexion:
+            fila = conexion.execute(select(self.tabla.c.embedding).where(self.tabla.c.clave == clave)).first()
+        return fila[0] if fila else None
+
+    def escribir(self, clave: str, modelo: str, dimensiones: int, datos: bytes) -> None:
+        if self.dialecto == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif self.dialecto == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise ValueError(f"Dialecto no soportado para la caché de embeddings: {self.dialecto}")
+        stmt = insert(self.tabla).values(clave=clave, modelo=modelo, dimensiones=dimensiones, embedding=datos)
+        with self.engine.begin() as conexion:
+            conexion.execute(stmt.on_conflict_do_nothing(index_elements=["clave"]))
+
+
+@dataclass
+class EmbedderCacheado(Embedder):
+    """Embedder con caché LRU en memoria y respaldo persistente."""
+
+    embedder: Optional[Embedder] = None
+    # Memoria máxima del LRU (un vector de 1536 float32 ocupa ~6 KB)
+    max_bytes: int = 64 * 1024 * 1024
+    # URL SQLAlchemy de la caché persistente (Postgres o SQLite); None la desactiva
+    db_url: Optional[str] = None
+    # Engine ya creado (p. ej. el pool compartido del proceso); si falta se crea uno para `db_url`
+    db_engine: Optional[Any] = None
+    tabla: str = "cache_embeddings"
+    esquema: Optional[str] = "ai"
+
+    _lru: "OrderedDict[str, array]" = field(default_factory=OrderedDict, init=False, repr=False)
+    _bytes: int = field(default=0, init=False, repr=False)
+    _lock: Any = field(default_factory=threading.Lock, init=False, repr=False)
+    _almacen: Optional[_AlmacenPersistente] = field(default=None, init=False, repr=False)
+    _contadores: Dict[str, int] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.embedder is None:
+            from agno.embedder.openai import OpenAIEmbedder
+
+            self.embedder = OpenAIEmbedder()
+        self.dimensions = self.embedder.dimensions
+        self._contadores = {"aciertos_memoria": 0, "aciertos_persistente": 0, "fallos": 0, "errores_persistente": 0}
+        if self.db_url:
+            try:
+                self._almacen = _AlmacenPersistente(self.db_url, self.tabla, self.esquema, self.db_engine)
+            except Exception as e:
+                logger.warning(f"Caché persistente de embeddings no disponible: {e}")
+
+    @property
+    def id(self) -> str:
+        return getattr(self.embedder, "id", self.embedder.__class__.__name__)
+
+    def clave(self, texto: str) -> str:
+        base = f"{self.id}|{self.dimensions}|{normalizar_consulta(texto)}"
+        return hashlib.sha256(base.encode()).hexdigest()
+
+    def _contar(self, contador: str) -> None:
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def _guardar_en_memoria(self, clave: str, vector: array) -> None:
+        tamano = vector.itemsize * len(vector)
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._lru.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= anterior.itemsize * len(anterior)
+            self._lru[clave] = vector
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                _, expulsado = self._lru.popitem(last=False)
+                self._bytes -= expulsado.itemsize * len(expulsado)
+
+    def _buscar(self, clave: str) -> Optional[array]:
+        with self._lock:
+            vector = self._lru.get(clave)
+            if vector is not None:
+                self._lru.move_to_end(clave)
+                self._contadores["aciertos_memoria"] += 1
+                return vector
+        if self._almacen is not None:
+            try:
+                datos = self._almacen.leer(clave)
+            except Exception as e:
+                self._contar("errores_persistente")
+                logger.warning(f"Error leyendo la caché persistente de embeddings: {e}")
+                datos = None
+            if datos is not None:
+                vector = array("f")
+                vector.frombytes(datos)
+                self._guardar_en_memoria(clave, vector)
+                self._contar("aciertos_persistente")
+                return vector
+        return None
+
+    def get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        clave = self.clave(text)
+        vector = self._buscar(clave)
+        if vector is not None:
+            log_debug("Embedding de la consulta servido desde caché")
+            return vector.tolist(), None
+
+        self._contar("fallos")
+        with span("embedding", modelo=self.id):
+            embedding, usage = self.embedder.get_embedding_and_usage(text)
+        if embedding:
+            vector = array("f", embedding)
+            self._guardar_en_memoria(clave, vector)
+            if self._almacen is not None:
+                try:
+                    self._almacen.escribir(clave, self.id, len(vector), vector.tobytes())
+                except Exception as e:
+                    self._contar("errores_persistente")
+                    logger.warning(f"Error escribiendo la caché persistente de embeddings: {e}")
+        return embedding, usage
+
+    def get_embedding(self, text: str) -> List[float]:
+        return self.get_embedding_and_usage(text)[0]
+
+    def estadisticas(self) -> Dict[str, float]:
+        """Contadores de aciertos y ocupación de la caché."""
+        contadores = dict(self._contadores)
+        aciertos = contadores["aciertos_memoria"] + contadores["aciertos_persistente"]
+        total = aciertos + contadores["fallos"]
+        return {
+            **contadores,
+            "tasa_aciertos": round(aciertos / total, 4) if total else 0.0,
+            "entradas_memoria": len(self._lru),
+            "bytes_memoria": self._bytes,
+        }
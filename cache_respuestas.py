@@ -0,0 +1,335 @@
+"""Caché semántica de respuestas para el endpoint de ejecución del Playground.
+
+Las preguntas de primer turno (sin `session_id`) casi idénticas entre usuarios ("¿cómo calculo
+mi liquidación?") se responden con la respuesta ya generada por el equipo, sin volver a
+ejecutar Claude ni los agentes o3-mini. Una entrada se reutiliza solo si coinciden:
+
+- la similitud coseno del embedding de la pregunta (>= `umbral`),
+- la versión del corpus (`version_corpus` del manifiesto de ingesta: re-ingestar invalida todo),
+- la huella de configuración del agente o equipo (modelos, instrucciones, herramientas, miembros),
+- el modo de respuesta (streaming o no),
+- y solo durante `ttl_segundos` desde que se generó (la búsqueda web envejece antes que el corpus).
+
+Para vaciarla a mano en todos los workers (p. ej. tras corregir las instrucciones o detectar una
+respuesta errónea) se ejecuta `python cache_respuestas.py --invalidar`: modifica el archivo de
+aviso `CACHE_RESPUESTAS_INVALIDACION_PATH` y cada worker lo comprueba en la siguiente petición.
+
+Al servir una entrada se copia la sesión original con un `session_id` nuevo, de modo que el
+usuario puede continuar la conversación con el historial completo.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from agno.utils.log import log_debug, log_info, logger
+from starlette.concurrency import run_in_threadpool
+
+from configuracion import CACHE_RESPUESTAS_INVALIDACION_PATH, MANIFIESTO_PATH
+from playground_runs import InterceptorRuns, SolicitudRun, enviar_cuerpos
+
+
+@dataclass
+class EntradaCache:
+    consulta: str
+    embedding: np.ndarray
+    cuerpos: List[bytes]
+    media_type: str
+    session_id: Optional[str]
+    run_id: Optional[str]
+    sesion: Optional[Dict[str, Any]]
+    creado: float = field(default_factory=time.time)
+    aciertos: int = 0
+
+
+def huella_configuracion(entidad: Any) -> str:
+    """Hash de todo lo que cambia las respuestas de un agente o equipo."""
+
+    def describir(e: Any) -> Dict[str, Any]:
+        herramientas = []
+        for herramienta in getattr(e, "tools", None) or []:
+            herramientas.append(getattr(herramienta, "name", None) or getattr(herramienta, "__name__", str(herramienta)))
+        instrucciones = getattr(e, "instructions", None)
+        modelo = getattr(e, "model", None)
+        return {
+            "nombre": getattr(e, "name", None),
+            "modelo": getattr(modelo, "id", None),
+            "razonamiento": getattr(modelo, "reasoning_effort", None),
+            "descripcion": getattr(e, "description", None),
+            "instrucciones": None if callable(instrucciones) else instrucciones,
+            "herramientas": herramientas,
+            "conocimiento": getattr(getattr(e, "knowledge", None), "num_documents", None),
+            "miembros": [describir(m) for m in (getattr(e, "members", None) or getattr(e, "team", None) or [])],
+        }
+
+    datos = json.dumps(describir(entidad), sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(datos.encode()).hexdigest()[:16]
+
+
+class CacheRespuestas:
+    """Entradas en memoria con expiración por TTL y expulsión LRU."""
+
+    def __init__(
+        self,
+        embedder,
+        umbral: float = 0.95,
+        ttl_segundos: float = 24 * 3600,
+        max_entradas: int = 1000,
+        max_caracteres_consulta: int = 2000,
+        ruta_manifiesto: Path = MANIFIESTO_PATH,
+        ruta_invalidacion: Optional[Path] = CACHE_RESPUESTAS_INVALIDACION_PATH,
+    ):
+        self.embedder = embedder
+        self.umbral = umbral
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.max_caracteres_consulta = max_caracteres_consulta
+        self.ruta_manifiesto = Path(ruta_manifiesto)
+        self._entradas: "OrderedDict[str, Tuple[tuple, EntradaCache]]" = OrderedDict()
+        # Matriz de embeddings por partición, reconstruida cuando cambia la partición
+        self._matrices: Dict[tuple, Tuple[List[str], np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._mtime_manifiesto: Optional[float] = None
+        self.ruta_invalidacion = Path(ruta_invalidacion) if ruta_invalidacion is not None else None
+        # Los avisos anteriores al arranque no afectan a una caché que nace vacía
+        self._aviso_invalidacion = self._marca_invalidacion()
+        self.contadores = {"aciertos": 0, "fallos": 0, "guardadas": 0, "invalidaciones": 0}
+
+    # ---- versión del corpus ----
+
+    def version_corpus(self) -> Optional[str]:
+        """Versión del corpus según el manifiesto de ingesta; si cambia, se vacía la caché."""
+        try:
+            mtime = os.path.getmtime(self.ruta_manifiesto)
+        except OSError:
+            return self._version
+        if mtime != self._mtime_manifiesto:
+            try:
+                with open(self.ruta_manifiesto, encoding="utf-8") as f:
+                    version = json.load(f).get("version_corpus")
+            except (OSError, ValueError) as e:
+                logger.warning(f"No se pudo leer la versión del corpus: {e}")
+                return self._version
+            self._mtime_manifiesto = mtime
+            if self._version is not None and version != self._version:
+                log_info(f"Corpus re-ingestado ({self._version} -> {version}), se invalida la caché de respuestas")
+                self.invalidar()
+            self._version = version
+        return self._version
+
+    def _marca_invalidacion(self) -> Optional[int]:
+        if self.ruta_invalidacion is None:
+            return None
+        try:
+            return os.stat(self.ruta_invalidacion).st_mtime_ns
+        except OSError:
+            return None
+
+    def revisar_invalidacion(self) -> None:
+        """Vacía la caché si se modificó el archivo de aviso desde la última comprobación."""
+        marca = self._marca_invalidacion()
+        if marca is not None and marca != self._aviso_invalidacion:
+            self._aviso_invalidacion = marca
+            log_info("Invalidación solicitada, se vacía la caché de respuestas")
+            self.invalidar()
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._matrices.clear()
+            self.contadores["invalidaciones"] += 1
+
+    # ---- búsqueda y almacenamiento ----
+
+    def admite(self, solicitud: SolicitudRun) -> bool:
+        """Solo se cachean primeros turnos de texto."""
+        return (
+            solicitud.session_id is None
+            and not solicitud.tiene_archivos
+            and 0 < len(solicitud.message.strip()) <= self.max_caracteres_consulta
+        )
+
+    def particion(self, solicitud: SolicitudRun, entidad: Any) -> tuple:
+        self.revisar_invalidacion()
+        return (solicitud.tipo, solicitud.entidad_id, solicitud.stream, self.version_corpus(), huella_configuracion(entidad))
+
+    def embeber(self, consulta: str) -> np.ndarray:
+        vector = np.asarray(self.embedder.get_embedding(consulta), dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma else vector
+
+    def _matriz(self, particion: tuple) -> Tuple[List[str], np.ndarray]:
+        if particion not in self._matrices:
+            claves = [clave for clave, (p, _) in self._entradas.items() if p == particion]
+            matriz = np.stack([self._entradas[c][1].embedding for c in claves]) if claves else np.empty((0, 0), dtype=np.float32)
+            self._matrices[particion] = (claves, matriz)
+        return self._matrices[particion]
+
+    def _expirar(self, ahora: float) -> None:
+        vencidas = [clave for clave, (_, e) in self._entradas.items() if ahora - e.creado > self.ttl_segundos]
+        for clave in vencidas:
+            particion, _ = self._entradas.pop(clave)
+            self._matrices.pop(particion, None)
+
+    def buscar(self, particion: tuple, embedding: np.ndarray) -> Optional[EntradaCache]:
+        with self._lock:
+            self._expirar(time.time())
+            claves, matriz = self._matriz(particion)
+            if not claves:
+                self.contadores["fallos"] += 1
+                return None
+            similitudes = matriz @ embedding
+            mejor = int(np.argmax(similitudes))
+            if similitudes[mejor] < self.umbral:
+                self.contadores["fallos"] += 1
+                return None
+            clave = claves[mejor]
+            self._entradas.move_to_end(clave)
+            entrada = self._entradas[clave][1]
+            entrada.aciertos += 1
+            self.contadores["aciertos"] += 1
+            log_debug(f"Respuesta servida desde caché (similitud {similitudes[mejor]:.3f}): {entrada.consulta!r}")
+            return entrada
+
+    def guardar(self, particion: tuple, entrada: EntradaCache) -> None:
+        with self._lock:
+            self._expirar(time.time())
+            clave = uuid.uuid4().hex
+            self._entradas[clave] = (particion, entrada)
+            self._matrices.pop(particion, None)
+            while len(self._entradas) > self.max_entradas:
+                _, (particion_expulsada, _) = self._entradas.popitem(last=False)
+                self._matrices.pop(particion_expulsada, None)
+            self.contadores["guardadas"] += 1
+
+    def estadisticas(self) -> Dict[str, Any]:
+        total = self.contadores["aciertos"] + self.contadores["fallos"]
+        return {
+            **self.contadores,
+            "entradas": len(self._entradas),
+            "tasa_aciertos": round(self.contadores["aciertos"] / total, 4) if total else 0.0,
+            "version_corpus": self._version,
+        }
+
+
+def solicitar_invalidacion(ruta: Path = CACHE_RESPUESTAS_INVALIDACION_PATH) -> None:
+    """Pide a todos los workers que vacíen su caché de respuestas."""
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_text(str(time.time_ns()), encoding="utf-8")
+
+
+def _reemplazar_ids(cuerpos: List[bytes], reemplazos: Dict[str, str]) -> List[bytes]:
+    nuevos = []
+    for cuerpo in cuerpos:
+        for anterior, nuevo in reemplazos.items():
+            cuerpo = cuerpo.replace(anterior.encode(), nuevo.encode())
+        nuevos.append(cuerpo)
+    return nuevos
+
+
+class CacheRespuestasMiddleware(InterceptorRuns):
+    """Sirve respuestas cacheadas para primeras preguntas casi idénticas."""
+
+    def __init__(self, app, entidades: Dict[str, Any], cache: CacheRespuestas):
+        super().__init__(app)
+        self.entidades = entidades
+        self.cache = cache
+
+    async def interceptar(self, solicitud: SolicitudRun, scope, receive, send) -> None:
+        entidad = self.entidades.get(solicitud.entidad_id)
+        if entidad is None or not self.cache.admite(solicitud):
+            return await self.app(scope, receive, send)
+
+        try:
+            embedding = await run_in_threadpool(self.cache.embeber, solicitud.message)
+            particion = self.cache.particion(solicitud, entidad)
+            entrada = self.cache.buscar(particion, embedding)
+        except Exception as e:
+            logger.warning(f"Caché de respuestas no disponible: {e}")
+            return await self.app(scope, receive, send)
+
+        if entrada is not None:
+            reemplazos = {}
+            if entrada.session_id:
+                reemplazos[entrada.session_id] = str(uuid.uuid4())
+            if entrada.run_id:
+                reemplazos[entrada.run_id] = str(uuid.uuid4())
+            await run_in_threadpool(self._copiar_sesion, entidad, solicitud, entrada, reemplazos)
+            return await enviar_cuerpos(send, _reemplazar_ids(entrada.cuerpos, reemplazos), entrada.media_type)
+
+        capturada = await self.ejecutar_y_capturar(scope, receive, send)
+        if capturada.tiene_error() or not capturada.cuerpos:
+            return
+        ids = capturada.ids()
+        sesion = await run_in_threadpool(self._leer_sesion, entidad, ids["session_id"], solicitud.user_id)
+        self.cache.guardar(
+            particion,
+            EntradaCache(
+                consulta=solicitud.message,
+                embedding=embedding,
+                cuerpos=capturada.cuerpos,
+                media_type=capturada.media_type,
+                session_id=ids["session_id"],
+                run_id=ids["run_id"],
+                sesion=sesion,
+            ),
+        )
+
+    @staticmethod
+    def _leer_sesion(entidad: Any, session_id: Optional[str], user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        storage = getattr(entidad, "storage", None)
+        if storage is None or session_id is None:
+            return None
+        try:
+            sesion = storage.read(session_id, user_id)
+            return sesion.to_dict() if sesion is not None else None
+        except Exception as e:
+            logger.warning(f"No se pudo leer la sesión {session_id} para la caché: {e}")
+            return None
+
+    @staticmethod
+    def _copiar_sesion(entidad: Any, solicitud: SolicitudRun, entrada: EntradaCache, reemplazos: Dict[str, str]) -> None:
+        """Guarda una copia de la sesión original para que el usuario pueda continuar la conversación."""
+        storage = getattr(entidad, "storage", None)
+        if storage is None or entrada.sesion is None:
+            return
+        try:
+            datos = json.dumps(entrada.sesion, default=str)
+            for anterior, nuevo in reemplazos.items():
+                datos = datos.replace(anterior, nuevo)
+            sesion = json.loads(datos)
+            sesion["user_id"] = solicitud.user_id
+            sesion["created_at"] = sesion["updated_at"] = int(time.time())
+            if solicitud.tipo == "teams":
+                from agno.storage.session.team import TeamSession
+
+                storage.upsert(TeamSession.from_dict(sesion))
+            else:
+                from agno.storage.session.agent import AgentSession
+
+                storage.upsert(AgentSession.from_dict(sesion))
+        except Exception as e:
+            logger.warning(f"No se pudo copiar la sesión cacheada: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Caché semántica de respuestas del Playground")
+    parser.add_argument("--invalidar", action="store_true", help="Vacía la caché en todos los workers en su próxima petición")
+    parser.add_argument("--ruta", type=Path, default=CACHE_RESPUESTAS_INVALIDACION_PATH, help="Archivo de aviso")
+    args = parser.parse_args()
+    if args.invalidar:
+        solicitar_invalidacion(args.ruta)
+        log_info(f"Invalidación solicitada en {args.ruta}")
+    else:
+        parser.print_help()
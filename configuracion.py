@@ -0,0 +1,326 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+db_host = os.getenv("DB_HOST", "localhost")
+db_port = os.getenv("DB_PORT", "54322")
+db_user = os.getenv("DB_USER", "postgres")
+db_password = os.getenv("DB_PASSWORD", "postgres")
+db_name = os.getenv("DB_NAME", "postgres")
+
+# URL de la base de datos PostgreSQL
+db_url = f"postgresql+psycopg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+# Pool de conexiones por worker, compartido por la base vectorial, las sesiones y la caché de
+# embeddings. Conexiones máximas a Postgres = workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Servidor de producción (servidor.py)
+SERVIDOR_WORKERS = int(os.getenv("SERVIDOR_WORKERS", str(os.cpu_count() or 1)))
+DRENAJE_SEGUNDOS = float(os.getenv("DRENAJE_SEGUNDOS", "60"))
+DRENAJE_PREVIO_SEGUNDOS = float(os.getenv("DRENAJE_PREVIO_SEGUNDOS", "0"))
+
+# Carpeta con los PDFs de la legislación ecuatoriana
+DOCUMENTOS_PATH = Path(os.getenv("DOCUMENTOS_PATH", "/home/phiuser/phi/agente-legal/documentos"))
+
+# Tabla de PgVector donde vive la base de conocimiento
+TABLA_CONOCIMIENTO = "legislacion"
+ESQUEMA_CONOCIMIENTO = "ai"
+MODELO_EMBEDDINGS = "text-embedding-3-small"
+
+# Manifiesto de la ingesta incremental (hashes por archivo y por fragmento)
+MANIFIESTO_PATH = Path(os.getenv("MANIFIESTO_PATH", str(Path(__file__).parent / "datos" / "manifiesto_ingesta.json")))
+
+# Índice exacto (código, artículo) -> texto generado por la ingesta
+INDICE_ARTICULOS_PATH = Path(os.getenv("INDICE_ARTICULOS_PATH", str(Path(__file__).parent / "datos" / "indice_articulos.json.gz")))
+
+# Índice ANN de la tabla: "hnsw", "ivfflat" o "ninguno" (ver `python indices_vectoriales.py informe`)
+INDICE_VECTORIAL = os.getenv("INDICE_VECTORIAL", "hnsw").lower()
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+# 0 = listas según el número de filas (filas/1000, o su raíz cuadrada a partir de 1M)
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+# Candidatos que aporta cada índice (vectorial y texto) a la búsqueda híbrida
+ANN_CANDIDATOS = int(os.getenv("ANN_CANDIDATOS", "100"))
+
+# Vectores de la primera pasada de la búsqueda: "float32" (los completos), "float16", "int8" (solo
+# búsqueda local), "binario" o "reducido" (prefijo de EMBEDDINGS_DIMENSIONES_REDUCIDAS dimensiones).
+# Los `limit * EMBEDDINGS_FACTOR_RERANK` mejores candidatos se reordenan con los vectores completos
+EMBEDDINGS_CUANTIZACION = os.getenv("EMBEDDINGS_CUANTIZACION", "float32").lower()
+EMBEDDINGS_DIMENSIONES_REDUCIDAS = int(os.getenv("EMBEDDINGS_DIMENSIONES_REDUCIDAS", "256"))
+EMBEDDINGS_FACTOR_RERANK = int(os.getenv("EMBEDDINGS_FACTOR_RERANK", "10"))
+
+# Motor de búsqueda de los agentes: "pgvector" (consulta a Postgres) o "local" (instantánea en proceso)
+RECUPERACION_BACKEND = os.getenv("RECUPERACION_BACKEND", "pgvector").lower()
+RECUPERACION_LOCAL_PATH = Path(os.getenv("RECUPERACION_LOCAL_PATH", str(Path(__file__).parent / "datos" / "recuperacion_local")))
+
+# Caché persistente de embeddings de consultas (por defecto, la misma base de datos)
+CACHE_EMBEDDINGS_URL = os.getenv("CACHE_EMBEDDINGS_URL", db_url)
+CACHE_EMBEDDINGS_MAX_MB = int(os.getenv("CACHE_EMBEDDINGS_MAX_MB", "64"))
+
+# Caché semántica de respuestas del Playground (primeras preguntas casi idénticas)
+CACHE_RESPUESTAS_ACTIVA = os.getenv("CACHE_RESPUESTAS_ACTIVA", "true").lower() in ("true", "1", "yes")
+CACHE_RESPUESTAS_UMBRAL = float(os.getenv("CACHE_RESPUESTAS_UMBRAL", "0.95"))
+CACHE_RESPUESTAS_TTL_HORAS = float(os.getenv("CACHE_RESPUESTAS_TTL_HORAS", "24"))
+CACHE_RESPUESTAS_MAX_ENTRADAS = int(os.getenv("CACHE_RESPUESTAS_MAX_ENTRADAS", "1000"))
+# Archivo de aviso: al modificarlo (`python cache_respuestas.py --invalidar`) todos los workers vacían la caché
+CACHE_RESPUESTAS_INVALIDACION_PATH = Path(
+    os.getenv("CACHE_RESPUESTAS_INVALIDACION_PATH", str(Path(__file__).parent / "datos" / "cache_respuestas.invalidar"))
+)
+
+# Empaquetado del contexto recuperado para `agente_legal` (contexto_legal.py)
+CONTEXTO_EMPAQUETADO = os.getenv("CONTEXTO_EMPAQUETADO", "true").lower() in ("true", "1", "yes")
+# Presupuesto = CONTEXTO_TOKENS_POR_DOCUMENTO * num_documents; CONTEXTO_PRESUPUESTO_TOKENS lo fija
+CONTEXTO_TOKENS_POR_DOCUMENTO = int(os.getenv("CONTEXTO_TOKENS_POR_DOCUMENTO", "800"))
+CONTEXTO_PRESUPUESTO_TOKENS = int(os.getenv("CONTEXTO_PRESUPUESTO_TOKENS") or 0) or None
+CONTEXTO_CANDIDATOS = int(os.getenv("CONTEXTO_CANDIDATOS", "8"))
+
+# Caché de búsquedas web (Tavily) compartida por los agentes buscadores
+BUSQUEDA_WEB_BACKEND = os.getenv("BUSQUEDA_WEB_BACKEND", "tavily").lower()  # "tavily" o "simulado"
+BUSQUEDA_WEB_CACHE_URL = os.getenv("BUSQUEDA_WEB_CACHE_URL", f"sqlite:///{Path(__file__).parent / 'datos' / 'cache_busquedas.db'}")
+BUSQUEDA_WEB_CACHE_MAX_ENTRADAS = int(os.getenv("BUSQUEDA_WEB_CACHE_MAX_ENTRADAS", "2000"))
+BUSQUEDA_WEB_TTL_HORAS = float(os.getenv("BUSQUEDA_WEB_TTL_HORAS", "12"))
+BUSQUEDA_WEB_TTL_RECIENTES_HORAS = float(os.getenv("BUSQUEDA_WEB_TTL_RECIENTES_HORAS", "1"))
+# Dominios a los que se restringen las búsquedas, separados por comas (vacío = sin filtro)
+BUSQUEDA_WEB_DOMINIOS = [d.strip() for d in os.getenv("BUSQUEDA_WEB_DOMINIOS", "").split(",") if d.strip()]
+
+# Sesiones (`sesion_agente`): caché, escrituras por turno y compactación del historial
+SESIONES_COMPACTAS = os.getenv("SESIONES_COMPACTAS", "true").lower() in ("true", "1", "yes")
+SESIONES_TURNOS_COMPLETOS = int(os.getenv("SESIONES_TURNOS_COMPLETOS", "1"))
+SESIONES_MAX_TURNOS = int(os.getenv("SESIONES_MAX_TURNOS", "50"))
+SESIONES_MAX_CARACTERES_TURNO = int(os.getenv("SESIONES_MAX_CARACTERES_TURNO", "1500"))
+SESIONES_COMPACTAR_CADA = int(os.getenv("SESIONES_COMPACTAR_CADA", "10"))
+SESIONES_CACHE_MAX = int(os.getenv("SESIONES_CACHE_MAX", "1000"))
+
+# Enrutador sin LLM delante del equipo (saludos, fuera de ámbito y consultas de artículos)
+ENRUTADOR_ACTIVO = os.getenv("ENRUTADOR_ACTIVO", "true").lower() in ("true", "1", "yes")
+ENRUTADOR_UMBRAL = float(os.getenv("ENRUTADOR_UMBRAL", "0.82"))
+ENRUTADOR_MARGEN = float(os.getenv("ENRUTADOR_MARGEN", "0.05"))
+
+# Equipo con miembros en paralelo (equipo_paralelo.py)
+MIEMBRO_TIMEOUT_SEGUNDOS = float(os.getenv("MIEMBRO_TIMEOUT_SEGUNDOS", "90"))
+EVIDENCIA_GRACIA_SEGUNDOS = float(os.getenv("EVIDENCIA_GRACIA_SEGUNDOS", "15"))
+MIEMBROS_SUFICIENTES = [m.strip() for m in os.getenv("MIEMBROS_SUFICIENTES", "Agente Legal").split(",") if m.strip()]
+
+# Métricas por etapa en /metrics y, opcionalmente, una traza JSON por petición
+METRICAS_ACTIVAS = os.getenv("METRICAS_ACTIVAS", "true").lower() in ("true", "1", "yes")
+TRAZAS_PATH = os.getenv("TRAZAS_PATH")
+# Con varios workers, cada uno vuelca sus métricas aquí y /metrics las suma (servidor.py la define)
+METRICAS_DIR = os.getenv("METRICAS_DIR")
+METRICAS_VOLCADO_SEGUNDOS = float(os.getenv("METRICAS_VOLCADO_SEGUNDOS", "5"))
+
+
+_engines = {}
+
+
+def obtener_engine(url: str = None):
+    """Engine de SQLAlchemy del proceso para `url` (por defecto, la base principal), con el pool configurado."""
+    url = url or db_url
+    if url not in _engines:
+        from sqlalchemy import create_engine
+
+        opciones = {"pool_pre_ping": True}
+        if not url.startswith("sqlite"):
+            opciones.update(
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+            )
+        _engines[url] = create_engine(url, **opciones)
+    return _engines[url]
+
+
+def crear_embedder_consultas():
+    """Embedder para las búsquedas de los agentes, con caché LRU y persistente."""
+    from agno.embedder.openai import OpenAIEmbedder
+
+    from cache_embeddings import EmbedderCacheado
+
+    return EmbedderCacheado(
+        embedder=OpenAIEmbedder(id=MODELO_EMBEDDINGS),
+        max_bytes=CACHE_EMBEDDINGS_MAX_MB * 1024 * 1024,
+        db_url=CACHE_EMBEDDINGS_URL or None,
+        db_engine=obtener_engine(CACHE_EMBEDDINGS_URL) if CACHE_EMBEDDINGS_URL else None,
+    )
+
+
+def crear_empaquetador_contexto():
+    """`retriever` que deduplica, une y acota por tokens los pasajes recuperados (None lo desactiva)."""
+    if not CONTEXTO_EMPAQUETADO:
+        return None
+
+    from contexto_legal import EmpaquetadorContexto
+
+    return EmpaquetadorContexto(
+        presupuesto_tokens=CONTEXTO_PRESUPUESTO_TOKENS,
+        tokens_por_documento=CONTEXTO_TOKENS_POR_DOCUMENTO,
+        candidatos=CONTEXTO_CANDIDATOS,
+    )
+
+
+def crear_tavily_tools(**kwargs):
+    """Herramienta de búsqueda web con la caché compartida del proceso."""
+    from cache_busquedas import TavilyCacheado, obtener_cache_busquedas
+
+    return TavilyCacheado(cache=obtener_cache_busquedas(), include_domains=BUSQUEDA_WEB_DOMINIOS or None, **kwargs)
+
+
+def crear_storage_sesiones(table_name: str = "sesion_agente"):
+    """Storage de sesiones compartido por los Playground."""
+    if not SESIONES_COMPACTAS:
+        from agno.storage.postgres import PostgresStorage
+
+        return PostgresStorage(table_name=table_name, db_url=db_url, db_engine=obtener_engine(), auto_upgrade_schema=True)
+
+    from almacen_sesiones import PostgresStorageCompacto
+
+    return PostgresStorageCompacto(
+        table_name=table_name,
+        db_url=db_url,
+        db_engine=obtener_engine(),
+        auto_upgrade_schema=True,
+        turnos_completos=SESIONES_TURNOS_COMPLETOS,
+        max_turnos=SESIONES_MAX_TURNOS,
+        max_caracteres_turno=SESIONES_MAX_CARACTERES_TURNO,
+        compactar_cada=SESIONES_COMPACTAR_CADA,
+        max_sesiones_cache=SESIONES_CACHE_MAX,
+    )
+
+
+def crear_vector_db(embedder=None):
+    """Crea el PgVector de la tabla `legislacion` con la configuración compartida."""
+    from agno.embedder.openai import OpenAIEmbedder
+    from agno.vectordb.pgvector import SearchType
+
+    from indices_vectoriales import PgVectorIndexado, configurar_indice
+
+    return PgVectorIndexado(
+        table_name=TABLA_CONOCIMIENTO,
+        schema=ESQUEMA_CONOCIMIENTO,
+        db_url=db_url,
+        db_engine=obtener_engine(),
+        search_type=SearchType.hybrid,
+        embedder=embedder or OpenAIEmbedder(id=MODELO_EMBEDDINGS),
+        vector_index=configurar_indice(),
+        candidatos=ANN_CANDIDATOS,
+        cuantizacion=EMBEDDINGS_CUANTIZACION,
+        dimensiones_reducidas=EMBEDDINGS_DIMENSIONES_REDUCIDAS,
+        factor_rerank=EMBEDDINGS_FACTOR_RERANK,
+    )
+
+
+def crear_vector_db_consultas(embedder=None):
+    """Vector DB de búsqueda para los agentes según `RECUPERACION_BACKEND`."""
+    if RECUPERACION_BACKEND == "local":
+        from recuperacion_local import VectorDbLocal
+
+        return VectorDbLocal(
+            ruta=RECUPERACION_LOCAL_PATH,
+            embedder=embedder,
+            cuantizacion=EMBEDDINGS_CUANTIZACION,
+            dimensiones_reducidas=EMBEDDINGS_DIMENSIONES_REDUCIDAS,
+            factor_rerank=EMBEDDINGS_FACTOR_RERANK,
+        )
+    if RECUPERACION_BACKEND != "pgvector":
+        raise ValueError(f"RECUPERACION_BACKEND desconocido: {RECUPERACION_BACKEND}")
+    return crear_vector_db(embedder=embedder)
+
+
+def agregar_cache_respuestas(app, entidades, embedder=None):
+    """Registra la caché semántica de respuestas sobre los endpoints de ejecución del Playground."""
+    if not CACHE_RESPUESTAS_ACTIVA:
+        return None
+
+    from cache_respuestas import CacheRespuestas, CacheRespuestasMiddleware
+
+    cache = CacheRespuestas(
+        embedder=embedder or crear_embedder_consultas(),
+        umbral=CACHE_RESPUESTAS_UMBRAL,
+        ttl_segundos=CACHE_RESPUESTAS_TTL_HORAS * 3600,
+        max_entradas=CACHE_RESPUESTAS_MAX_ENTRADAS,
+    )
+    app.add_middleware(CacheRespuestasMiddleware, entidades=entidades, cache=cache)
+    return cache
+
+
+def agregar_enrutador(app, entidades, embedder=None):
+    """Responde sin el equipo los mensajes triviales, fuera de ámbito o de consulta de artículos."""
+    if not ENRUTADOR_ACTIVO:
+        return None
+
+    from enrutador import ClasificadorConsultas, EnrutadorMiddleware
+
+    clasificador = ClasificadorConsultas(
+        embedder=embedder or crear_embedder_consultas(),
+        umbral=ENRUTADOR_UMBRAL,
+        margen=ENRUTADOR_MARGEN,
+    )
+    app.add_middleware(EnrutadorMiddleware, entidades=entidades, clasificador=clasificador)
+    return clasificador
+
+
+def agregar_metricas(app, entidades):
+    """Instrumenta los agentes o equipos y expone las métricas en `/metrics`."""
+    if not METRICAS_ACTIVAS:
+        return
+
+    from trazas import TrazasMiddleware, agregar_endpoint_metricas, instrumentar
+
+    for entidad in entidades:
+        instrumentar(entidad)
+    agregar_endpoint_metricas(app, directorio=Path(METRICAS_DIR) if METRICAS_DIR else None, intervalo=METRICAS_VOLCADO_SEGUNDOS)
+    app.add_middleware(TrazasMiddleware, ruta_trazas=Path(TRAZAS_PATH) if TRAZAS_PATH else None)
+
+
+def agregar_arranque(app, entidades, embedder=None, clasificador=None):
+    """Endpoints de salud, calentamiento antes de aceptar tráfico y cierre ordenado (ver servidor.py)."""
+    from servidor import llenar_pool, recorrer_entidades, registrar_arranque
+
+    miembros = recorrer_entidades(entidades)
+    pasos = {"db": lambda: llenar_pool(obtener_engine(), DB_POOL_SIZE)}
+
+    def vector_db():
+        for entidad in miembros:
+            knowledge = getattr(entidad, "knowledge", None)
+            if knowledge is not None and knowledge.vector_db is not None:
+                knowledge.vector_db.exists()
+
+    def indice_articulos():
+        from indice_articulos import obtener_indice
+
+        obtener_indice()
+
+    pasos["vector_db"] = vector_db
+    pasos["indice_articulos"] = indice_articulos
+    if clasificador is not None:
+        # Calcula los prototipos y, de paso, deja caliente el cliente del embedder
+        pasos["enrutador"] = clasificador.prototipos
+    elif embedder is not None:
+        pasos["embedder"] = lambda: embedder.get_embedding("requisitos del divorcio en Ecuador")
+
+    def vaciar_sesiones():
+        for entidad in miembros:
+            vaciar = getattr(getattr(entidad, "storage", None), "vaciar", None)
+            if vaciar is not None:
+                vaciar()
+
+    def cerrar_pools():
+        for engine in _engines.values():
+            engine.dispose()
+
+    return registrar_arranque(
+        app,
+        pasos,
+        obligatorios=("db",),
+        al_cerrar=(vaciar_sesiones, cerrar_pools),
+        drenaje_previo=DRENAJE_PREVIO_SEGUNDOS,
+    )
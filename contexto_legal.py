@@ -0,0 +1,293 @@
+"""Empaquetado del contexto recuperado antes de inyectarlo en el prompt de `agente_legal`.
+
+Con `num_documents=5`, agno añade al prompt los cinco fragmentos tal cual llegan de la búsqueda,
+aunque se solapen o sean partes consecutivas del mismo artículo. Ese texto se paga dos veces:
+en el miembro y de nuevo cuando el coordinador lee su respuesta. `EmpaquetadorContexto` se usa
+como `retriever` del agente y, entre la búsqueda y el prompt:
+
+1. pide algunos candidatos más de los que se van a usar (`candidatos`),
+2. descarta duplicados: el mismo artículo y parte, textos contenidos en otro y fragmentos casi
+   iguales (Jaccard de 5-gramas de palabras >= `umbral_duplicado`),
+3. une en un solo pasaje las partes consecutivas de un artículo y los artículos contiguos del
+   mismo código y capítulo, con una sola cabecera,
+4. ordena los pasajes por la puntuación de la búsqueda híbrida,
+5. los añade mientras quepan en el presupuesto, contado con tiktoken. Si el primero no cabe, se
+   recorta. El presupuesto es `tokens_por_documento` por cada uno de los `num_documents` que
+   pide agno, salvo que se fije `presupuesto_tokens`. El valor por defecto (800) cubre el
+   percentil 95 de los fragmentos del corpus ya serializados (~780 tokens; la mediana ronda
+   230), así que los cinco pasajes de `num_documents=5` caben aunque sean artículos largos.
+
+Cada petición registra en el log y en `/metrics` los tokens antes y después.
+"""
+
+import json
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from agno.document import Document
+from agno.utils.log import log_debug, log_info, logger
+
+from trazas import TOKENS_CONTEXTO, span
+
+
+class ContadorTokens:
+    """Cuenta tokens con tiktoken; sin el archivo de la codificación (p. ej. sin red) estima 4 caracteres por token."""
+
+    def __init__(self, modelo: str = "o3-mini"):
+        self.modelo = modelo
+        self._codificacion = None
+        self._cargada = False
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        with self._lock:
+            if not self._cargada:
+                try:
+                    import tiktoken
+
+                    try:
+                        self._codificacion = tiktoken.encoding_for_model(self.modelo)
+                    except KeyError:
+                        self._codificacion = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    logger.warning(f"tiktoken no disponible, se estiman los tokens por caracteres: {e}")
+                self._cargada = True
+        return self._codificacion
+
+    def contar(self, texto: str) -> int:
+        codificacion = self._codificacion if self._cargada else self._cargar()
+        if codificacion is None:
+            return (len(texto) + 3) // 4
+        return len(codificacion.encode(texto, disallowed_special=()))
+
+    def recortar(self, texto: str, max_tokens: int) -> str:
+        codificacion = self._codificacion if self._cargada else self._cargar()
+        if codificacion is None:
+            return texto[: max_tokens * 4]
+        return codificacion.decode(codificacion.encode(texto, disallowed_special=())[:max_tokens])
+
+
+@dataclass
+class Pasaje:
+    codigo: str
+    articulos: List[str]
+    jerarquia: str
+    pagina: Any
+    contenido: str
+    puntuacion: float
+    orden: int
+    # (artículo, parte) de los fragmentos que lo forman
+    fragmentos: List[Tuple[Optional[str], int]] = field(default_factory=list)
+    ultima_parte: bool = True
+
+    def cabecera(self) -> str:
+        cabecera = " > ".join(x for x in (self.codigo, self.jerarquia) if x)
+        if self.articulos:
+            prefijo = "Art." if len(self.articulos) == 1 else "Arts."
+            cabecera = f"{cabecera} > {prefijo} {', '.join(self.articulos)}"
+        return cabecera
+
+    def a_dict(self) -> Dict[str, Any]:
+        meta: Dict[str, Any] = {"codigo": self.codigo, "jerarquia": self.jerarquia, "page": self.pagina}
+        if self.articulos:
+            meta["articulos"] = ", ".join(self.articulos)
+        return {"name": self.codigo, "meta_data": meta, "content": f"{self.cabecera()}\n{self.contenido}"}
+
+
+def _numero_entero(numero: Optional[str]) -> Optional[int]:
+    return int(numero) if numero is not None and str(numero).isdigit() else None
+
+
+def _normalizar(texto: str) -> str:
+    return re.sub(r"\s+", " ", texto.lower()).strip()
+
+
+def _shingles(texto: str, n: int = 5) -> Set[Tuple[str, ...]]:
+    palabras = re.findall(r"\w+", texto.lower())
+    if len(palabras) < n:
+        return {tuple(palabras)} if palabras else set()
+    return {tuple(palabras[i : i + n]) for i in range(len(palabras) - n + 1)}
+
+
+def _sin_cabecera(documento: Document) -> str:
+    """Contenido sin la línea de cabecera que añade `ChunkingLegal` (código > capítulo > ...)."""
+    contenido = documento.content or ""
+    codigo = (documento.meta_data or {}).get("codigo") or documento.name
+    if codigo and contenido.startswith(codigo) and "\n" in contenido:
+        return contenido.split("\n", 1)[1]
+    return contenido
+
+
+def pasaje_desde_documento(documento: Document, orden: int) -> Pasaje:
+    meta = documento.meta_data or {}
+    articulo = meta.get("articulo")
+    parte = int(meta.get("parte", 1))
+    puntuacion = meta.get("puntuacion")
+    return Pasaje(
+        codigo=meta.get("codigo") or documento.name or "",
+        articulos=[str(articulo)] if articulo is not None else [],
+        jerarquia=meta.get("jerarquia") or "",
+        pagina=meta.get("page"),
+        contenido=_sin_cabecera(documento).strip(),
+        # Sin puntuación (otro backend), el orden de la búsqueda
+        puntuacion=float(puntuacion) if puntuacion is not None else 1.0 / (1 + orden),
+        orden=orden,
+        fragmentos=[(str(articulo) if articulo is not None else None, parte)],
+        ultima_parte=parte >= int(meta.get("partes", 1)),
+    )
+
+
+def deduplicar(pasajes: List[Pasaje], umbral: float = 0.85) -> List[Pasaje]:
+    """Quita fragmentos repetidos o solapados, conservando el de mayor puntuación."""
+    elegidos: List[Pasaje] = []
+    vistos: Set[Tuple[str, Optional[str], int]] = set()
+    normalizados: List[str] = []
+    shingles: List[Set[Tuple[str, ...]]] = []
+    for pasaje in sorted(pasajes, key=lambda p: (-p.puntuacion, p.orden)):
+        clave = (pasaje.codigo, *pasaje.fragmentos[0])
+        if pasaje.fragmentos[0][0] is not None and clave in vistos:
+            continue
+        texto = _normalizar(pasaje.contenido)
+        propios = _shingles(texto)
+        duplicado = False
+        for i, otro in enumerate(normalizados):
+            if texto in otro:
+                duplicado = True
+                break
+            union = propios | shingles[i]
+            if union and len(propios & shingles[i]) / len(union) >= umbral:
+                duplicado = True
+                break
+        if duplicado:
+            continue
+        vistos.add(clave)
+        normalizados.append(texto)
+        shingles.append(propios)
+        elegidos.append(pasaje)
+    return elegidos
+
+
+def _contiguos(a: Pasaje, b: Pasaje) -> bool:
+    if a.codigo != b.codigo:
+        return False
+    articulo_a, parte_a = a.fragmentos[-1]
+    articulo_b, parte_b = b.fragmentos[0]
+    if articulo_a is None or articulo_b is None:
+        return False
+    if articulo_a == articulo_b:
+        return parte_b == parte_a + 1
+    numero_a, numero_b = _numero_entero(articulo_a), _numero_entero(articulo_b)
+    return (
+        numero_a is not None
+        and numero_b == numero_a + 1
+        and a.ultima_parte
+        and parte_b == 1
+        and a.jerarquia == b.jerarquia
+    )
+
+
+def unir_contiguos(pasajes: List[Pasaje]) -> List[Pasaje]:
+    """Une partes consecutivas de un artículo y artículos contiguos del mismo código y capítulo."""
+
+    def orden_documental(p: Pasaje):
+        articulo, parte = p.fragmentos[0]
+        numero = _numero_entero(articulo)
+        return (p.codigo, p.jerarquia, numero if numero is not None else float("inf"), articulo or "", parte)
+
+    unidos: List[Pasaje] = []
+    for pasaje in sorted(pasajes, key=orden_documental):
+        anterior = unidos[-1] if unidos else None
+        if anterior is not None and _contiguos(anterior, pasaje):
+            anterior.contenido = f"{anterior.contenido}\n\n{pasaje.contenido}"
+            anterior.articulos += [a for a in pasaje.articulos if a not in anterior.articulos]
+            anterior.fragmentos += pasaje.fragmentos
+            anterior.ultima_parte = pasaje.ultima_parte
+            anterior.puntuacion = max(anterior.puntuacion, pasaje.puntuacion)
+            anterior.orden = min(anterior.orden, pasaje.orden)
+            continue
+        unidos.append(pasaje)
+    return unidos
+
+
+class EmpaquetadorContexto:
+    """`retriever` de agno que deduplica, une, reordena y acota por tokens los pasajes recuperados."""
+
+    def __init__(
+        self,
+        presupuesto_tokens: Optional[int] = None,
+        tokens_por_documento: int = 800,
+        candidatos: int = 8,
+        max_pasajes: Optional[int] = None,
+        umbral_duplicado: float = 0.85,
+        modelo: str = "o3-mini",
+    ):
+        self.presupuesto_tokens = presupuesto_tokens
+        self.tokens_por_documento = tokens_por_documento
+        self.candidatos = candidatos
+        self.max_pasajes = max_pasajes
+        self.umbral_duplicado = umbral_duplicado
+        self.tokens = ContadorTokens(modelo)
+
+    def __deepcopy__(self, memo):
+        # Sin estado por petición: las copias del Playground comparten el empaquetador
+        return self
+
+    def presupuesto(self, num_documents: int) -> int:
+        return self.presupuesto_tokens or self.tokens_por_documento * num_documents
+
+    def _tokens_json(self, documentos: List[Dict[str, Any]]) -> int:
+        # Mismo formato con el que agno inyecta las referencias en el prompt
+        return self.tokens.contar(json.dumps(documentos, indent=2)) if documentos else 0
+
+    def empaquetar(self, documentos: List[Document], num_documents: int) -> List[Dict[str, Any]]:
+        pasajes = [pasaje_desde_documento(d, i) for i, d in enumerate(documentos)]
+        pasajes = unir_contiguos(deduplicar(pasajes, self.umbral_duplicado))
+        pasajes.sort(key=lambda p: (-p.puntuacion, p.orden))
+
+        max_pasajes = self.max_pasajes or num_documents
+        presupuesto = self.presupuesto(num_documents)
+        elegidos: List[Dict[str, Any]] = []
+        usados = 2  # corchetes de la lista JSON
+        for pasaje in pasajes:
+            if len(elegidos) >= max_pasajes:
+                break
+            candidato = pasaje.a_dict()
+            costo = self._tokens_json([candidato])
+            if usados + costo <= presupuesto:
+                elegidos.append(candidato)
+                usados += costo
+            elif not elegidos:
+                # Ni el mejor pasaje cabe entero: se recorta para no quedarse sin contexto
+                exceso = costo - (presupuesto - usados)
+                disponible = max(self.tokens.contar(candidato["content"]) - exceso, 0)
+                candidato["content"] = self.tokens.recortar(candidato["content"], disponible) + " […]"
+                elegidos.append(candidato)
+                usados += self._tokens_json([candidato])
+        return elegidos
+
+    def __call__(self, query: str, num_documents: Optional[int] = None, agent: Any = None, **kwargs) -> Optional[List[Dict[str, Any]]]:
+        knowledge = getattr(agent, "knowledge", None)
+        if knowledge is None:
+            return None
+        num_documents = num_documents or knowledge.num_documents
+        with span("contexto") as atributos:
+            documentos = knowledge.search(query=query, num_documents=max(self.candidatos, num_documents), **kwargs)
+            if not documentos:
+                return None
+            empaquetados = self.empaquetar(documentos, num_documents)
+
+            # Lo que agno habría inyectado: los `num_documents` primeros fragmentos completos
+            originales = self._tokens_json([d.to_dict() for d in documentos[:num_documents]])
+            finales = self._tokens_json(empaquetados)
+            TOKENS_CONTEXTO.incrementar(originales, tipo="recuperado")
+            TOKENS_CONTEXTO.incrementar(finales, tipo="empaquetado")
+            atributos.update(candidatos=len(documentos), pasajes=len(empaquetados), tokens_originales=originales, tokens=finales)
+        ahorro = 100 * (originales - finales) / originales if originales else 0.0
+        log_info(
+            f"Contexto: {min(len(documentos), num_documents)} fragmentos/{originales} tokens -> "
+            f"{len(empaquetados)} pasajes/{finales} tokens ({ahorro:.0f}% de ahorro)"
+        )
+        log_debug(f"Pasajes: {[p['meta_data'].get('articulos') for p in empaquetados]}")
+        return empaquetados
@@ -0,0 +1,224 @@
+"""Coordinación de `Team` con los miembros ejecutados en paralelo.
+
+En modo `coordinate`, agno entrega cada tarea a un miembro con una herramienta que es un
+generador asíncrono: aunque el modelo pida varias transferencias en la misma respuesta, los
+miembros se ejecutan uno detrás de otro mientras se consumen los resultados. `EquipoParalelo`
+la reemplaza por una corrutina, de modo que las transferencias de un mismo turno (base de
+conocimiento y búsqueda web) corren a la vez sobre asyncio:
+
+- cada miembro tiene un tiempo máximo (`timeout_miembro`); al vencer se cancela su ejecución
+  y el coordinador recibe un aviso en lugar de la respuesta,
+- cuando responde un miembro "suficiente" (por defecto el agente legal, que cita la base de
+  conocimiento), los demás del mismo turno solo disponen de `gracia_evidencia` segundos más.
+  Así el coordinador empieza a redactar (y a emitir tokens) sin esperar a la búsqueda web más lenta,
+- si el cliente se desconecta, la cancelación se propaga a los miembros en curso.
+
+Las llamadas al mismo miembro dentro de un turno se serializan, porque un `Agent` guarda el
+estado de su ejecución en la instancia. El turno en curso y esos bloqueos son de cada run
+(`_estado_run`): el Playground ejecuta las peticiones sin stream sobre el mismo equipo, sin copiarlo.
+"""
+
+import asyncio
+import json
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from agno.exceptions import RunCancelledException
+from agno.media import Audio, Image, Video
+from agno.team.team import Team
+from agno.tools.function import Function
+from agno.utils.log import log_debug, logger, use_agent_logger, use_team_logger
+from agno.utils.response import check_if_run_cancelled
+
+from configuracion import EVIDENCIA_GRACIA_SEGUNDOS, MIEMBROS_SUFICIENTES, MIEMBRO_TIMEOUT_SEGUNDOS
+
+
+class _Turno:
+    """Transferencias lanzadas en la misma respuesta del coordinador."""
+
+    def __init__(self):
+        self.activas = 0
+        self.evidencia = asyncio.Event()
+        self.evidencia_en: Optional[float] = None
+
+    def registrar_evidencia(self) -> None:
+        if not self.evidencia.is_set():
+            self.evidencia_en = time.monotonic()
+            self.evidencia.set()
+
+
+class _EstadoRun:
+    """Estado de las transferencias de un run del equipo."""
+
+    def __init__(self):
+        self.turno: Optional[_Turno] = None
+        self.bloqueos: Dict[str, asyncio.Lock] = {}
+
+
+# Cada petición corre en su propia tarea; `asyncio.gather` copia el contexto a las transferencias
+# del turno, que comparten así el mismo `_EstadoRun`
+_estado_run: ContextVar[Optional[_EstadoRun]] = ContextVar("estado_run_equipo", default=None)
+
+
+class EquipoParalelo(Team):
+    def __init__(
+        self,
+        *args,
+        timeout_miembro: float = MIEMBRO_TIMEOUT_SEGUNDOS,
+        gracia_evidencia: Optional[float] = EVIDENCIA_GRACIA_SEGUNDOS,
+        miembros_suficientes: Sequence[str] = MIEMBROS_SUFICIENTES,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.timeout_miembro = timeout_miembro
+        self.gracia_evidencia = gracia_evidencia
+        self.miembros_suficientes = list(miembros_suficientes)
+
+    def deep_copy(self, *, update: Optional[Dict[str, Any]] = None) -> "EquipoParalelo":
+        # Team.deep_copy construye siempre un `Team`; el Playground copia el equipo en cada petición
+        copia = super().deep_copy(update=update)
+        copia.__class__ = type(self)
+        return copia
+
+    async def arun(self, *args, **kwargs):
+        _estado_run.set(_EstadoRun())
+        return await super().arun(*args, **kwargs)
+
+    def get_transfer_task_function(self, stream: bool = False, async_mode: bool = False, **kwargs) -> Function:
+        if not async_mode or self.mode != "coordinate":
+            return super().get_transfer_task_function(stream=stream, async_mode=async_mode, **kwargs)
+
+        images: List = kwargs.get("images") or []
+        videos: List = kwargs.get("videos") or []
+        audio: List = kwargs.get("audio") or []
+        files = kwargs.get("files")
+
+        async def transfer_task_to_member(agent_name: str, task_description: str, expected_output: str) -> str:
+            """Transfiere una tarea a un miembro del equipo. Puedes transferir tareas a varios miembros
+            en la misma respuesta: se ejecutan en paralelo.
+
+            :param agent_name: Nombre del miembro al que se transfiere la tarea.
+            :param task_description: Descripción clara y concisa de lo que debe lograr el miembro.
+            :param expected_output: Resultado que se espera del miembro.
+            :return: La respuesta del miembro.
+            """
+            resultado = self._find_member_by_name(agent_name)
+            if resultado is None:
+                return f"Agent with name {agent_name} not found in the team or any subteams. Please choose the correct agent from the list of agents."
+            indice, miembro = resultado
+            self._initialize_member(miembro)
+
+            tarea, imagenes, videos_miembro, audio_miembro = self._tarea_miembro(task_description, expected_output, images, videos, audio)
+            estado = _estado_run.get() or _EstadoRun()
+            turno = estado.turno if estado.turno is not None and estado.turno.activas > 0 else _Turno()
+            estado.turno = turno
+            turno.activas += 1
+            nombre = miembro.name or f"agent_{indice}"
+            bloqueo = estado.bloqueos.setdefault(nombre, asyncio.Lock())
+            try:
+                async with bloqueo:
+                    use_agent_logger()
+                    ejecucion = asyncio.ensure_future(
+                        miembro.arun(tarea, images=imagenes, videos=videos_miembro, audio=audio_miembro, files=files, stream=False)
+                    )
+                    respuesta, aviso = await self._esperar(ejecucion, nombre, turno)
+            finally:
+                turno.activas -= 1
+                use_team_logger()
+
+            if respuesta is None:
+                return aviso
+            try:
+                check_if_run_cancelled(respuesta)
+            except RunCancelledException:
+                return self._cancelada(respuesta)
+
+            if nombre in self.miembros_suficientes and respuesta.content:
+                turno.registrar_evidencia()
+            self.memory.add_interaction_to_team_context(member_name=nombre, task=task_description, run_response=miembro.run_response)
+            self.run_response.add_member_run(miembro.run_response)
+            self._update_team_state(miembro.run_response)
+            return self._contenido(respuesta)
+
+        return Function.from_callable(transfer_task_to_member, strict=True)
+
+    def _tarea_miembro(
+        self, task_description: str, expected_output: str, images: List, videos: List, audio: List
+    ) -> Tuple[str, List, List, List]:
+        """Mismo mensaje y multimedia que construye agno para el miembro.
+
+        Las listas se copian en cada llamada: agno amplía las del turno con la multimedia de las
+        interacciones previas, y con miembros en paralelo cada transferencia tendría la de las demás.
+        """
+        images, videos, audio = list(images), list(videos), list(audio)
+        tarea = f"You are a member of a team of agents. Your goal is to complete the following task:\n\n{task_description}\n\n<expected_output>\n{expected_output}\n</expected_output>"
+        if self.enable_agentic_context:
+            contexto = self.memory.get_team_context_str()
+            if contexto:
+                tarea += f"\n\n{contexto}"
+        if self.share_member_interactions:
+            interacciones = self.memory.get_team_member_interactions_str()
+            if interacciones:
+                tarea += f"\n\n{interacciones}"
+            images.extend(Image.from_artifact(imagen) for imagen in self.memory.get_team_context_images())
+            videos.extend(Video.from_artifact(video) for video in self.memory.get_team_context_videos())
+            audio.extend(Audio.from_artifact(pista) for pista in self.memory.get_team_context_audio())
+        return tarea, images, videos, audio
+
+    async def _esperar(self, ejecucion: asyncio.Future, nombre: str, turno: _Turno) -> Tuple[Any, Optional[str]]:
+        """Espera al miembro hasta su timeout o hasta agotar la gracia tras la primera evidencia suficiente."""
+        inicio = time.monotonic()
+        limite = inicio + self.timeout_miembro
+        try:
+            while not ejecucion.done():
+                ahora = time.monotonic()
+                fin = limite
+                if turno.evidencia_en is not None and self.gracia_evidencia is not None and nombre not in self.miembros_suficientes:
+                    fin = min(fin, turno.evidencia_en + self.gracia_evidencia)
+                if ahora >= fin:
+                    break
+                esperas = {ejecucion}
+                evidencia = None
+                if not turno.evidencia.is_set():
+                    evidencia = asyncio.ensure_future(turno.evidencia.wait())
+                    esperas.add(evidencia)
+                try:
+                    await asyncio.wait(esperas, timeout=fin - ahora, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if evidencia is not None:
+                        evidencia.cancel()
+        except asyncio.CancelledError:
+            # La petición se canceló (p. ej. el cliente cerró la conexión)
+            ejecucion.cancel()
+            raise
+
+        if not ejecucion.done():
+            # Timeout o gracia agotada tras la evidencia de otro miembro
+            ejecucion.cancel()
+            await asyncio.gather(ejecucion, return_exceptions=True)
+            log_debug(f"Miembro {nombre} cancelado tras {time.monotonic() - inicio:.1f} s")
+            return None, f"El miembro {nombre} no respondió a tiempo; responde con la evidencia de los demás miembros."
+        if ejecucion.cancelled() or ejecucion.exception() is not None:
+            logger.warning(f"Error en el miembro {nombre}: {'cancelado' if ejecucion.cancelled() else ejecucion.exception()}")
+            return None, f"El miembro {nombre} no pudo completar la tarea; responde con la evidencia de los demás miembros."
+        log_debug(f"Miembro {nombre} respondió en {time.monotonic() - inicio:.1f} s")
+        return ejecucion.result(), None
+
+    @staticmethod
+    async def _cancelada(respuesta):
+        # agno atrapa lo que lanza la corrutina de una herramienta, pero propaga lo que lanza el
+        # iterador de su resultado: así la cancelación del miembro detiene el run del equipo
+        check_if_run_cancelled(respuesta)
+        yield ""
+
+    @staticmethod
+    def _contenido(respuesta) -> str:
+        contenido = respuesta.content
+        if contenido is None:
+            return "No response from the member agent."
+        if isinstance(contenido, str):
+            return contenido
+        if hasattr(contenido, "model_dump_json"):
+            return contenido.model_dump_json(indent=2)
+        return json.dumps(contenido, indent=2, default=str)
@@ -0,0 +1,297 @@
+"""Fragmentación de códigos ecuatorianos respetando su estructura (Libro, Título, Capítulo, Artículo).
+
+Cada artículo se convierte en un fragmento con su número y la ruta jerárquica en `meta_data`.
+Antes se normaliza el texto de pypdf (banners de Lexis, números de artículo desplazados al
+final de la línea y bloques de concordancias). Los artículos muy largos se parten por párrafos
+hasta `max_caracteres`; el texto previo al primer artículo (considerandos, preámbulo) y las
+disposiciones finales se fragmentan por tamaño.
+"""
+
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from agno.document import Document
+from agno.document.chunking.strategy import ChunkingStrategy
+
+NIVELES = ("libro", "titulo", "capitulo", "seccion")
+# Partes que se reservan en la cabecera "(continuación N/M)" al calcular el tope de cada fragmento
+MAX_PARTES = 999
+
+RE_ENCABEZADO = {
+    "libro": re.compile(r"^\s*LIBRO\s+([IVXLCDM]+|[A-ZÁÉÍÓÚ]+)\b.*$", re.M),
+    "titulo": re.compile(r"^\s*T[ÍI]TULO\s+([IVXLCDM]+|PRELIMINAR|[A-ZÁÉÍÓÚ]+)\b.*$", re.M),
+    "capitulo": re.compile(r"^\s*CAP[ÍI]TULO\s+([IVXLCDM]+|\d+|[A-ZÁÉÍÓÚ]+)\b.*$", re.M),
+    "seccion": re.compile(r"^\s*SECCI[ÓO]N\s+([IVXLCDM]+|\d+|[A-ZÁÉÍÓÚ]+)\b.*$", re.M),
+}
+RE_DISPOSICIONES = re.compile(r"^\s*DISPOSICI[ÓO]N(?:ES)?\s+(GENERAL|TRANSITORIA|DEROGATORIA|REFORMATORIA|FINAL)(?:ES|S)?\b.*$", re.M)
+
+# "Art. 140.-", "Artículo 140.-", "Art. 66 .-", "Art. 10 bis.-", "Art. 342-b.-", "Art. (...).-" (innumerados)
+RE_ARTICULO = re.compile(
+    r"^\s*Art(?:[íi]culo|\.)\s*"
+    r"(?:(?P<numero>\d+(?:\.\d+)*)"
+    r"(?:\s*\.?\s*(?P<sufijo>bis|ter|quater|quinquies|sexies|septies|octies|nonies|decies)\b|-(?P<letra>[a-z])\b)?"
+    r"|(?P<innumerado>\(?\s*\.\.\.\s*\)?))"
+    r"\s*\.?\s*[-–—]",
+    re.M | re.I,
+)
+# Un "Art. N.-" a inicio de línea seguido de minúscula o comillas suele ser una cita dentro de una
+# nota o sentencia ("Art. 148.- de la Constitución: ...") y no el comienzo del artículo
+RE_CITA = re.compile(r"\s*[a-záéíóúñ\"“«']")
+
+# Cabeceras y pies de página que se repiten en los PDFs exportados de Lexis
+RE_RUIDO = re.compile(
+    r"^\s*Descargado\s*\n\s*gratuitamente desde\s*\n\s*www\.lexis\.com\.\s*\n\s*ec\s*$"
+    r"|^.*(?:www\.lexis\.com\.ec|LEXIS FINDER).*$"
+    r"|^\s*P[áa]gina\s+\d+(?:\s+de\s+\d+)?\s*$",
+    re.M | re.I,
+)
+# En los PDFs de Lexis pypdf deja el número al final de la primera línea:
+# ".- Los hermanos pueden ser ... hermanosArt. 26" -> "Art. 26.- Los hermanos pueden ser ... hermanos"
+RE_ARTICULO_DESPLAZADO = re.compile(
+    r"^(\s*\.-.*?)\s*(Art\.\s*(?:\d+(?:\.\d+)*(?:\s*(?:bis|ter|quater|quinquies|sexies|septies|octies|nonies|decies)\b)?|\.\.\.))\s*$",
+    re.M | re.I,
+)
+# Bloques de referencias cruzadas ("CONCORDANCIAS:" seguido de "CÓDIGO CIVIL (LIBRO I), Arts. 62, 233")
+RE_CONCORDANCIAS = re.compile(r"^\s*CONCORDANCIAS:\s*\n(?:[^\n]*\bArts?\.[\d\s,.]*\n|[\d\s,.]+\n)*", re.M)
+
+
+def limpiar(texto: str, quitar_concordancias: bool = True) -> str:
+    texto = RE_RUIDO.sub("", texto)
+    texto = RE_ARTICULO_DESPLAZADO.sub(lambda m: f"{m.group(2).strip()}{m.group(1).strip()}", texto)
+    texto = re.sub(r"[ \t]+", " ", texto)
+    texto = re.sub(r"\n\s*\n+", "\n", texto)
+    if quitar_concordancias:
+        texto = RE_CONCORDANCIAS.sub("", texto + "\n")
+    return texto.strip()
+
+
+def _titulo_encabezado(texto: str, inicio: int, fin: int) -> Tuple[str, int]:
+    """Devuelve el encabezado con su rótulo (líneas siguientes en mayúsculas) y dónde termina."""
+    encabezado = texto[inicio:fin].strip()
+    for _ in range(2):
+        salto = texto.find("\n", fin)
+        if salto < 0:
+            break
+        final_linea = texto.find("\n", salto + 1)
+        final_linea = len(texto) if final_linea < 0 else final_linea
+        linea = texto[salto + 1 : final_linea].strip()
+        if not linea or len(linea) > 120 or linea.upper() != linea or RE_ARTICULO.match(linea):
+            break
+        if any(patron.match(linea) for patron in RE_ENCABEZADO.values()) or RE_DISPOSICIONES.match(linea):
+            break
+        encabezado = f"{encabezado} {linea}"
+        fin = final_linea
+    return encabezado, fin
+
+
+def _partir(texto: str, max_caracteres: int) -> List[str]:
+    """Parte un texto largo por párrafos (y por oraciones si hace falta) sin superar `max_caracteres`."""
+    if len(texto) <= max_caracteres:
+        return [texto]
+    partes: List[str] = []
+    actual = ""
+    for unidad in re.split(r"(?<=\n)|(?<=[.;:])\s+", texto):
+        if len(unidad) > max_caracteres:
+            # Lo acumulado va antes que los trozos de la unidad, para conservar el orden del texto
+            if actual.strip():
+                partes.append(actual.strip())
+            actual = ""
+            while len(unidad) > max_caracteres:
+                partes.append(unidad[:max_caracteres])
+                unidad = unidad[max_caracteres:]
+        if actual and len(actual) + len(unidad) + 1 > max_caracteres:
+            partes.append(actual.strip())
+            actual = ""
+        actual = f"{actual} {unidad}" if actual else unidad
+    if actual.strip():
+        partes.append(actual.strip())
+    return partes
+
+
+def _entero(numero: str) -> int:
+    return int(re.match(r"\d+", numero).group(0))
+
+
+def marcas_articulo(texto: str) -> List[Tuple[int, int, str, bool]]:
+    """Comienzos de artículo de `texto`: (inicio, fin, número, repetido).
+
+    Se descartan las citas ("Art. 148.- de la Constitución: ...") que rompen la numeración y las
+    repeticiones seguidas del mismo número (texto reformado y anterior), que quedan en un solo
+    artículo. Si un número aparece más veces (leyes anexas, disposiciones reformatorias), solo la
+    primera aparición que sigue la numeración queda con `repetido=False`.
+    """
+    articulos: List[Tuple[int, int, str, bool]] = []
+    ultimo_numero, anterior = "0", 0
+    innumerados = 0
+    for m in RE_ARTICULO.finditer(texto):
+        if m.group("innumerado"):
+            innumerados += 1
+            articulos.append((m.start(), m.end(), f"{ultimo_numero}.{innumerados}", True))
+            continue
+        numero = m.group("numero")
+        if m.group("sufijo"):
+            numero = f"{numero} {m.group('sufijo').lower()}"
+        elif m.group("letra"):
+            numero = f"{numero}-{m.group('letra').lower()}"
+        secuencial = anterior <= _entero(numero) <= anterior + 1
+        if numero == ultimo_numero or (RE_CITA.match(texto, m.end()) and not secuencial):
+            continue
+        articulos.append((m.start(), m.end(), numero, secuencial))
+        ultimo_numero, anterior, innumerados = numero, _entero(numero), 0
+
+    preferidos: Dict[str, int] = {}
+    for i, (_, _, numero, secuencial) in enumerate(articulos):
+        # En la numeración con el artículo anterior y también con el siguiente
+        if secuencial and (i + 1 == len(articulos) or _entero(articulos[i + 1][2]) >= _entero(numero)):
+            preferidos.setdefault(numero, i)
+    for i, (_, _, numero, _) in enumerate(articulos):
+        preferidos.setdefault(numero, i)
+    return [(inicio, fin, numero, preferidos[numero] != i) for i, (inicio, fin, numero, _) in enumerate(articulos)]
+
+
+class ChunkingLegal(ChunkingStrategy):
+    """Estrategia de fragmentación con un fragmento por artículo."""
+
+    def __init__(self, max_caracteres: int = 6000, incluir_contexto: bool = True):
+        self.max_caracteres = max_caracteres
+        # Antepone "CÓDIGO > Libro > Título > Art. N" al texto para mejorar la búsqueda
+        self.incluir_contexto = incluir_contexto
+
+    def chunk(self, document: Document) -> List[Document]:
+        pagina = document.meta_data.get("page", 1)
+        return self.dividir(document.name or "documento", document.content, [(0, pagina)], document.meta_data)
+
+    def dividir(
+        self,
+        codigo: str,
+        texto: str,
+        paginas: List[Tuple[int, int]],
+        meta_data: Optional[Dict] = None,
+    ) -> List[Document]:
+        """Divide `texto` en artículos.
+
+        Args:
+            codigo: nombre del código (p. ej. "COIP").
+            texto: texto completo, ya limpio.
+            paginas: pares (desplazamiento, número de página) ordenados, para ubicar cada artículo.
+        """
+        desplazamientos = [d for d, _ in paginas]
+
+        def pagina_de(posicion: int) -> int:
+            return paginas[max(bisect_right(desplazamientos, posicion) - 1, 0)][1]
+
+        # Marcas ordenadas: encabezados jerárquicos, disposiciones y artículos
+        marcas: List[Tuple[int, int, str, str]] = []
+        for nivel, patron in RE_ENCABEZADO.items():
+            for m in patron.finditer(texto):
+                titulo, fin = _titulo_encabezado(texto, m.start(), m.end())
+                marcas.append((m.start(), fin, nivel, titulo))
+        for m in RE_DISPOSICIONES.finditer(texto):
+            marcas.append((m.start(), m.end(), "disposiciones", m.group(0).strip()))
+        repetidos = set()
+        for inicio, fin, numero, repetido in marcas_articulo(texto):
+            marcas.append((inicio, fin, "articulo", numero))
+            if repetido:
+                repetidos.add(inicio)
+        marcas.sort(key=lambda marca: marca[0])
+
+        jerarquia: Dict[str, str] = {}
+        fragmentos: List[Document] = []
+        # Bloque en curso: (inicio, tipo, número de artículo)
+        bloque: Tuple[int, str, Optional[str]] = (0, "preambulo", None)
+        contexto_bloque: Dict[str, str] = {}
+
+        def cerrar(fin: int) -> None:
+            inicio, tipo, numero = bloque
+            contenido = texto[inicio:fin].strip()
+            if not contenido:
+                return
+            # El tope incluye la cabecera de contexto que se antepone a cada parte
+            cabecera = self._cabecera(codigo, contexto_bloque, numero, MAX_PARTES, MAX_PARTES)
+            limite = max(self.max_caracteres - len(cabecera) - 1, 1) if cabecera is not None else self.max_caracteres
+            partes = _partir(contenido, limite)
+            for indice, parte in enumerate(partes, start=1):
+                fragmentos.append(
+                    self._documento(
+                        codigo, tipo, numero, dict(contexto_bloque), parte, pagina_de(inicio), indice, len(partes), meta_data, inicio in repetidos
+                    )
+                )
+
+        for inicio, fin, tipo, valor in marcas:
+            if tipo in NIVELES or tipo == "disposiciones":
+                cerrar(inicio)
+                if tipo == "disposiciones":
+                    jerarquia = {"disposiciones": valor}
+                else:
+                    # Un encabezado reinicia los niveles inferiores
+                    jerarquia.pop("disposiciones", None)
+                    for nivel in NIVELES[NIVELES.index(tipo):]:
+                        jerarquia.pop(nivel, None)
+                    jerarquia[tipo] = valor
+                # Los encabezados no forman parte del texto del artículo siguiente
+                bloque = (fin, "disposiciones" if "disposiciones" in jerarquia else "encabezado", None)
+                contexto_bloque = dict(jerarquia)
+            else:
+                cerrar(inicio)
+                bloque = (inicio, "articulo", valor)
+                contexto_bloque = dict(jerarquia)
+        cerrar(len(texto))
+        return fragmentos
+
+    def _documento(
+        self,
+        codigo: str,
+        tipo: str,
+        numero: Optional[str],
+        jerarquia: Dict[str, str],
+        contenido: str,
+        pagina: int,
+        parte: int,
+        total_partes: int,
+        meta_data: Optional[Dict],
+        repetido: bool = False,
+    ) -> Document:
+        meta = {**(meta_data or {}), "codigo": codigo, "tipo": tipo, "jerarquia": _ruta(jerarquia), "page": pagina, **jerarquia}
+        if numero is not None:
+            meta["articulo"] = numero
+        if repetido:
+            # Otra aparición del mismo número (ley anexa, texto citado): el índice de artículos la ignora
+            meta["repetido"] = True
+        if total_partes > 1:
+            meta["parte"] = parte
+            meta["partes"] = total_partes
+        cabecera = self._cabecera(codigo, jerarquia, numero, parte, total_partes)
+        if cabecera is not None:
+            contenido = f"{cabecera}\n{contenido}"
+        return Document(name=codigo, meta_data=meta, content=contenido)
+
+    def _cabecera(self, codigo: str, jerarquia: Dict[str, str], numero: Optional[str], parte: int, total_partes: int) -> Optional[str]:
+        if not self.incluir_contexto:
+            return None
+        cabecera = " > ".join(x for x in (codigo, _ruta(jerarquia)) if x)
+        if numero is not None and parte > 1:
+            cabecera = f"{cabecera} > Art. {numero} (continuación {parte}/{total_partes})"
+        return cabecera
+
+
+def _ruta(jerarquia: Dict[str, str]) -> str:
+    return " > ".join(jerarquia[n] for n in (*NIVELES, "disposiciones") if n in jerarquia)
+
+
+def fragmentar_articulos(codigo: str, paginas: List[Document], estrategia: Optional[ChunkingLegal] = None) -> List[Document]:
+    """Une las páginas de un PDF y lo divide en artículos que pueden cruzar saltos de página."""
+    estrategia = estrategia or ChunkingLegal()
+    partes: List[str] = []
+    desplazamientos: List[Tuple[int, int]] = []
+    posicion = 0
+    for pagina in paginas:
+        texto = limpiar(pagina.content or "")
+        if not texto:
+            continue
+        desplazamientos.append((posicion, pagina.meta_data.get("page", len(desplazamientos) + 1)))
+        partes.append(texto)
+        posicion += len(texto) + 1
+    if not partes:
+        return []
+    return estrategia.dividir(codigo, "\n".join(partes), desplazamientos)
@@ -0,0 +1,242 @@
+"""Índice exacto (código, número de artículo) -> texto, construido durante la ingesta.
+
+Las consultas que nombran una disposición ("artículo 140 del COIP", "Art. 66 Constitución")
+se resuelven con una búsqueda en un diccionario en memoria, sin embeddings ni PgVector.
+El índice se guarda comprimido en `datos/indice_articulos.json.gz` y se recarga solo si
+el archivo cambia (p. ej. tras una nueva ingesta).
+"""
+
+import gzip
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from agno.document import Document
+from agno.tools import Toolkit
+from agno.utils.log import log_debug, log_info
+
+from configuracion import INDICE_ARTICULOS_PATH
+from fragmentador_legal import ChunkingLegal, fragmentar_articulos
+
+# Nombres con los que los usuarios se refieren a cada código (clave: nombre del PDF sin extensión)
+ALIAS_CODIGOS: Dict[str, Tuple[str, ...]] = {
+    "CONSTITUCION": ("constitucion", "constitucion de la republica", "constitucion del ecuador", "cre"),
+    "COIP": ("coip", "codigo organico integral penal", "codigo penal"),
+    "CODIGO CIVIL": ("codigo civil", "cc"),
+    "CODIGO TRABAJO": ("codigo del trabajo", "codigo de trabajo", "codigo laboral", "ct"),
+    "CODIGO NIÑEZ Y ADOLESCENCIA": ("codigo de la ninez y adolescencia", "codigo de la ninez", "codigo ninez y adolescencia", "cna", "cona"),
+    "CODIGO TRIBUTARIO": ("codigo tributario",),
+    "COFJ": ("cofj", "codigo organico de la funcion judicial"),
+    "COGP": ("cogep", "cogp", "codigo organico general de procesos"),
+    "CPCCS": ("cpccs", "ley organica del consejo de participacion ciudadana y control social", "ley del cpccs"),
+    "LOGJCC": ("logjcc", "ley organica de garantias jurisdiccionales y control constitucional"),
+    "LOSEP": ("losep", "ley organica del servicio publico"),
+    "LOSNCP": ("losncp", "ley organica del sistema nacional de contratacion publica", "ley de contratacion publica"),
+    "LOTAIP": ("lotaip", "ley organica de transparencia y acceso a la informacion publica", "ley de transparencia"),
+    "LOTTTSV": ("lotttsv", "ley organica de transporte terrestre transito y seguridad vial", "ley de transito"),
+    "LSPE": ("lspe", "ley de seguridad publica y del estado"),
+    "RCJG": ("rcjg", "reglamento de consultorios juridicos gratuitos", "reglamento consultorios juridicos gratuitos"),
+    "RGLOTAIP": ("rglotaip", "reglamento a la lotaip", "reglamento general a la ley de transparencia"),
+    "RLOSEP": ("rlosep", "reglamento a la losep", "reglamento general a la ley organica del servicio publico"),
+}
+
+NUMERO_ARTICULO = r"\d+(?:\.\d+)*(?:\s*(?:bis|ter|quater|quinquies|sexies|septies|octies|nonies|decies)\b)?"
+RE_NUMERO = re.compile(NUMERO_ARTICULO)
+
+# Una cita con uno o varios números: "art. 10", "arts. 10 y 11", "artículos 10, 11 y 12", "10 al 12"
+# (tras `normalizar` las comas son espacios)
+RE_REFERENCIA = re.compile(
+    r"\bart(?:iculos?|s?\.|s)?\s*(?:n[°o.]\s*)?"
+    rf"(?P<numeros>{NUMERO_ARTICULO}(?:\s+(?:(?:y|e|al|a|hasta)\s+)?(?:n[°o.]\s*)?{NUMERO_ARTICULO})*)",
+)
+RE_RANGO = re.compile(r"\b(?P<desde>\d+)\s+(?:al|a|hasta)\s+(?:n[°o.]\s*)?(?P<hasta>\d+)\b(?!\.\d|\s*(?:bis|ter)\b)")
+
+# Artículos como máximo que se expanden de un rango ("10 al 12"); uno mayor se toma por sus extremos
+MAX_RANGO = 20
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con espacios simples, para comparar nombres de códigos."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s.°]", " ", texto)).strip()
+
+
+def normalizar_numero(numero: str) -> str:
+    return re.sub(r"\s+", " ", numero.strip().lower())
+
+
+def resolver_codigo(texto: str) -> Optional[str]:
+    """Identifica el código mencionado en `texto` (el alias más largo que aparezca)."""
+    # Sin puntuación: "del COIP." o "Constitución," también deben coincidir con el alias
+    sin_puntuacion = re.sub(r"[^\w\s]", " ", normalizar(texto))
+    texto = f" {' '.join(sin_puntuacion.split())} "
+    mejor: Optional[Tuple[int, str]] = None
+    for codigo, alias in ALIAS_CODIGOS.items():
+        for nombre in (normalizar(codigo), *alias):
+            if f" {nombre} " in texto and (mejor is None or len(nombre) > mejor[0]):
+                mejor = (len(nombre), codigo)
+    return mejor[1] if mejor else None
+
+
+def numeros_citados(numeros: str) -> List[str]:
+    """Números de artículo de una cita, con los rangos cortos expandidos ("10 al 12" -> 10, 11, 12)."""
+    citados: List[str] = []
+    for parte in re.split(r"\s+(?:y|e)\s+|\s+(?=\d)", RE_RANGO.sub(_expandir_rango, numeros)):
+        citados.extend(normalizar_numero(m.group(0)) for m in RE_NUMERO.finditer(parte))
+    return citados
+
+
+def _expandir_rango(m: re.Match) -> str:
+    desde, hasta = int(m.group("desde")), int(m.group("hasta"))
+    if not 0 < hasta - desde <= MAX_RANGO:
+        return f"{desde} {hasta}"
+    return " ".join(str(n) for n in range(desde, hasta + 1))
+
+
+def extraer_referencias(texto: str) -> List[Tuple[str, str]]:
+    """Devuelve las referencias (código, artículo) explícitas en una consulta."""
+    codigo = resolver_codigo(texto)
+    if codigo is None:
+        return []
+    normalizado = normalizar(texto)
+    referencias = [(codigo, numero) for m in RE_REFERENCIA.finditer(normalizado) for numero in numeros_citados(m.group("numeros"))]
+    return list(dict.fromkeys(referencias))
+
+
+def entradas_de_codigo(codigo: str, paginas: List[Document]) -> Dict[str, Dict]:
+    """Artículos completos de un código, sin partir y sin la cabecera de contexto."""
+    estrategia = ChunkingLegal(max_caracteres=10**9, incluir_contexto=False)
+    entradas: Dict[str, Dict] = {}
+    fragmentos = [f for f in fragmentar_articulos(codigo, paginas, estrategia) if f.meta_data.get("articulo") is not None]
+    apariciones = Counter(normalizar_numero(f.meta_data["articulo"]) for f in fragmentos)
+    for fragmento in fragmentos:
+        numero = fragmento.meta_data["articulo"]
+        if fragmento.meta_data.get("repetido"):
+            # Las demás apariciones del número (leyes anexas, disposiciones reformatorias) no se indexan
+            continue
+        entradas.setdefault(
+            normalizar_numero(numero),
+            {
+                "numero": numero,
+                "texto": fragmento.content,
+                "jerarquia": fragmento.meta_data.get("jerarquia", ""),
+                "pagina": fragmento.meta_data.get("page"),
+                # El número aparece más veces en el PDF: la entrada es la que sigue la numeración
+                **({"ambiguo": True} if apariciones[normalizar_numero(numero)] > 1 else {}),
+            },
+        )
+    return entradas
+
+
+class IndiceArticulos:
+    """Índice en memoria respaldado por un JSON comprimido."""
+
+    def __init__(self, ruta: Path = INDICE_ARTICULOS_PATH):
+        self.ruta = Path(ruta)
+        self.codigos: Dict[str, Dict[str, Dict]] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def cargar(self) -> "IndiceArticulos":
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.ruta)
+            except OSError:
+                return self
+            if mtime != self._mtime:
+                with gzip.open(self.ruta, "rt", encoding="utf-8") as f:
+                    self.codigos = json.load(f)["codigos"]
+                self._mtime = mtime
+                log_debug(f"Índice de artículos cargado: {sum(len(a) for a in self.codigos.values())} artículos")
+        return self
+
+    def guardar(self) -> None:
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.ruta.with_suffix(".tmp")
+        with gzip.open(temporal, "wt", encoding="utf-8") as f:
+            json.dump({"codigos": self.codigos}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporal, self.ruta)
+        log_info(f"Índice de artículos guardado en {self.ruta}")
+
+    def actualizar_codigo(self, codigo: str, paginas: List[Document]) -> None:
+        self.codigos[codigo] = entradas_de_codigo(codigo, paginas)
+
+    def eliminar_codigo(self, codigo: str) -> None:
+        self.codigos.pop(codigo, None)
+
+    def obtener(self, codigo: str, numero: str) -> Optional[Dict]:
+        self.cargar()
+        codigo_resuelto = codigo if codigo in self.codigos else resolver_codigo(codigo)
+        if codigo_resuelto is None:
+            return None
+        entrada = self.codigos.get(codigo_resuelto, {}).get(normalizar_numero(numero))
+        return {"codigo": codigo_resuelto, **entrada} if entrada else None
+
+    def buscar(self, consulta: str) -> List[Dict]:
+        """Resuelve las referencias explícitas de una consulta en lenguaje natural."""
+        resultados = []
+        for codigo, numero in extraer_referencias(consulta):
+            entrada = self.obtener(codigo, numero)
+            if entrada is not None:
+                resultados.append(entrada)
+        return resultados
+
+
+_indice: Optional[IndiceArticulos] = None
+
+
+def obtener_indice() -> IndiceArticulos:
+    """Índice compartido por el proceso, cargado la primera vez que se usa."""
+    global _indice
+    if _indice is None:
+        _indice = IndiceArticulos()
+    return _indice.cargar()
+
+
+def formatear(entrada: Dict) -> str:
+    ubicacion = f" ({entrada['jerarquia']})" if entrada.get("jerarquia") else ""
+    aviso = " [el número se repite en el código (leyes anexas o reformas); este es el de la numeración principal]" if entrada.get("ambiguo") else ""
+    return f"{entrada['codigo']}, Art. {entrada['numero']}{ubicacion}, pág. {entrada.get('pagina')}{aviso}:\n{entrada['texto']}"
+
+
+class ArticulosTools(Toolkit):
+    """Consulta directa de artículos por código y número, sin búsqueda vectorial."""
+
+    def __init__(self, indice: Optional[IndiceArticulos] = None):
+        super().__init__(name="articulos_tools")
+        self.indice = indice
+        self.register(self.consultar_articulo)
+        self.register(self.buscar_articulos_citados)
+
+    def _indice(self) -> IndiceArticulos:
+        return self.indice.cargar() if self.indice is not None else obtener_indice()
+
+    def consultar_articulo(self, codigo: str, numero: str) -> str:
+        """Devuelve el texto literal de un artículo de la legislación ecuatoriana.
+        Úsala primero cuando el usuario cite un artículo concreto (p. ej. "artículo 140 del COIP").
+
+        :param codigo: Código o ley, p. ej. "COIP", "Constitución", "Código del Trabajo", "LOSEP".
+        :param numero: Número del artículo, p. ej. "140", "66", "15.1", "10 bis".
+        :return: El texto del artículo con su ubicación, o un aviso si no existe en la base.
+        """
+        entrada = self._indice().obtener(codigo, numero)
+        if entrada is None:
+            return f"No se encontró el artículo {numero} de {codigo} en la base de conocimiento."
+        return formatear(entrada)
+
+    def buscar_articulos_citados(self, consulta: str) -> str:
+        """Extrae las citas de artículos de una consulta (p. ej. "Art. 66 Constitución") y devuelve sus textos.
+
+        :param consulta: Texto de la consulta del usuario.
+        :return: Los artículos encontrados, o un aviso si la consulta no cita ninguno.
+        """
+        entradas = self._indice().buscar(consulta)
+        if not entradas:
+            return "La consulta no cita artículos que existan en la base de conocimiento."
+        return "\n\n".join(formatear(entrada) for entrada in entradas)
@@ -0,0 +1,538 @@
+"""Gestión de los índices ANN (HNSW / IVFFlat) de la tabla `legislacion`.
+
+- `PgVectorIndexado`: PgVector cuya búsqueda híbrida parte de candidatos obtenidos con el
+  índice vectorial (`ORDER BY embedding <=> q LIMIT n`) y con el índice GIN de texto, en lugar
+  de puntuar la tabla completa; `ef_search`/`probes` se fijan por consulta con `SET LOCAL`.
+  Con `cuantizacion` los candidatos vectoriales salen de un índice sobre una expresión compacta
+  de `embedding` (`halfvec`, `binary_quantize(...)::bit` o `subvector(...)`), y la puntuación
+  final se calcula con los vectores completos.
+- `construir_indices`: crea o reconstruye (sin bloquear escrituras, con `CONCURRENTLY`) el índice
+  vectorial y el GIN de texto completo.
+- `tamano_indices`: bytes en disco de cada índice de la tabla.
+- `analizar`: `ANALYZE` de la tabla; la ingesta lo ejecuta al terminar.
+- `informe_recall`: recall@k (entre los `ANN_CANDIDATOS` que pide la búsqueda híbrida) y latencia
+  de la búsqueda aproximada frente a la exacta para varios valores de `ef_search`/`probes`,
+  opcionalmente sobre una copia sintética N veces mayor.
+
+Uso:
+    python indices_vectoriales.py construir [--tipo hnsw|ivfflat] [--reconstruir]
+    python indices_vectoriales.py analizar
+    python indices_vectoriales.py tamano
+    python indices_vectoriales.py informe [--k 5] [--consultas 50] [--escala 20]
+"""
+
+import argparse
+import time
+from math import sqrt
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from agno.document import Document
+from agno.utils.log import log_debug, log_info, logger
+from agno.vectordb.distance import Distance
+from agno.vectordb.pgvector import PgVector
+from agno.vectordb.pgvector.index import HNSW, Ivfflat
+from sqlalchemy import desc, func, literal_column, select, text, union
+
+from configuracion import (
+    ANN_CANDIDATOS,
+    EMBEDDINGS_DIMENSIONES_REDUCIDAS,
+    EMBEDDINGS_FACTOR_RERANK,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    HNSW_M,
+    INDICE_VECTORIAL,
+    IVFFLAT_LISTS,
+    IVFFLAT_PROBES,
+)
+from trazas import medir
+
+OPERADORES = {
+    Distance.cosine: "vector_cosine_ops",
+    Distance.l2: "vector_l2_ops",
+    Distance.max_inner_product: "vector_ip_ops",
+}
+
+
+# Límite de `hnsw.ef_search` en pgvector
+EF_SEARCH_MAXIMO = 1000
+
+# Distancia de pgvector -> (operador, clase de operadores) para `halfvec`
+OPERADORES_HALFVEC = {
+    Distance.cosine: ("<=>", "halfvec_cosine_ops"),
+    Distance.l2: ("<->", "halfvec_l2_ops"),
+    Distance.max_inner_product: ("<#>", "halfvec_ip_ops"),
+}
+
+
+def expresion_compacta(vector_db: "PgVectorIndexado", columna: str = "embedding") -> Optional[Dict[str, str]]:
+    """Expresión SQL compacta de `columna` según `vector_db.cuantizacion`, con su operador y clase de operadores.
+
+    Requiere pgvector >= 0.7. La misma expresión se usa en el índice y en el `ORDER BY`, para que
+    Postgres pueda usar el índice de expresión.
+    """
+    modo = vector_db.cuantizacion
+    if modo == "float32":
+        return None
+    if modo == "binario":
+        # Un bit de signo por dimensión: en embeddings densos (text-embedding-3 no tiene ceros) el
+        # Hamming entre signos ordena igual que el coseno ternario de la búsqueda local
+        return {"expresion": f"(binary_quantize({columna})::bit({vector_db.dimensions}))", "operador": "<~>", "operadores": "bit_hamming_ops"}
+    operador, operadores = OPERADORES_HALFVEC.get(vector_db.distance, OPERADORES_HALFVEC[Distance.cosine])
+    if modo == "float16":
+        return {"expresion": f"({columna}::halfvec({vector_db.dimensions}))", "operador": operador, "operadores": operadores}
+    dimensiones = min(vector_db.dimensiones_reducidas, vector_db.dimensions)
+    return {"expresion": f"(subvector({columna}, 1, {dimensiones})::halfvec({dimensiones}))", "operador": operador, "operadores": operadores}
+
+
+def ef_search_efectivo(ef_search: int, candidatos: int) -> int:
+    """`hnsw.ef_search` para pedir `candidatos` filas: HNSW nunca devuelve más de `ef_search` (máximo 1000)."""
+    return min(max(int(ef_search), int(candidatos)), EF_SEARCH_MAXIMO)
+
+
+def configurar_indice(tipo: str = INDICE_VECTORIAL) -> Optional[Union[HNSW, Ivfflat]]:
+    """Parámetros del índice vectorial según la configuración (`INDICE_VECTORIAL`)."""
+    if tipo == "hnsw":
+        return HNSW(m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, ef_search=HNSW_EF_SEARCH)
+    if tipo == "ivfflat":
+        return Ivfflat(lists=IVFFLAT_LISTS or 100, probes=IVFFLAT_PROBES, dynamic_lists=IVFFLAT_LISTS == 0)
+    if tipo in ("", "ninguno"):
+        return None
+    raise ValueError(f"INDICE_VECTORIAL desconocido: {tipo}")
+
+
+def distancia(vector_db: PgVector, query_embedding: List[float]):
+    """Expresión de distancia que usa el operador del índice vectorial."""
+    columna = vector_db.table.c.embedding
+    if vector_db.distance == Distance.l2:
+        return columna.l2_distance(query_embedding)
+    if vector_db.distance == Distance.max_inner_product:
+        return columna.max_inner_product(query_embedding)
+    return columna.cosine_distance(query_embedding)
+
+
+class PgVectorIndexado(PgVector):
+    """PgVector con búsqueda híbrida sobre candidatos ANN en lugar de un recorrido secuencial."""
+
+    def __init__(
+        self,
+        *args,
+        candidatos: int = ANN_CANDIDATOS,
+        cuantizacion: str = "float32",
+        dimensiones_reducidas: int = EMBEDDINGS_DIMENSIONES_REDUCIDAS,
+        factor_rerank: int = EMBEDDINGS_FACTOR_RERANK,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if cuantizacion not in ("float32", "float16", "binario", "reducido"):
+            # pgvector no tiene un tipo int8: su equivalente en tamaño más cercano es halfvec
+            raise ValueError(f"Cuantización no disponible en PgVector: {cuantizacion} (usa float16, binario o reducido)")
+        # Filas que aporta cada índice (vectorial y texto) antes de combinar las puntuaciones
+        self.candidatos = candidatos
+        self.cuantizacion = cuantizacion
+        self.dimensiones_reducidas = dimensiones_reducidas
+        # Con cuantización, candidatos de la primera pasada por resultado pedido
+        self.factor_rerank = factor_rerank
+
+    def _orden_vectorial(self, query_embedding: List[float], distancia_consulta):
+        """Orden de la primera pasada: la distancia completa o la de la expresión compacta del índice."""
+        compacta = expresion_compacta(self)
+        if compacta is None:
+            return distancia_consulta
+        consulta = expresion_compacta(self, columna=f"CAST(:consulta AS vector({self.dimensions}))")["expresion"]
+        return text(f"{compacta['expresion']} {compacta['operador']} {consulta}").bindparams(
+            consulta=str(np.asarray(query_embedding, dtype=np.float32).tolist())
+        )
+
+    def _fijar_parametros_busqueda(self, sess, candidatos: int) -> None:
+        if isinstance(self.vector_index, Ivfflat):
+            sess.execute(text(f"SET LOCAL ivfflat.probes = {int(self.vector_index.probes)}"))
+        elif isinstance(self.vector_index, HNSW):
+            sess.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search_efectivo(self.vector_index.ef_search, candidatos)}"))
+
+    def _ts_vector(self):
+        # La configuración va como literal para que coincida con la expresión del índice GIN
+        return func.to_tsvector(literal_column(f"'{self.content_language}'::regconfig"), self.table.c.content)
+
+    @medir("busqueda.pgvector")
+    def vector_search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        if self.cuantizacion == "float32":
+            return super().vector_search(query, limit=limit, filters=filters)
+        try:
+            query_embedding = self.embedder.get_embedding(query)
+            if query_embedding is None:
+                logger.error(f"Error getting embedding for Query: {query}")
+                return []
+
+            # Primera pasada sobre la expresión compacta, reordenada con la distancia completa
+            distancia_consulta = distancia(self, query_embedding)
+            por_vector = select(self.table.c.id).order_by(self._orden_vectorial(query_embedding, distancia_consulta))
+            if filters is not None:
+                por_vector = por_vector.where(self.table.c.filters.contains(filters))
+            n_vector = max(self.candidatos, limit * self.factor_rerank)
+            por_vector = por_vector.limit(n_vector).subquery("candidatos")
+            stmt = (
+                select(
+                    self.table.c.id,
+                    self.table.c.name,
+                    self.table.c.meta_data,
+                    self.table.c.content,
+                    self.table.c.embedding,
+                    self.table.c.usage,
+                )
+                .where(self.table.c.id.in_(select(por_vector.c.id)))
+                .order_by(distancia_consulta)
+                .limit(limit)
+            )
+            log_debug(f"Quantized vector search query: {stmt}")
+            with self.Session() as sess, sess.begin():
+                self._fijar_parametros_busqueda(sess, n_vector)
+                resultados = sess.execute(stmt).fetchall()
+        except Exception as e:
+            logger.error(f"Error performing quantized vector search: {e}")
+            return []
+
+        return [
+            Document(
+                id=r.id,
+                name=r.name,
+                meta_data=r.meta_data,
+                content=r.content,
+                embedder=self.embedder,
+                embedding=r.embedding,
+                usage=r.usage,
+            )
+            for r in resultados
+        ]
+
+    @medir("busqueda.pgvector")
+    def hybrid_search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        if self.vector_index is None:
+            return super().hybrid_search(query, limit=limit, filters=filters)
+        try:
+            query_embedding = self.embedder.get_embedding(query)
+            if query_embedding is None:
+                logger.error(f"Error getting embedding for Query: {query}")
+                return []
+
+            distancia_consulta = distancia(self, query_embedding)
+            ts_vector = self._ts_vector()
+            processed_query = self.enable_prefix_matching(query) if self.prefix_match else query
+            ts_query = func.websearch_to_tsquery(literal_column(f"'{self.content_language}'::regconfig"), processed_query)
+            n = max(self.candidatos, limit)
+            n_vector = n if self.cuantizacion == "float32" else max(n, limit * self.factor_rerank)
+
+            por_vector = select(self.table.c.id).order_by(self._orden_vectorial(query_embedding, distancia_consulta)).limit(n_vector)
+            por_texto = select(self.table.c.id).where(ts_vector.op("@@")(ts_query)).order_by(desc(func.ts_rank_cd(ts_vector, ts_query))).limit(n)
+            if filters is not None:
+                por_vector = por_vector.where(self.table.c.filters.contains(filters))
+                por_texto = por_texto.where(self.table.c.filters.contains(filters))
+            candidatos = union(por_vector, por_texto).subquery("candidatos")
+
+            if self.distance == Distance.max_inner_product:
+                vector_score = (distancia_consulta * -1 + 1) / 2
+            else:
+                vector_score = 1 / (1 + distancia_consulta)
+            hybrid_score = self.vector_score_weight * vector_score + (1 - self.vector_score_weight) * func.ts_rank_cd(ts_vector, ts_query)
+            stmt = (
+                select(
+                    self.table.c.id,
+                    self.table.c.name,
+                    self.table.c.meta_data,
+                    self.table.c.content,
+                    self.table.c.embedding,
+                    self.table.c.usage,
+                    hybrid_score.label("hybrid_score"),
+                )
+                .where(self.table.c.id.in_(select(candidatos.c.id)))
+                .order_by(desc("hybrid_score"))
+                .limit(limit)
+            )
+            log_debug(f"Hybrid ANN search query: {stmt}")
+            with self.Session() as sess, sess.begin():
+                self._fijar_parametros_busqueda(sess, n_vector)
+                resultados = sess.execute(stmt).fetchall()
+        except Exception as e:
+            logger.error(f"Error performing hybrid ANN search: {e}")
+            return []
+
+        return [
+            Document(
+                id=r.id,
+                name=r.name,
+                # La puntuación híbrida permite reordenar los pasajes al empaquetar el contexto
+                meta_data={**(r.meta_data or {}), "puntuacion": round(float(r.hybrid_score), 6)},
+                content=r.content,
+                embedder=self.embedder,
+                embedding=r.embedding,
+                usage=r.usage,
+            )
+            for r in resultados
+        ]
+
+
+# ---- mantenimiento ----
+
+
+def _conexion_autocommit(vector_db: PgVector):
+    return vector_db.db_engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def _existe_indice(conexion, esquema: str, nombre: str) -> bool:
+    return conexion.execute(
+        text("SELECT 1 FROM pg_indexes WHERE schemaname = :esquema AND indexname = :nombre"),
+        {"esquema": esquema, "nombre": nombre},
+    ).first() is not None
+
+
+def _crear_o_reemplazar(conexion, vector_db: PgVector, nombre: str, definicion: str, reconstruir: bool) -> bool:
+    """Crea el índice; si existe y se pide reconstruir, crea uno nuevo y lo intercambia sin bloquear la tabla."""
+    esquema = vector_db.schema
+    if _existe_indice(conexion, esquema, nombre):
+        if not reconstruir:
+            log_info(f"El índice {nombre} ya existe")
+            return False
+        nuevo = f"{nombre}_nuevo"
+        conexion.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{esquema}"."{nuevo}"'))
+        conexion.execute(text(f'CREATE INDEX CONCURRENTLY "{nuevo}" ON {vector_db.table.fullname} {definicion}'))
+        conexion.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{esquema}"."{nombre}"'))
+        conexion.execute(text(f'ALTER INDEX "{esquema}"."{nuevo}" RENAME TO "{nombre}"'))
+    else:
+        conexion.execute(text(f'CREATE INDEX CONCURRENTLY "{nombre}" ON {vector_db.table.fullname} {definicion}'))
+    return True
+
+
+def construir_indices(
+    vector_db: PgVector,
+    indice: Optional[Union[HNSW, Ivfflat]] = None,
+    reconstruir: bool = False,
+) -> Dict[str, Any]:
+    """Crea (o reconstruye) el índice vectorial y el GIN de texto completo de la tabla."""
+    indice = indice if indice is not None else vector_db.vector_index
+    operador = OPERADORES.get(vector_db.distance, "vector_cosine_ops")
+    columna, sufijo = "embedding", ""
+    compacta = expresion_compacta(vector_db) if isinstance(vector_db, PgVectorIndexado) else None
+    if compacta is not None:
+        # Índice sobre la expresión compacta: solo él tiene que caber en memoria
+        columna, operador, sufijo = compacta["expresion"], compacta["operadores"], f"_{vector_db.cuantizacion}"
+    resumen: Dict[str, Any] = {"tabla": vector_db.table.fullname}
+    inicio = time.perf_counter()
+    with _conexion_autocommit(vector_db) as conexion:
+        if indice is not None:
+            for clave, valor in (indice.configuration or {}).items():
+                conexion.execute(text(f"SET {clave} = '{valor}'"))
+            if isinstance(indice, HNSW):
+                nombre = indice.name or f"{vector_db.table_name}_hnsw{sufijo}_index"
+                definicion = f"USING hnsw ({columna} {operador}) WITH (m = {int(indice.m)}, ef_construction = {int(indice.ef_construction)})"
+                resumen.update(tipo="hnsw", m=indice.m, ef_construction=indice.ef_construction)
+            else:
+                filas = conexion.execute(select(func.count()).select_from(vector_db.table)).scalar() or 0
+                listas = indice.lists
+                if indice.dynamic_lists:
+                    # Recomendación de pgvector: filas/1000 hasta 1M de filas, raíz cuadrada después
+                    listas = max(int(filas / 1000), 1) if filas < 1_000_000 else max(int(sqrt(filas)), 1)
+                nombre = indice.name or f"{vector_db.table_name}_ivfflat{sufijo}_index"
+                definicion = f"USING ivfflat ({columna} {operador}) WITH (lists = {int(listas)})"
+                resumen.update(tipo="ivfflat", lists=listas, filas=filas)
+            if compacta is not None:
+                resumen["cuantizacion"] = vector_db.cuantizacion
+            resumen["indice"] = nombre
+            resumen["vectorial"] = _crear_o_reemplazar(conexion, vector_db, nombre, definicion, reconstruir)
+
+        nombre_gin = f"{vector_db.table_name}_content_gin_index"
+        definicion_gin = f"USING GIN (to_tsvector('{vector_db.content_language}'::regconfig, content))"
+        resumen["texto"] = _crear_o_reemplazar(conexion, vector_db, nombre_gin, definicion_gin, reconstruir)
+        conexion.execute(text(f"ANALYZE {vector_db.table.fullname}"))
+    resumen["segundos"] = round(time.perf_counter() - inicio, 2)
+    log_info(f"Índices de {vector_db.table.fullname}: {resumen}")
+    return resumen
+
+
+def tamano_indices(vector_db: PgVector) -> Dict[str, int]:
+    """Bytes en disco de cada índice de la tabla (`pg_relation_size`)."""
+    with vector_db.Session() as sess:
+        return {
+            fila.nombre: int(fila.bytes)
+            for fila in sess.execute(
+                text(
+                    "SELECT c.relname AS nombre, pg_relation_size(c.oid) AS bytes FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indrelid = CAST(:tabla AS regclass)"
+                ),
+                {"tabla": vector_db.table.fullname},
+            )
+        }
+
+
+def analizar(vector_db: PgVector) -> None:
+    """Actualiza las estadísticas del planificador tras cambios en la tabla."""
+    with _conexion_autocommit(vector_db) as conexion:
+        conexion.execute(text(f"ANALYZE {vector_db.table.fullname}"))
+    log_debug(f"ANALYZE {vector_db.table.fullname}")
+
+
+# ---- informe de recall frente a latencia ----
+
+
+def crear_tabla_escalada(vector_db: PgVector, factor: int, ruido: float = 0.02) -> PgVector:
+    """Copia sintética de la tabla con `factor` veces más filas (embeddings con ruido gaussiano aproximado)."""
+    escalada = PgVector(
+        table_name=f"{vector_db.table_name}_x{factor}",
+        schema=vector_db.schema,
+        db_engine=vector_db.db_engine,
+        embedder=vector_db.embedder,
+        distance=vector_db.distance,
+        vector_index=None,
+        content_language=vector_db.content_language,
+    )
+    escalada.drop()
+    escalada.create()
+    log_info(f"Generando {escalada.table.fullname} con {factor} copias de cada fila")
+    columnas = "id, name, meta_data, filters, content, embedding, usage, content_hash"
+    with vector_db.Session() as sess, sess.begin():
+        sess.execute(
+            text(
+                f"INSERT INTO {escalada.table.fullname} ({columnas}) "
+                f"SELECT t.id || '_x' || g, t.name, t.meta_data, t.filters, t.content, "
+                f"CASE WHEN g = 0 THEN t.embedding ELSE (SELECT array_agg(x + (random() + random() + random() - 1.5) * :ruido ORDER BY i) "
+                f"FROM unnest(t.embedding::real[]) WITH ORDINALITY AS u(x, i))::vector END, "
+                f"t.usage, t.content_hash || '_x' || g "
+                f"FROM {vector_db.table.fullname} t CROSS JOIN generate_series(0, :factor - 1) g"
+            ),
+            {"ruido": ruido, "factor": factor},
+        )
+    return escalada
+
+
+def _vecinos(sess, vector_db: PgVector, embedding, k: int) -> List[str]:
+    return [fila.id for fila in sess.execute(select(vector_db.table.c.id).order_by(distancia(vector_db, embedding)).limit(k))]
+
+
+def informe_recall(
+    vector_db: PgVector,
+    k: int = 5,
+    consultas: int = 50,
+    valores_ef_search: Sequence[int] = (10, 20, 40, 80, 160, 320),
+    valores_probes: Sequence[int] = (1, 2, 5, 10, 20, 50),
+    semilla: int = 42,
+    candidatos: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Recall@k y latencias de la búsqueda vectorial aproximada frente a la exacta.
+
+    Las consultas son embeddings de filas de la propia tabla elegidas al azar (sin llamar a la API).
+    Como en `PgVectorIndexado.hybrid_search`, la búsqueda aproximada pide `candidatos` filas al
+    índice (con `ef_search` de al menos ese valor) y el recall es la fracción del top-k exacto que
+    queda entre ellas, ya que después se reordenan con la distancia exacta.
+    """
+    candidatos = max(candidatos if candidatos is not None else getattr(vector_db, "candidatos", ANN_CANDIDATOS), k)
+    with vector_db.Session() as sess:
+        total = sess.execute(select(func.count()).select_from(vector_db.table)).scalar() or 0
+        if total == 0:
+            raise ValueError(f"La tabla {vector_db.table.fullname} está vacía")
+        sess.execute(text("SELECT setseed(:s)"), {"s": (semilla % 1000) / 1000})
+        filas = sess.execute(
+            select(vector_db.table.c.embedding).order_by(func.random()).limit(consultas)
+        ).fetchall()
+    muestras = [np.asarray(f.embedding, dtype=np.float32).tolist() for f in filas]
+
+    def medir(ajustes: List[str], n: int) -> Dict[str, Any]:
+        latencias, resultados = [], []
+        with vector_db.Session() as sess:
+            for embedding in muestras:
+                with sess.begin():
+                    for ajuste in ajustes:
+                        sess.execute(text(f"SET LOCAL {ajuste}"))
+                    inicio = time.perf_counter()
+                    resultados.append(_vecinos(sess, vector_db, embedding, n))
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+        return {
+            "p50_ms": round(float(np.percentile(latencias, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencias, 95)), 2),
+            "p99_ms": round(float(np.percentile(latencias, 99)), 2),
+            "resultados": resultados,
+        }
+
+    # Búsqueda exacta: sin índices, recorrido secuencial
+    exacta = medir(["enable_indexscan = off", "enable_bitmapscan = off"], k)
+    informe = [{"busqueda": "exacta", "parametro": None, "valor": None, "recall": 1.0, **_sin_resultados(exacta)}]
+
+    with vector_db.Session() as sess:
+        metodos = {
+            fila[0]
+            for fila in sess.execute(
+                text(
+                    "SELECT am.amname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "JOIN pg_am am ON am.oid = c.relam WHERE i.indrelid = CAST(:tabla AS regclass)"
+                ),
+                {"tabla": vector_db.table.fullname},
+            )
+        }
+    barridos = []
+    if "hnsw" in metodos:
+        # Valores por debajo de `candidatos` se elevan igual que en la búsqueda: se miden una vez
+        barridos += [("hnsw.ef_search", v) for v in sorted({ef_search_efectivo(v, candidatos) for v in valores_ef_search})]
+    if "ivfflat" in metodos:
+        barridos += [("ivfflat.probes", v) for v in valores_probes]
+    if not barridos:
+        logger.warning(f"{vector_db.table.fullname} no tiene índice vectorial; ejecuta `python indices_vectoriales.py construir`")
+
+    for parametro, valor in barridos:
+        medicion = medir([f"{parametro} = {int(valor)}"], candidatos)
+        aciertos = sum(len(set(a) & set(e)) for a, e in zip(medicion["resultados"], exacta["resultados"]))
+        recall = aciertos / max(sum(len(e) for e in exacta["resultados"]), 1)
+        informe.append(
+            {"busqueda": "ann", "parametro": parametro, "valor": valor, "candidatos": candidatos, "recall": round(recall, 4), **_sin_resultados(medicion)}
+        )
+    return informe
+
+
+def _sin_resultados(medicion: Dict[str, Any]) -> Dict[str, Any]:
+    return {clave: valor for clave, valor in medicion.items() if clave != "resultados"}
+
+
+def imprimir_informe(informe: List[Dict[str, Any]], filas: Optional[int] = None) -> None:
+    if filas is not None:
+        print(f"Filas: {filas}")
+    print(f"{'búsqueda':<8} {'parámetro':<16} {'valor':>6} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for fila in informe:
+        print(
+            f"{fila['busqueda']:<8} {fila['parametro'] or '-':<16} {fila['valor'] if fila['valor'] is not None else '-':>6} "
+            f"{fila['recall']:>7.3f} {fila['p50_ms']:>8.2f} {fila['p95_ms']:>8.2f} {fila['p99_ms']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    from configuracion import crear_vector_db
+
+    parser = argparse.ArgumentParser(description="Índices ANN de la tabla de la base de conocimiento")
+    subcomandos = parser.add_subparsers(dest="accion", required=True)
+    construir = subcomandos.add_parser("construir", help="Crea o reconstruye el índice vectorial y el GIN")
+    construir.add_argument("--tipo", choices=["hnsw", "ivfflat"], default=None, help="Por defecto, INDICE_VECTORIAL")
+    construir.add_argument("--reconstruir", action="store_true", help="Reemplaza los índices existentes")
+    subcomandos.add_parser("analizar", help="Ejecuta ANALYZE sobre la tabla")
+    subcomandos.add_parser("tamano", help="Tamaño en disco de los índices de la tabla")
+    informe = subcomandos.add_parser("informe", help="Recall frente a latencia de la búsqueda aproximada")
+    informe.add_argument("--k", type=int, default=5)
+    informe.add_argument("--consultas", type=int, default=50)
+    informe.add_argument("--candidatos", type=int, default=ANN_CANDIDATOS, help="Filas pedidas al índice, como en la búsqueda híbrida")
+    informe.add_argument("--escala", type=int, default=1, help="Mide sobre una copia sintética N veces mayor")
+    informe.add_argument("--tipo", choices=["hnsw", "ivfflat"], default=None, help="Índice para la copia escalada")
+    args = parser.parse_args()
+
+    vector_db = crear_vector_db()
+    if args.accion == "construir":
+        construir_indices(vector_db, configurar_indice(args.tipo) if args.tipo else None, reconstruir=args.reconstruir)
+    elif args.accion == "analizar":
+        analizar(vector_db)
+    elif args.accion == "tamano":
+        for nombre, bytes_indice in tamano_indices(vector_db).items():
+            print(f"{nombre:<48} {bytes_indice / 1024 / 1024:>10.1f} MB")
+    else:
+        objetivo = vector_db
+        if args.escala > 1:
+            objetivo = crear_tabla_escalada(vector_db, args.escala)
+            construir_indices(objetivo, configurar_indice(args.tipo or INDICE_VECTORIAL))
+        try:
+            imprimir_informe(informe_recall(objetivo, k=args.k, consultas=args.consultas, candidatos=args.candidatos), filas=objetivo.get_count())
+        finally:
+            if objetivo is not vector_db:
+                objetivo.drop()
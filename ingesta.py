@@ -0,0 +1,254 @@
+"""Ingesta incremental de los PDFs de `documentos/` hacia la tabla `legislacion`.
+
+Mantiene un manifiesto con el hash de cada archivo y de cada fragmento, de modo que
+solo se leen, embeben y escriben los fragmentos que cambiaron, y se eliminan las filas
+de los documentos que ya no existen.
+
+Uso:
+    python ingesta.py                # indexa solo lo que cambió
+    python ingesta.py --completa     # ignora el manifiesto y re-indexa todo
+    python ingesta.py --simular      # muestra el plan sin tocar la base de datos
+
+La lectura, los embeddings y la escritura se delegan en `motor_ingesta` (procesos para
+pypdf, lotes concurrentes para la API de embeddings y `COPY` para PgVector).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from agno.document import Document
+from agno.utils.log import log_info, logger
+
+from configuracion import (
+    DOCUMENTOS_PATH,
+    INDICE_ARTICULOS_PATH,
+    MANIFIESTO_PATH,
+    MODELO_EMBEDDINGS,
+    RECUPERACION_BACKEND,
+    RECUPERACION_LOCAL_PATH,
+    crear_vector_db,
+)
+from fragmentador_legal import fragmentar_articulos
+from indice_articulos import IndiceArticulos
+from indices_vectoriales import construir_indices
+from motor_ingesta import EmbedderPorLotes, Rendimiento, escribir_filas, extraer_paginas, hash_contenido
+
+VERSION_MANIFIESTO = 1
+# Identifica la estrategia de fragmentación; si cambia, todos los archivos se re-procesan
+ESTRATEGIA_FRAGMENTOS = "articulos-v1"
+
+
+def hash_archivo(ruta: Path) -> str:
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def cargar_manifiesto(ruta: Path = MANIFIESTO_PATH) -> Dict:
+    if ruta.exists():
+        with open(ruta, encoding="utf-8") as f:
+            manifiesto = json.load(f)
+        if manifiesto.get("version") == VERSION_MANIFIESTO:
+            return manifiesto
+        logger.warning(f"Manifiesto con versión distinta en {ruta}, se ignora")
+    return {"version": VERSION_MANIFIESTO, "archivos": {}}
+
+
+def guardar_manifiesto(manifiesto: Dict, ruta: Path = MANIFIESTO_PATH) -> None:
+    manifiesto["version_corpus"] = version_corpus(manifiesto)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    # Escritura atómica para no dejar un manifiesto a medias si se interrumpe
+    temporal = ruta.with_suffix(".tmp")
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(temporal, ruta)
+
+
+def version_corpus(manifiesto: Dict) -> str:
+    """Hash estable del corpus indexado (archivos, estrategia y modelo de embeddings)."""
+    sha = hashlib.sha256()
+    sha.update(f"{manifiesto.get('estrategia')}|{manifiesto.get('modelo')}".encode())
+    for nombre_archivo in sorted(manifiesto.get("archivos", {})):
+        sha.update(f"{nombre_archivo}:{manifiesto['archivos'][nombre_archivo]['sha256']}".encode())
+    return sha.hexdigest()[:16]
+
+
+def fragmentar(nombre: str, paginas: List[Document]) -> List[Document]:
+    """Divide las páginas de un PDF en artículos con ids derivados de su contenido.
+
+    Usar el hash del contenido como id hace que un artículo que no cambió conserve
+    su fila aunque se desplace de página en una reforma.
+    """
+    fragmentos: Dict[str, Document] = {}
+    for documento in fragmentar_articulos(nombre, paginas):
+        documento.id = f"{nombre}_{hash_contenido(documento.content)}"
+        fragmentos.setdefault(documento.id, documento)
+    return list(fragmentos.values())
+
+
+def eliminar_filas(vector_db, ids: Optional[List[str]] = None, nombre: Optional[str] = None, lote: int = 500) -> int:
+    """Elimina filas de la tabla por id o por nombre de documento."""
+    from sqlalchemy import delete
+
+    tabla = vector_db.table
+    eliminadas = 0
+    with vector_db.Session() as sess, sess.begin():
+        if nombre is not None:
+            eliminadas += sess.execute(delete(tabla).where(tabla.c.name == nombre)).rowcount or 0
+        ids = ids or []
+        for i in range(0, len(ids), lote):
+            stmt = delete(tabla).where(tabla.c.id.in_(ids[i : i + lote]))
+            eliminadas += sess.execute(stmt).rowcount or 0
+    return eliminadas
+
+
+def ingestar(
+    ruta_documentos: Path = DOCUMENTOS_PATH,
+    ruta_manifiesto: Path = MANIFIESTO_PATH,
+    ruta_indice: Path = INDICE_ARTICULOS_PATH,
+    completa: bool = False,
+    simular: bool = False,
+    vector_db=None,
+    procesos: Optional[int] = None,
+    concurrencia: int = 4,
+) -> Dict[str, float]:
+    """Sincroniza la tabla `legislacion` con los PDFs de `ruta_documentos`."""
+    manifiesto = cargar_manifiesto(ruta_manifiesto)
+    if completa or manifiesto.get("estrategia") != ESTRATEGIA_FRAGMENTOS or manifiesto.get("modelo") != MODELO_EMBEDDINGS:
+        if manifiesto["archivos"]:
+            log_info("Re-indexación completa: se ignora el manifiesto anterior")
+        # Sin entrada en el manifiesto, cada archivo borra sus filas por nombre antes de re-insertarse
+        descartados = manifiesto["archivos"]
+        manifiesto = {"version": VERSION_MANIFIESTO, "archivos": {}}
+    else:
+        descartados = {}
+    manifiesto["estrategia"] = ESTRATEGIA_FRAGMENTOS
+    manifiesto["modelo"] = MODELO_EMBEDDINGS
+
+    if vector_db is None and not simular:
+        vector_db = crear_vector_db()
+        if not vector_db.exists():
+            log_info("Creando tabla de la base de conocimiento")
+            vector_db.create()
+
+    estadisticas = {"sin_cambios": 0, "actualizados": 0, "eliminados": 0, "fragmentos_nuevos": 0, "fragmentos_borrados": 0}
+    rendimiento = Rendimiento()
+    pdfs = sorted(p for p in Path(ruta_documentos).glob("**/*.pdf"))
+    presentes = {str(ruta.relative_to(ruta_documentos)) for ruta in pdfs}
+
+    # 1. Detectar archivos modificados comparando el hash del PDF completo
+    modificados = {}
+    for ruta in pdfs:
+        nombre_archivo = str(ruta.relative_to(ruta_documentos))
+        sha = hash_archivo(ruta)
+        entrada = manifiesto["archivos"].get(nombre_archivo)
+        if entrada is not None and entrada.get("sha256") == sha:
+            estadisticas["sin_cambios"] += 1
+        else:
+            modificados[ruta] = sha
+
+    # Los códigos ausentes del índice de artículos se leen aunque no hayan cambiado
+    indice = IndiceArticulos(ruta_indice).cargar()
+    sin_indice = [ruta for ruta in pdfs if ruta not in modificados and ruta.stem not in indice.codigos]
+
+    # 2. Leer en paralelo solo los PDFs modificados (y los que faltan en el índice)
+    inicio = time.perf_counter()
+    paginas = extraer_paginas(list(modificados) + sin_indice, procesos=procesos)
+    rendimiento.paginas = sum(len(p) for p in paginas.values())
+    rendimiento.medir("lectura", inicio)
+
+    # 3. Fragmentar y comparar con los fragmentos del manifiesto
+    planes = []
+    for ruta, sha in modificados.items():
+        nombre_archivo = str(ruta.relative_to(ruta_documentos))
+        entrada = manifiesto["archivos"].get(nombre_archivo)
+        fragmentos = fragmentar(ruta.stem, paginas[ruta])
+        anteriores = set(entrada["fragmentos"]) if entrada else set()
+        actuales = {doc.id: hash_contenido(doc.content) for doc in fragmentos}
+        nuevos = [doc for doc in fragmentos if doc.id not in anteriores]
+        obsoletos = sorted(anteriores - set(actuales))
+        log_info(f"{nombre_archivo}: {len(nuevos)} fragmentos nuevos, {len(obsoletos)} obsoletos, {len(actuales) - len(nuevos)} sin cambios")
+        planes.append((ruta, nombre_archivo, sha, entrada, actuales, nuevos, obsoletos))
+        estadisticas["actualizados"] += 1
+        estadisticas["fragmentos_nuevos"] += len(nuevos)
+        estadisticas["fragmentos_borrados"] += len(obsoletos)
+
+    for ruta in list(modificados) + sin_indice:
+        indice.actualizar_codigo(ruta.stem, paginas[ruta])
+
+    if not simular:
+        # 4. Embeber todos los fragmentos nuevos en lotes concurrentes
+        EmbedderPorLotes(vector_db.embedder, concurrencia=concurrencia).embeber(
+            [doc for plan in planes for doc in plan[5]], rendimiento=rendimiento
+        )
+
+        # 5. Escribir archivo por archivo, guardando el manifiesto tras cada uno
+        for ruta, nombre_archivo, sha, entrada, actuales, nuevos, obsoletos in planes:
+            if entrada is None:
+                # Archivo sin historial: se limpian filas de cargas anteriores con ids por página
+                eliminar_filas(vector_db, nombre=ruta.stem)
+            if obsoletos:
+                eliminar_filas(vector_db, ids=obsoletos)
+            escribir_filas(vector_db, nuevos, rendimiento=rendimiento)
+            manifiesto["archivos"][nombre_archivo] = {"nombre": ruta.stem, "sha256": sha, "fragmentos": actuales}
+            # Se guarda tras cada archivo para que una interrupción no obligue a empezar de cero
+            guardar_manifiesto(manifiesto, ruta_manifiesto)
+
+    eliminados = {**descartados, **manifiesto["archivos"]}
+    for nombre_archivo in sorted(set(eliminados) - presentes):
+        entrada = eliminados[nombre_archivo]
+        log_info(f"{nombre_archivo}: eliminado del corpus, se borran {len(entrada['fragmentos'])} fragmentos")
+        if not simular:
+            eliminar_filas(vector_db, ids=sorted(entrada["fragmentos"]), nombre=entrada["nombre"])
+            indice.eliminar_codigo(entrada["nombre"])
+            manifiesto["archivos"].pop(nombre_archivo, None)
+            guardar_manifiesto(manifiesto, ruta_manifiesto)
+        estadisticas["eliminados"] += 1
+        estadisticas["fragmentos_borrados"] += len(entrada["fragmentos"])
+
+    if not simular:
+        guardar_manifiesto(manifiesto, ruta_manifiesto)
+        if modificados or sin_indice or estadisticas["eliminados"]:
+            indice.guardar()
+        if modificados or estadisticas["eliminados"]:
+            # Crea los índices que falten y actualiza las estadísticas del planificador
+            construir_indices(vector_db)
+        # La instantánea de búsqueda local se regenera si hubo cambios o si aún no existe
+        if RECUPERACION_BACKEND == "local" or RECUPERACION_LOCAL_PATH.exists():
+            from recuperacion_local import directorio_snapshot, exportar_snapshot
+
+            hubo_cambios = modificados or estadisticas["eliminados"] or directorio_snapshot(RECUPERACION_LOCAL_PATH) is None
+            if hubo_cambios:
+                exportar_snapshot(vector_db, RECUPERACION_LOCAL_PATH, ruta_manifiesto)
+    log_info(f"Ingesta terminada: {estadisticas}")
+    log_info(f"Rendimiento: {rendimiento.resumen()}")
+    return {**estadisticas, **rendimiento.resumen()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta incremental de la legislación en PgVector")
+    parser.add_argument("--documentos", type=Path, default=DOCUMENTOS_PATH, help="Carpeta con los PDFs")
+    parser.add_argument("--manifiesto", type=Path, default=MANIFIESTO_PATH, help="Ruta del manifiesto de hashes")
+    parser.add_argument("--indice", type=Path, default=INDICE_ARTICULOS_PATH, help="Ruta del índice exacto de artículos")
+    parser.add_argument("--completa", action="store_true", help="Re-indexa todo ignorando el manifiesto")
+    parser.add_argument("--simular", action="store_true", help="Muestra el plan sin escribir en la base")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos para leer PDFs (por defecto, uno por núcleo)")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Peticiones de embeddings simultáneas")
+    args = parser.parse_args()
+
+    ingestar(
+        args.documentos,
+        args.manifiesto,
+        args.indice,
+        completa=args.completa,
+        simular=args.simular,
+        procesos=args.procesos,
+        concurrencia=args.concurrencia,
+    )
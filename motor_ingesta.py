@@ -0,0 +1,306 @@
+"""Motor de ingesta: lectura de PDFs en paralelo, embeddings por lotes y escritura masiva.
+
+- Las páginas se extraen con pypdf repartidas en rangos sobre un pool de procesos,
+  así un código grande (COIP, Código Civil) no deja al resto de núcleos ociosos.
+- Los embeddings se piden en lotes acotados por número de textos y de tokens, con
+  concurrencia limitada y reintentos con backoff exponencial. Los tokens de cada texto se
+  estiman por caracteres: tokenizarlo solo para repartir los lotes costaba tanto como
+  prepararlos, y la API ya devuelve los tokens reales en `usage`.
+- Las filas se escriben con `COPY` a una tabla temporal y un único `INSERT ... ON CONFLICT`,
+  o con inserciones multi-fila si el driver no es psycopg 3.
+"""
+
+import hashlib
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from agno.document import Document
+from agno.utils.log import log_debug, log_info, logger
+
+PAGINAS_POR_TAREA = 50
+# Límites de la API de embeddings de OpenAI: 2048 entradas y ~300k tokens por petición
+MAX_TEXTOS_POR_LOTE = 512
+MAX_TOKENS_POR_LOTE = 200_000
+MAX_TOKENS_POR_TEXTO = 8191
+# Estimación prudente para repartir lotes: el texto legal en español ronda 4 caracteres por token
+# con cl100k_base; con 3 el lote queda del lado seguro incluso con muchas cifras y siglas
+CARACTERES_POR_TOKEN = 3
+
+
+def hash_contenido(contenido: str) -> str:
+    # Mismo hash que usa PgVector para la columna `content_hash`
+    return hashlib.md5(contenido.replace("\x00", "\ufffd").encode()).hexdigest()
+
+
+@dataclass
+class Rendimiento:
+    """Contadores de throughput de una ingesta."""
+
+    paginas: int = 0
+    fragmentos: int = 0
+    tokens: int = 0
+    filas: int = 0
+    segundos: Dict[str, float] = field(default_factory=dict)
+
+    def medir(self, etapa: str, inicio: float) -> None:
+        self.segundos[etapa] = self.segundos.get(etapa, 0.0) + (time.perf_counter() - inicio)
+
+    def resumen(self) -> Dict[str, float]:
+        lectura = self.segundos.get("lectura", 0.0)
+        embeddings = self.segundos.get("embeddings", 0.0)
+        escritura = self.segundos.get("escritura", 0.0)
+        return {
+            "paginas": self.paginas,
+            "fragmentos": self.fragmentos,
+            "tokens": self.tokens,
+            "filas": self.filas,
+            "paginas_por_s": round(self.paginas / lectura, 1) if lectura else 0.0,
+            "fragmentos_por_s": round(self.fragmentos / embeddings, 1) if embeddings else 0.0,
+            "tokens_por_s": round(self.tokens / embeddings, 1) if embeddings else 0.0,
+            "filas_por_s": round(self.filas / escritura, 1) if escritura else 0.0,
+            **{f"segundos_{etapa}": round(valor, 2) for etapa, valor in self.segundos.items()},
+        }
+
+
+# =========================
+# Lectura de PDFs en paralelo
+# =========================
+
+
+def _extraer_rango(ruta: str, inicio: int, fin: int) -> List[Tuple[int, str]]:
+    # Se ejecuta en un proceso hijo: debe ser una función de módulo para poder serializarse
+    from pypdf import PdfReader
+
+    lector = PdfReader(ruta)
+    return [(numero + 1, lector.pages[numero].extract_text() or "") for numero in range(inicio, fin)]
+
+
+def _contar_paginas(ruta: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(ruta).pages)
+
+
+def extraer_paginas(rutas: Sequence[Path], procesos: Optional[int] = None) -> Dict[Path, List[Document]]:
+    """Extrae el texto de cada página de varios PDFs repartiendo rangos de páginas entre procesos."""
+    paginas: Dict[Path, List[Document]] = {ruta: [] for ruta in rutas}
+    if not rutas:
+        return paginas
+
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        totales = dict(zip(rutas, pool.map(_contar_paginas, [str(r) for r in rutas])))
+        tareas = {}
+        for ruta, total in totales.items():
+            for inicio in range(0, total, PAGINAS_POR_TAREA):
+                fin = min(inicio + PAGINAS_POR_TAREA, total)
+                tareas[pool.submit(_extraer_rango, str(ruta), inicio, fin)] = ruta
+        for futuro, ruta in tareas.items():
+            for numero, texto in futuro.result():
+                paginas[ruta].append(
+                    Document(name=ruta.stem, id=f"{ruta.stem}_{numero}", meta_data={"page": numero}, content=texto)
+                )
+
+    for ruta in rutas:
+        paginas[ruta].sort(key=lambda doc: doc.meta_data["page"])
+    return paginas
+
+
+# =========================
+# Embeddings por lotes
+# =========================
+
+
+class EmbedderPorLotes:
+    """Envía los textos al endpoint de embeddings en lotes, con concurrencia acotada y reintentos."""
+
+    def __init__(
+        self,
+        embedder,
+        max_textos: int = MAX_TEXTOS_POR_LOTE,
+        max_tokens: int = MAX_TOKENS_POR_LOTE,
+        concurrencia: int = 4,
+        reintentos: int = 6,
+    ):
+        # La ingesta no pasa por la caché de consultas: se usa el embedder de OpenAI subyacente
+        self.embedder = getattr(embedder, "embedder", None) or embedder
+        self.max_textos = max_textos
+        self.max_tokens = max_tokens
+        self.concurrencia = concurrencia
+        self.reintentos = reintentos
+
+    @staticmethod
+    def estimar_tokens(texto: str) -> int:
+        return len(texto) // CARACTERES_POR_TOKEN + 1
+
+    def lotes(self, textos: Sequence[str]) -> List[Tuple[List[int], int]]:
+        """Agrupa los índices de `textos` en lotes que respetan los límites de la API."""
+        lotes: List[Tuple[List[int], int]] = []
+        actual: List[int] = []
+        tokens_actual = 0
+        for indice, texto in enumerate(textos):
+            tokens = min(self.estimar_tokens(texto), MAX_TOKENS_POR_TEXTO)
+            if actual and (len(actual) >= self.max_textos or tokens_actual + tokens > self.max_tokens):
+                lotes.append((actual, tokens_actual))
+                actual, tokens_actual = [], 0
+            actual.append(indice)
+            tokens_actual += tokens
+        if actual:
+            lotes.append((actual, tokens_actual))
+        return lotes
+
+    def _pedir(self, textos: List[str]) -> Tuple[List[List[float]], int]:
+        parametros = {"input": textos, "model": self.embedder.id, "encoding_format": "float"}
+        if self.embedder.id.startswith("text-embedding-3"):
+            parametros["dimensions"] = self.embedder.dimensions
+        if self.embedder.request_params:
+            parametros.update(self.embedder.request_params)
+
+        for intento in range(self.reintentos + 1):
+            try:
+                respuesta = self.embedder.client.embeddings.create(**parametros)
+                embeddings = [dato.embedding for dato in sorted(respuesta.data, key=lambda d: d.index)]
+                tokens = respuesta.usage.total_tokens if respuesta.usage else 0
+                return embeddings, tokens
+            except Exception as e:
+                if intento == self.reintentos or not _es_reintentable(e):
+                    raise
+                espera = min(60.0, 2**intento) + random.uniform(0, 1)
+                logger.warning(f"Error pidiendo embeddings ({e.__class__.__name__}), reintento en {espera:.1f}s")
+                time.sleep(espera)
+        raise RuntimeError("Reintentos de embeddings agotados")
+
+    def embeber(self, documentos: List[Document], rendimiento: Optional[Rendimiento] = None) -> None:
+        """Completa `embedding` y `usage` de cada documento."""
+        if not documentos:
+            return
+        inicio = time.perf_counter()
+        textos = [doc.content.replace("\x00", "\ufffd") for doc in documentos]
+        lotes = self.lotes(textos)
+        log_debug(f"Embebiendo {len(textos)} fragmentos en {len(lotes)} lotes")
+
+        tokens_totales = 0
+        with ThreadPoolExecutor(max_workers=self.concurrencia) as pool:
+            futuros = [(indices, pool.submit(self._pedir, [textos[i] for i in indices])) for indices, _ in lotes]
+            for indices, futuro in futuros:
+                embeddings, tokens = futuro.result()
+                tokens_totales += tokens
+                for indice, embedding in zip(indices, embeddings):
+                    documentos[indice].embedding = embedding
+                    documentos[indice].usage = {"total_tokens": tokens // max(len(indices), 1)}
+
+        if rendimiento is not None:
+            rendimiento.fragmentos += len(documentos)
+            rendimiento.tokens += tokens_totales
+            rendimiento.medir("embeddings", inicio)
+
+
+def _es_reintentable(error: Exception) -> bool:
+    try:
+        import openai
+    except ImportError:
+        return False
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+# =========================
+# Escritura masiva en PgVector
+# =========================
+
+COLUMNAS = ("id", "name", "meta_data", "filters", "content", "embedding", "usage", "content_hash")
+
+
+def _fila(doc: Document, content_hash: str, filtros: Optional[Dict]) -> Dict:
+    return {
+        "id": doc.id or content_hash,
+        "name": doc.name,
+        "meta_data": doc.meta_data,
+        "filters": filtros,
+        "content": doc.content.replace("\x00", "\ufffd"),
+        "embedding": doc.embedding,
+        "usage": doc.usage,
+        "content_hash": content_hash,
+    }
+
+
+def escribir_filas(vector_db, documentos: List[Document], filtros: Optional[Dict] = None, rendimiento: Optional[Rendimiento] = None) -> None:
+    """Inserta o actualiza documentos ya embebidos en la tabla de PgVector."""
+    if not documentos:
+        return
+    inicio = time.perf_counter()
+    filas = [_fila(doc, hash_contenido(doc.content), filtros) for doc in documentos]
+    try:
+        _escribir_con_copy(vector_db, filas)
+    except _CopyNoDisponible:
+        _escribir_multifila(vector_db, filas)
+    log_info(f"Escritas {len(filas)} filas en {vector_db.table.fullname}")
+    if rendimiento is not None:
+        rendimiento.filas += len(filas)
+        rendimiento.medir("escritura", inicio)
+
+
+class _CopyNoDisponible(Exception):
+    pass
+
+
+def _literal_vector(embedding: List[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+def _escribir_con_copy(vector_db, filas: List[Dict]) -> None:
+    conexion = vector_db.db_engine.raw_connection()
+    try:
+        driver = getattr(conexion, "driver_connection", None)
+        if driver is None or not hasattr(driver, "cursor") or not driver.__class__.__module__.startswith("psycopg"):
+            raise _CopyNoDisponible()
+        tabla = vector_db.table.fullname
+        columnas = ", ".join(COLUMNAS)
+        actualizar = ", ".join(f"{c} = EXCLUDED.{c}" for c in COLUMNAS if c != "id")
+        with driver.cursor() as cur:
+            if not hasattr(cur, "copy"):
+                raise _CopyNoDisponible()
+            cur.execute(f"CREATE TEMP TABLE _ingesta (LIKE {tabla} INCLUDING DEFAULTS) ON COMMIT DROP")
+            with cur.copy(f"COPY _ingesta ({columnas}) FROM STDIN") as copy:
+                for fila in filas:
+                    copy.write_row(
+                        (
+                            fila["id"],
+                            fila["name"],
+                            json.dumps(fila["meta_data"] or {}),
+                            json.dumps(fila["filters"]) if fila["filters"] is not None else None,
+                            fila["content"],
+                            _literal_vector(fila["embedding"]),
+                            json.dumps(fila["usage"]) if fila["usage"] is not None else None,
+                            fila["content_hash"],
+                        )
+                    )
+            cur.execute(
+                f"INSERT INTO {tabla} ({columnas}) SELECT {columnas} FROM _ingesta "
+                f"ON CONFLICT (id) DO UPDATE SET {actualizar}, updated_at = now()"
+            )
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        conexion.close()
+
+
+def _escribir_multifila(vector_db, filas: List[Dict], lote: int = 500) -> None:
+    from sqlalchemy import func
+    from sqlalchemy.dialects import postgresql
+
+    with vector_db.Session() as sess, sess.begin():
+        for i in range(0, len(filas), lote):
+            insert_stmt = postgresql.insert(vector_db.table).values(filas[i : i + lote])
+            upsert_stmt = insert_stmt.on_conflict_do_update(
+                index_elements=["id"],
+                set_={**{c: insert_stmt.excluded[c] for c in COLUMNAS if c != "id"}, "updated_at": func.now()},
+            )
+            sess.execute(upsert_stmt)
@@ -0,0 +1,148 @@
+"""Perfil de arranque: tiempo de importación y memoria (RSS) por componente.
+
+Importa los componentes en orden, en un proceso limpio, y mide cuánto añade cada uno al tiempo
+de arranque y a la memoria residente del worker. Con `--construir` también mide la
+construcción del equipo y de la app (necesita la base de datos). `--aislado` mide cada
+componente en su propio subproceso, es decir, su coste sin contar lo ya importado por los
+anteriores.
+
+Uso:
+    python perfil_arranque.py
+    python perfil_arranque.py --construir playgroundteam --json perfil.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+# (componente, módulos) en el orden en que los necesita el servidor
+COMPONENTES: List[Tuple[str, List[str]]] = [
+    ("fastapi", ["fastapi", "starlette.middleware.cors"]),
+    ("sqlalchemy + psycopg", ["sqlalchemy", "psycopg"]),
+    ("numpy", ["numpy"]),
+    ("agno (agentes y equipos)", ["agno.agent", "agno.team.team"]),
+    ("OpenAI", ["agno.models.openai", "agno.embedder.openai"]),
+    ("AWS Claude", ["agno.models.aws"]),
+    ("Tavily", ["agno.tools.tavily"]),
+    ("PgVector", ["agno.vectordb.pgvector"]),
+    ("storage Postgres", ["agno.storage.postgres"]),
+    ("Playground", ["agno.playground.playground", "agno.playground.serve"]),
+    (
+        "módulos de Veredix",
+        [
+            "configuracion",
+            "trazas",
+            "cache_embeddings",
+            "cache_respuestas",
+            "cache_busquedas",
+            "almacen_sesiones",
+            "indice_articulos",
+            "indices_vectoriales",
+            "enrutador",
+            "equipo_paralelo",
+            "servidor",
+        ],
+    ),
+]
+
+
+def rss_mb() -> float:
+    """Memoria residente actual del proceso en MB."""
+    try:
+        with open("/proc/self/status") as estado:
+            for linea in estado:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    # Sin /proc (macOS): el máximo, en bytes en macOS y en KB en Linux
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo / (1024 * 1024) if sys.platform == "darwin" else maximo / 1024
+
+
+def medir(nombre: str, paso: Callable[[], object]) -> Dict:
+    rss_antes = rss_mb()
+    inicio = time.perf_counter()
+    error = None
+    try:
+        paso()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "componente": nombre,
+        "ms": round((time.perf_counter() - inicio) * 1000, 1),
+        "rss_mb": round(rss_mb() - rss_antes, 1),
+        "rss_total_mb": round(rss_mb(), 1),
+        "error": error,
+    }
+
+
+def importar(modulos: List[str]) -> Callable[[], None]:
+    def paso():
+        for modulo in modulos:
+            importlib.import_module(modulo)
+
+    return paso
+
+
+def perfil(construir: str = None) -> List[Dict]:
+    """Mide los componentes de forma acumulada en este proceso."""
+    filas = [{"componente": "intérprete", "ms": 0.0, "rss_mb": round(rss_mb(), 1), "rss_total_mb": round(rss_mb(), 1), "error": None}]
+    for nombre, modulos in COMPONENTES:
+        filas.append(medir(nombre, importar(modulos)))
+    if construir:
+        modulo = importlib.import_module(construir)
+        construidos = {}
+        filas.append(medir(f"{construir}.crear_equipo()", lambda: construidos.update(equipo=modulo.crear_equipo())))
+        filas.append(medir(f"{construir}.crear_app()", modulo.crear_app))
+    return filas
+
+
+def perfil_aislado() -> List[Dict]:
+    """Mide cada componente en un subproceso propio."""
+    filas = []
+    for nombre, modulos in COMPONENTES:
+        codigo = (
+            "import json, perfil_arranque as p;"
+            f"print(json.dumps(p.medir({nombre!r}, p.importar({modulos!r}))))"
+        )
+        salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            filas.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+        except (IndexError, json.JSONDecodeError):
+            filas.append({"componente": nombre, "ms": None, "rss_mb": None, "rss_total_mb": None, "error": salida.stderr.strip()[-300:]})
+    return filas
+
+
+def imprimir(filas: List[Dict]) -> None:
+    print(f"{'componente':<34} {'ms':>9} {'+RSS MB':>9} {'RSS MB':>9}")
+    for fila in filas:
+        ms = "-" if fila["ms"] is None else f"{fila['ms']:.1f}"
+        rss = "-" if fila["rss_mb"] is None else f"{fila['rss_mb']:.1f}"
+        total = "-" if fila["rss_total_mb"] is None else f"{fila['rss_total_mb']:.1f}"
+        print(f"{fila['componente']:<34} {ms:>9} {rss:>9} {total:>9}")
+        if fila.get("error"):
+            print(f"    error: {fila['error'][:200]}")
+    medidas = [f["ms"] for f in filas if f["ms"] is not None]
+    print(f"{'total':<34} {sum(medidas):>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiempo de importación y memoria por componente del servidor")
+    parser.add_argument("--construir", default=None, help="Módulo de la app a construir, p. ej. playground o playgroundteam")
+    parser.add_argument("--aislado", action="store_true", help="Mide cada componente en un subproceso propio")
+    parser.add_argument("--json", default=None, help="Guarda el perfil en este archivo")
+    args = parser.parse_args()
+
+    filas = perfil_aislado() if args.aislado else perfil(args.construir)
+    imprimir(filas)
+    if args.json:
+        with open(args.json, "w") as archivo:
+            json.dump(filas, archivo, indent=2, ensure_ascii=False)
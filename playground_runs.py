@@ -0,0 +1,174 @@
+"""Utilidades para interceptar las ejecuciones del Playground (`POST /playground/{agents|teams}/{id}/runs`).
+
+`InterceptorRuns` es un middleware ASGI que lee el formulario de la petición (mensaje,
+stream, session_id, user_id, archivos) sin consumirlo, y permite a las subclases responder
+directamente o dejar pasar la petición al Playground capturando su respuesta.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from starlette.requests import Request
+
+RE_RUTA_RUN = re.compile(r"/playground/(?P<tipo>agents|teams)/(?P<entidad_id>[^/]+)/runs/?$")
+RE_SESSION_ID = re.compile(rb'"session_id":\s*"([^"]+)"')
+RE_RUN_ID = re.compile(rb'"run_id":\s*"([^"]+)"')
+RE_EVENTO = re.compile(r'"event"\s*:\s*"([^"]+)"')
+# RunEvent.run_error y RunEvent.run_cancelled de agno
+EVENTOS_FALLIDOS = ("RunError", "RunCancelled")
+
+
+@dataclass
+class SolicitudRun:
+    tipo: str
+    entidad_id: str
+    message: str
+    stream: bool
+    session_id: Optional[str]
+    user_id: Optional[str]
+    tiene_archivos: bool
+
+
+@dataclass
+class RespuestaCapturada:
+    """Respuesta del Playground tal como se envió al cliente."""
+
+    status: int
+    headers: List
+    cuerpos: List[bytes]
+
+    @property
+    def media_type(self) -> str:
+        for nombre, valor in self.headers:
+            if nombre.lower() == b"content-type":
+                return valor.decode()
+        return "application/json"
+
+    def ids(self) -> Dict[str, Optional[str]]:
+        """session_id y run_id generados por el Playground para esta ejecución."""
+        cuerpo = b"".join(self.cuerpos[:3])
+        sesion = RE_SESSION_ID.search(cuerpo)
+        run = RE_RUN_ID.search(cuerpo)
+        return {
+            "session_id": sesion.group(1).decode() if sesion else None,
+            "run_id": run.group(1).decode() if run else None,
+        }
+
+    def eventos(self) -> List[str]:
+        """Campo `event` de cada objeto JSON de la respuesta.
+
+        Sin stream el cuerpo es un solo JSON compacto; en streaming, objetos JSON con sangría uno
+        detrás de otro, que pueden llegar partidos entre varios cuerpos.
+        """
+        texto = b"".join(self.cuerpos).decode("utf-8", errors="replace")
+        decodificador = json.JSONDecoder()
+        eventos, posicion = [], 0
+        while True:
+            while posicion < len(texto) and texto[posicion].isspace():
+                posicion += 1
+            if posicion >= len(texto):
+                return eventos
+            try:
+                objeto, posicion = decodificador.raw_decode(texto, posicion)
+            except ValueError:
+                # Respuesta truncada o que no es JSON: se buscan los campos sueltos
+                return eventos + RE_EVENTO.findall(texto, posicion)
+            if isinstance(objeto, dict) and isinstance(objeto.get("event"), str):
+                eventos.append(objeto["event"])
+
+    def tiene_error(self) -> bool:
+        return self.status != 200 or any(evento in EVENTOS_FALLIDOS for evento in self.eventos())
+
+
+def _a_bool(valor: Optional[str], por_defecto: bool) -> bool:
+    if valor is None:
+        return por_defecto
+    return str(valor).lower() in ("true", "1", "yes", "on")
+
+
+class InterceptorRuns:
+    """Middleware ASGI base para las ejecuciones del Playground."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        ruta = RE_RUTA_RUN.search(scope["path"])
+        if ruta is None:
+            return await self.app(scope, receive, send)
+
+        # Se lee el cuerpo completo y se re-inyecta para el Playground
+        cuerpo = b""
+        while True:
+            mensaje = await receive()
+            cuerpo += mensaje.get("body", b"")
+            if not mensaje.get("more_body", False):
+                break
+
+        def nuevo_receive():
+            enviado = False
+
+            async def _receive():
+                nonlocal enviado
+                if not enviado:
+                    enviado = True
+                    return {"type": "http.request", "body": cuerpo, "more_body": False}
+                return await receive()
+
+            return _receive
+
+        formulario = await Request(scope, nuevo_receive()).form()
+        try:
+            archivos = [v for _, v in formulario.multi_items() if not isinstance(v, str)]
+            solicitud = SolicitudRun(
+                tipo=ruta.group("tipo"),
+                entidad_id=ruta.group("entidad_id"),
+                message=str(formulario.get("message") or ""),
+                stream=_a_bool(formulario.get("stream"), True),
+                session_id=formulario.get("session_id") or None,
+                user_id=formulario.get("user_id") or None,
+                tiene_archivos=bool(archivos),
+            )
+        finally:
+            await formulario.close()
+
+        await self.interceptar(solicitud, scope, nuevo_receive(), send)
+
+    async def interceptar(self, solicitud: SolicitudRun, scope, receive, send) -> None:
+        """Por defecto deja pasar la petición al Playground."""
+        await self.app(scope, receive, send)
+
+    async def ejecutar_y_capturar(self, scope, receive, send) -> RespuestaCapturada:
+        """Ejecuta el Playground reenviando la respuesta al cliente mientras la captura."""
+        capturada = RespuestaCapturada(status=500, headers=[], cuerpos=[])
+
+        async def _send(mensaje):
+            if mensaje["type"] == "http.response.start":
+                capturada.status = mensaje["status"]
+                capturada.headers = list(mensaje.get("headers", []))
+            elif mensaje["type"] == "http.response.body" and mensaje.get("body"):
+                capturada.cuerpos.append(mensaje["body"])
+            await send(mensaje)
+
+        await self.app(scope, receive, _send)
+        return capturada
+
+
+async def enviar_cuerpos(send, cuerpos: List[bytes], media_type: str, status: int = 200) -> None:
+    """Envía una respuesta (en streaming si hay varios cuerpos) con el formato del Playground."""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", media_type.encode())],
+        }
+    )
+    for i, cuerpo in enumerate(cuerpos):
+        await send({"type": "http.response.body", "body": cuerpo, "more_body": i < len(cuerpos) - 1})
+    if not cuerpos:
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
@@ -0,0 +1,634 @@
+"""Búsqueda en proceso sobre una copia local de la tabla `legislacion`.
+
+El corpus es pequeño y casi estático, así que en lugar de consultar PgVector por la red en
+cada búsqueda se exporta una instantánea a `datos/recuperacion_local/`. Cada exportación se
+escribe en su propio subdirectorio `v<marca>/`, que no se modifica después, y el archivo `actual`
+apunta al vigente. Así un proceso que recarga mientras se exporta abre siempre los archivos de una
+misma versión. Cada versión contiene:
+
+- `embeddings.npy`: matriz float32 contigua (normalizada), abierta con `np.load(mmap_mode="r")`,
+- `compacto_<modo>.npy`: copia compacta de la matriz para la primera pasada (ver abajo),
+- `documentos.jsonl`: id, nombre, metadatos, filtros y contenido de cada fila,
+- `tantivy/`: índice BM25 sobre el contenido (sin tildes) para la parte de texto completo,
+- `meta.json`: modelo, dimensiones, filas y versión del corpus.
+
+`VectorDbLocal` implementa la interfaz `VectorDb` de agno (solo lectura) y combina la similitud
+coseno con BM25 igual que la búsqueda híbrida de PgVector. La instantánea se regenera al final
+de `python ingesta.py` o con `python recuperacion_local.py`.
+
+Con `cuantizacion` distinta de "float32" la similitud se calcula en dos pasadas: primero sobre
+la copia compacta, que es la única que se mantiene en memoria, y después, con los vectores
+completos, solo para los `limit * factor_rerank` mejores candidatos (más los de BM25):
+
+- "float16": media precisión (1/2 del tamaño en disco); numpy no multiplica float16 con BLAS, así
+  que se decodifica a float32 al cargar y en memoria ocupa lo mismo que la matriz completa,
+- "int8": cada fila escalada a [-127, 127] (1/4),
+- "binario": dos planos de bits por dimensión, signo positivo y negativo (1/16); la similitud es
+  el coseno de los vectores ternarios (-1, 0, 1), que en embeddings densos equivale a la
+  distancia de Hamming entre signos y en vectores dispersos no premia las filas casi vacías,
+- "reducido": las primeras `dimensiones_reducidas` dimensiones renormalizadas; los embeddings
+  `text-embedding-3` se entrenan para que sus prefijos sigan siendo útiles (Matryoshka).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from agno.document import Document
+from agno.utils.log import log_debug, log_info, logger
+from agno.vectordb.base import VectorDb
+
+from configuracion import (
+    EMBEDDINGS_CUANTIZACION,
+    EMBEDDINGS_DIMENSIONES_REDUCIDAS,
+    EMBEDDINGS_FACTOR_RERANK,
+    MANIFIESTO_PATH,
+    RECUPERACION_LOCAL_PATH,
+    crear_vector_db,
+)
+from indice_articulos import normalizar
+from trazas import medir
+
+VERSION_SNAPSHOT = 1
+ARCHIVO_ACTUAL = "actual"
+
+CUANTIZACIONES = ("float32", "float16", "int8", "binario", "reducido")
+
+
+def _planos_bits(matriz: np.ndarray) -> np.ndarray:
+    """Planos de bits [positivos | negativos] de cada fila, rellenos a múltiplos de 8 bytes (vista uint64)."""
+    positivos = np.packbits(matriz > 0, axis=-1)
+    negativos = np.packbits(matriz < 0, axis=-1)
+    relleno = [(0, 0)] * (matriz.ndim - 1) + [(0, -positivos.shape[-1] % 8)]
+    return np.concatenate([np.pad(positivos, relleno), np.pad(negativos, relleno)], axis=-1)
+
+
+def _popcount(palabras: np.ndarray) -> np.ndarray:
+    return np.bitwise_count(palabras).sum(axis=-1, dtype=np.int32)
+
+
+class VectoresCompactos:
+    """Copia compacta de la matriz de embeddings (normalizada) para la primera pasada de la búsqueda."""
+
+    def __init__(self, modo: str, datos: np.ndarray, escala: Optional[np.ndarray] = None, dimensiones: Optional[int] = None):
+        self.modo = modo
+        self.datos = datos
+        self.escala = escala
+        # Dimensiones de los vectores originales (binario) o del prefijo (reducido)
+        self.dimensiones = dimensiones
+        # Matriz que recorre `puntuar`: float16 se decodifica una vez, convertirla en cada consulta cuesta ~10x
+        self.matriz = datos.astype(np.float32) if modo == "float16" else datos
+        # Bits activos de cada fila binaria, para normalizar la similitud
+        self.ocupados = _popcount(datos.view(np.uint64)) if modo == "binario" else None
+
+    @staticmethod
+    def nombre(modo: str, dimensiones_reducidas: int) -> str:
+        return f"reducido{dimensiones_reducidas}" if modo == "reducido" else modo
+
+    @classmethod
+    def desde_matriz(cls, matriz: np.ndarray, modo: str, dimensiones_reducidas: int = 256, bloque: int = 8192) -> "VectoresCompactos":
+        """Cuantiza la matriz por bloques, para no copiar entera en memoria una matriz mapeada."""
+        if modo not in CUANTIZACIONES or modo == "float32":
+            raise ValueError(f"Cuantización desconocida: {modo}")
+        filas, dimensiones = matriz.shape
+        if modo == "reducido":
+            dimensiones_reducidas = min(dimensiones_reducidas, dimensiones)
+        partes, escalas = [], []
+        for inicio in range(0, filas, bloque):
+            parte = np.asarray(matriz[inicio : inicio + bloque], dtype=np.float32)
+            if modo == "float16":
+                partes.append(parte.astype(np.float16))
+            elif modo == "int8":
+                maximos = np.abs(parte).max(axis=1, keepdims=True)
+                maximos[maximos == 0] = 1.0
+                partes.append(np.rint(parte / maximos * 127).astype(np.int8))
+                escalas.append((maximos[:, 0] / 127).astype(np.float32))
+            elif modo == "binario":
+                partes.append(_planos_bits(parte))
+            else:
+                prefijo = parte[:, :dimensiones_reducidas].copy()
+                normas = np.linalg.norm(prefijo, axis=1, keepdims=True)
+                np.divide(prefijo, normas, out=prefijo, where=normas > 0)
+                partes.append(prefijo)
+        ancho = {"float16": dimensiones, "int8": dimensiones, "binario": cls.ancho_binario(dimensiones), "reducido": dimensiones_reducidas}[modo]
+        tipo = {"float16": np.float16, "int8": np.int8, "binario": np.uint8, "reducido": np.float32}[modo]
+        datos = np.vstack(partes) if partes else np.zeros((0, ancho), dtype=tipo)
+        escala = (np.concatenate(escalas) if escalas else np.zeros(0, dtype=np.float32)) if modo == "int8" else None
+        return cls(modo, np.ascontiguousarray(datos), escala, dimensiones_reducidas if modo == "reducido" else dimensiones)
+
+    @staticmethod
+    def ancho_binario(dimensiones: int) -> int:
+        return 2 * ((dimensiones + 63) // 64) * 8
+
+    def guardar(self, ruta: Path) -> str:
+        nombre = self.nombre(self.modo, self.dimensiones)
+        np.save(ruta / f"compacto_{nombre}.npy", self.datos)
+        if self.escala is not None:
+            np.save(ruta / f"compacto_{nombre}_escala.npy", self.escala)
+        return nombre
+
+    @classmethod
+    def cargar(cls, ruta: Path, modo: str, dimensiones_reducidas: int, dimensiones: int) -> Optional["VectoresCompactos"]:
+        dimensiones_reducidas = min(dimensiones_reducidas, dimensiones)
+        nombre = cls.nombre(modo, dimensiones_reducidas)
+        try:
+            datos = np.load(ruta / f"compacto_{nombre}.npy")
+            escala = np.load(ruta / f"compacto_{nombre}_escala.npy") if modo == "int8" else None
+        except OSError:
+            return None
+        if modo == "binario" and datos.shape[1] != cls.ancho_binario(dimensiones):
+            # Exportada con otro formato de bits: se recalcula desde la matriz completa
+            return None
+        return cls(modo, datos, escala, dimensiones_reducidas if modo == "reducido" else dimensiones)
+
+    @property
+    def bytes(self) -> int:
+        """Bytes en memoria de lo que recorre la primera pasada."""
+        return int(self.matriz.nbytes + (self.escala.nbytes if self.escala is not None else 0))
+
+    def puntuar(self, vector: np.ndarray, bloque: int = 1024) -> np.ndarray:
+        """Similitud aproximada de cada fila con `vector` (normalizado), en la escala del coseno."""
+        if self.modo == "binario":
+            consulta = _planos_bits(vector).view(np.uint64)
+            mitad = len(consulta) // 2
+            positivos, negativos = consulta[:mitad], consulta[mitad:]
+            producto = np.empty(len(self.datos), dtype=np.int32)
+            for inicio in range(0, len(self.datos), bloque):
+                filas = self.datos[inicio : inicio + bloque].view(np.uint64)
+                filas_pos, filas_neg = filas[:, :mitad], filas[:, mitad:]
+                producto[inicio : inicio + bloque] = (
+                    _popcount(filas_pos & positivos) + _popcount(filas_neg & negativos)
+                    - _popcount(filas_pos & negativos) - _popcount(filas_neg & positivos)
+                )
+            normas = np.sqrt(self.ocupados.astype(np.float32) * max(int(_popcount(consulta)), 1))
+            return np.divide(producto, normas, out=np.zeros(len(producto), dtype=np.float32), where=normas > 0)
+        if self.modo == "float16":
+            return self.matriz @ vector
+        if self.modo == "reducido":
+            prefijo = vector[: self.dimensiones]
+            norma = np.linalg.norm(prefijo)
+            return self.matriz @ (prefijo / norma if norma else prefijo)
+        # int8: producto por bloques del tamaño de la caché convertidos a float32 (BLAS no opera en int8)
+        similitudes = np.empty(len(self.datos), dtype=np.float32)
+        for inicio in range(0, len(self.datos), bloque):
+            similitudes[inicio : inicio + bloque] = self.datos[inicio : inicio + bloque].astype(np.float32) @ vector
+        similitudes *= self.escala
+        return similitudes
+
+
+def _esquema_bm25():
+    import tantivy
+
+    constructor = tantivy.SchemaBuilder()
+    constructor.add_unsigned_field("posicion", stored=True)
+    constructor.add_text_field("texto")
+    return constructor.build()
+
+
+def escribir_snapshot(
+    filas: Iterable[Tuple[Dict[str, Any], Sequence[float]]],
+    ruta: Path,
+    modelo: Optional[str],
+    dimensiones: int,
+    version_corpus: Optional[str] = None,
+    cuantizaciones: Sequence[str] = (),
+    dimensiones_reducidas: int = EMBEDDINGS_DIMENSIONES_REDUCIDAS,
+) -> Dict[str, Any]:
+    """Escribe una instantánea a partir de pares (registro, embedding) y reemplaza la anterior.
+
+    Además de la matriz completa guarda la copia compacta de cada modo de `cuantizaciones`.
+    """
+    import tantivy
+
+    ruta = Path(ruta)
+    version = f"v{time.time_ns()}"
+    temporal = ruta / f"{version}.tmp"
+    (temporal / "tantivy").mkdir(parents=True)
+
+    vectores: List[np.ndarray] = []
+    indice = tantivy.Index(_esquema_bm25(), path=str(temporal / "tantivy"))
+    escritor = indice.writer(heap_size=128 * 1024 * 1024)
+    with open(temporal / "documentos.jsonl", "w", encoding="utf-8") as documentos:
+        for posicion, (registro, embedding) in enumerate(filas):
+            vectores.append(np.asarray(embedding, dtype=np.float32))
+            documentos.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            escritor.add_document(tantivy.Document(posicion=posicion, texto=normalizar(registro["content"] or "")))
+    escritor.commit()
+    escritor.wait_merging_threads()
+
+    matriz = np.vstack(vectores) if vectores else np.zeros((0, dimensiones or 0), dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    np.divide(matriz, normas, out=matriz, where=normas > 0)
+    np.save(temporal / "embeddings.npy", np.ascontiguousarray(matriz, dtype=np.float32))
+    compactos = []
+    for modo in dict.fromkeys(c for c in cuantizaciones if c != "float32"):
+        compactos.append(VectoresCompactos.desde_matriz(matriz, modo, dimensiones_reducidas).guardar(temporal))
+
+    meta = {
+        "version": VERSION_SNAPSHOT,
+        "directorio": version,
+        "modelo": modelo,
+        "dimensiones": int(matriz.shape[1]) if matriz.size else dimensiones,
+        "filas": int(matriz.shape[0]),
+        "version_corpus": version_corpus,
+        "compactos": compactos,
+        "creado": time.time(),
+    }
+    with open(temporal / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    # La versión se publica completa: primero el directorio y después el puntero `actual`
+    anterior = _version_actual(ruta)
+    os.replace(temporal, ruta / version)
+    puntero = ruta / f"{ARCHIVO_ACTUAL}.tmp"
+    puntero.write_text(version, encoding="utf-8")
+    os.replace(puntero, ruta / ARCHIVO_ACTUAL)
+
+    # Se conserva la versión anterior para los procesos que leyeron el puntero justo antes del
+    # cambio; el resto (incluida una instantánea con el formato sin versiones) se borra
+    for entrada in ruta.iterdir():
+        if entrada.name in (ARCHIVO_ACTUAL, version, anterior):
+            continue
+        if entrada.is_dir():
+            shutil.rmtree(entrada, ignore_errors=True)
+        else:
+            entrada.unlink(missing_ok=True)
+    return meta
+
+
+def _version_actual(ruta: Path) -> Optional[str]:
+    try:
+        return (Path(ruta) / ARCHIVO_ACTUAL).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def directorio_snapshot(ruta: Path) -> Optional[Path]:
+    """Directorio de la versión vigente de la instantánea, o None si no se ha exportado."""
+    ruta = Path(ruta)
+    version = _version_actual(ruta)
+    if version is not None:
+        return ruta / version
+    # Instantáneas exportadas antes de las versiones
+    return ruta if (ruta / "meta.json").exists() else None
+
+
+def exportar_snapshot(
+    vector_db=None,
+    ruta: Path = RECUPERACION_LOCAL_PATH,
+    ruta_manifiesto: Path = MANIFIESTO_PATH,
+    lote: int = 1000,
+    cuantizaciones: Sequence[str] = (EMBEDDINGS_CUANTIZACION,),
+) -> Dict[str, Any]:
+    """Copia la tabla de PgVector a una instantánea local (embeddings + documentos + BM25)."""
+    from sqlalchemy import select
+
+    inicio = time.perf_counter()
+    vector_db = vector_db or crear_vector_db()
+    try:
+        with open(ruta_manifiesto, encoding="utf-8") as f:
+            version = json.load(f).get("version_corpus")
+    except (OSError, ValueError):
+        version = None
+
+    tabla = vector_db.table
+    columnas = [tabla.c.id, tabla.c.name, tabla.c.meta_data, tabla.c.filters, tabla.c.content, tabla.c.embedding]
+    with vector_db.Session() as sesion:
+        filas = sesion.execute(select(*columnas).order_by(tabla.c.id).execution_options(yield_per=lote))
+        meta = escribir_snapshot(
+            (
+                (
+                    {"id": f.id, "name": f.name, "meta_data": f.meta_data or {}, "filters": f.filters or {}, "content": f.content},
+                    f.embedding,
+                )
+                for f in filas
+            ),
+            ruta,
+            modelo=getattr(vector_db.embedder, "id", None),
+            dimensiones=vector_db.dimensions,
+            version_corpus=version,
+            cuantizaciones=cuantizaciones,
+        )
+    log_info(f"Instantánea local exportada a {ruta}: {meta['filas']} filas en {time.perf_counter() - inicio:.1f}s")
+    return meta
+
+
+def snapshot_desde_documentos(documentos: List[Document], ruta: Path, embedder, cuantizaciones: Sequence[str] = ()) -> Dict[str, Any]:
+    """Instantánea a partir de documentos ya embebidos, sin pasar por Postgres (pruebas y benchmarks)."""
+    return escribir_snapshot(
+        (
+            (
+                {"id": d.id, "name": d.name, "meta_data": d.meta_data or {}, "filters": {}, "content": d.content},
+                d.embedding,
+            )
+            for d in documentos
+        ),
+        ruta,
+        modelo=getattr(embedder, "id", None),
+        dimensiones=embedder.dimensions,
+        cuantizaciones=cuantizaciones,
+    )
+
+
+class _Snapshot:
+    """Instantánea cargada en memoria: matriz mapeada, documentos e índice BM25."""
+
+    def __init__(self, ruta: Path):
+        import tantivy
+
+        self.ruta = ruta
+        self._compactos: Dict[str, VectoresCompactos] = {}
+        self._lock = threading.Lock()
+        with open(ruta / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.embeddings = np.load(ruta / "embeddings.npy", mmap_mode="r")
+        with open(ruta / "documentos.jsonl", encoding="utf-8") as f:
+            self.documentos = [json.loads(linea) for linea in f]
+        filas = self.meta.get("filas")
+        if filas is not None and not filas == self.embeddings.shape[0] == len(self.documentos):
+            raise ValueError(
+                f"Instantánea inconsistente en {ruta}: meta.json indica {filas} filas, "
+                f"embeddings.npy tiene {self.embeddings.shape[0]} y documentos.jsonl {len(self.documentos)}"
+            )
+        self.ids = {doc["id"]: i for i, doc in enumerate(self.documentos)}
+        self.nombres = {doc["name"] for doc in self.documentos}
+        self.bm25 = tantivy.Index.open(str(ruta / "tantivy"))
+
+    def compacto(self, modo: str, dimensiones_reducidas: int) -> VectoresCompactos:
+        """Copia compacta del modo pedido; si la exportación no la incluye, se calcula al cargar."""
+        nombre = VectoresCompactos.nombre(modo, dimensiones_reducidas)
+        if nombre not in self._compactos:
+            with self._lock:
+                if nombre not in self._compactos:
+                    compacto = VectoresCompactos.cargar(self.ruta, modo, dimensiones_reducidas, self.embeddings.shape[1])
+                    if compacto is None:
+                        log_info(f"La instantánea local no incluye los vectores {nombre}; se calculan al cargarla")
+                        compacto = VectoresCompactos.desde_matriz(self.embeddings, modo, dimensiones_reducidas)
+                    self._compactos[nombre] = compacto
+        return self._compactos[nombre]
+
+
+class VectorDbLocal(VectorDb):
+    """Búsqueda híbrida en proceso sobre la instantánea exportada de PgVector (solo lectura)."""
+
+    def __init__(
+        self,
+        ruta: Path = RECUPERACION_LOCAL_PATH,
+        embedder=None,
+        vector_score_weight: float = 0.5,
+        candidatos_bm25: int = 100,
+        cuantizacion: str = "float32",
+        dimensiones_reducidas: int = EMBEDDINGS_DIMENSIONES_REDUCIDAS,
+        factor_rerank: int = EMBEDDINGS_FACTOR_RERANK,
+    ):
+        if embedder is None:
+            from agno.embedder.openai import OpenAIEmbedder
+
+            embedder = OpenAIEmbedder()
+        if not 0 <= vector_score_weight <= 1:
+            raise ValueError("vector_score_weight debe estar entre 0 y 1")
+        if cuantizacion not in CUANTIZACIONES:
+            raise ValueError(f"Cuantización desconocida: {cuantizacion}")
+        self.ruta = Path(ruta)
+        self.embedder = embedder
+        self.dimensions = embedder.dimensions
+        self.vector_score_weight = vector_score_weight
+        self.candidatos_bm25 = candidatos_bm25
+        self.cuantizacion = cuantizacion
+        self.dimensiones_reducidas = dimensiones_reducidas
+        # Candidatos de la primera pasada por resultado pedido que se reordenan con los vectores completos
+        self.factor_rerank = factor_rerank
+        self._snapshot: Optional[_Snapshot] = None
+        self._directorio: Optional[Path] = None
+        self._lock = threading.Lock()
+
+    def cargar(self) -> Optional[_Snapshot]:
+        """Carga la instantánea (o la recarga si se publicó otra versión)."""
+        directorio = directorio_snapshot(self.ruta)
+        if directorio is None:
+            if self._snapshot is None:
+                logger.warning(f"No existe la instantánea local en {self.ruta}; ejecuta `python recuperacion_local.py`")
+            return self._snapshot
+        if directorio != self._directorio:
+            with self._lock:
+                if directorio != self._directorio:
+                    try:
+                        snapshot = _Snapshot(directorio)
+                    except (OSError, ValueError) as e:
+                        # Una exportación posterior pudo borrar esta versión; se reintenta en la próxima búsqueda
+                        logger.warning(f"No se pudo cargar la instantánea local {directorio}: {e}")
+                        return self._snapshot
+                    if snapshot.meta.get("dimensiones") not in (None, self.dimensions):
+                        logger.warning(
+                            f"La instantánea local tiene {snapshot.meta['dimensiones']} dimensiones y el embedder {self.dimensions}"
+                        )
+                    if self.cuantizacion != "float32":
+                        snapshot.compacto(self.cuantizacion, self.dimensiones_reducidas)
+                    self._snapshot, self._directorio = snapshot, directorio
+                    log_debug(f"Instantánea local cargada: {snapshot.meta['filas']} filas")
+        return self._snapshot
+
+    # ---- búsqueda ----
+
+    def _puntuaciones_bm25(self, snapshot: _Snapshot, query: str) -> np.ndarray:
+        puntuaciones = np.zeros(len(snapshot.documentos), dtype=np.float32)
+        texto = normalizar(query)
+        if not texto:
+            return puntuaciones
+        consulta, _ = snapshot.bm25.parse_query_lenient(texto, ["texto"])
+        buscador = snapshot.bm25.searcher()
+        for puntuacion, direccion in buscador.search(consulta, self.candidatos_bm25).hits:
+            puntuaciones[buscador.doc(direccion)["posicion"][0]] = puntuacion
+        maximo = puntuaciones.max()
+        return puntuaciones / maximo if maximo > 0 else puntuaciones
+
+    def _similitudes(
+        self,
+        snapshot: _Snapshot,
+        query: str,
+        limit: int,
+        filters: Optional[Dict[str, Any]] = None,
+        adicionales: Optional[np.ndarray] = None,
+    ) -> Optional[np.ndarray]:
+        """Similitud coseno con la consulta; con cuantización, -inf fuera de los candidatos reordenados."""
+        embedding = self.embedder.get_embedding(query)
+        if not embedding:
+            logger.error(f"Error getting embedding for Query: {query}")
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        vector = vector / norma if norma else vector
+        if self.cuantizacion == "float32":
+            return snapshot.embeddings @ vector
+
+        # Primera pasada sobre la copia compacta
+        aproximadas = snapshot.compacto(self.cuantizacion, self.dimensiones_reducidas).puntuar(vector)
+        mascara = self._mascara(snapshot, filters)
+        if mascara is not None:
+            aproximadas = np.where(mascara, aproximadas, -np.inf)
+        n = min(max(limit * self.factor_rerank, limit), len(aproximadas))
+        if n <= 0:
+            return aproximadas
+        candidatos = np.argpartition(-aproximadas, n - 1)[:n]
+        if adicionales is not None and len(adicionales):
+            candidatos = np.union1d(candidatos, adicionales)
+        # Segunda pasada: solo se leen de la matriz mapeada las filas candidatas, en orden
+        candidatos.sort()
+        similitudes = np.full(len(aproximadas), -np.inf, dtype=np.float32)
+        similitudes[candidatos] = snapshot.embeddings[candidatos] @ vector
+        return similitudes
+
+    def _mascara(self, snapshot: _Snapshot, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not filters:
+            return None
+        return np.fromiter(
+            (all(doc["filters"].get(k) == v for k, v in filters.items()) for doc in snapshot.documentos),
+            dtype=bool,
+            count=len(snapshot.documentos),
+        )
+
+    def _top(self, snapshot: _Snapshot, puntuaciones: np.ndarray, limit: int, filters: Optional[Dict[str, Any]]) -> List[Document]:
+        mascara = self._mascara(snapshot, filters)
+        if mascara is not None:
+            puntuaciones = np.where(mascara, puntuaciones, -np.inf)
+        limit = min(limit, len(puntuaciones))
+        if limit <= 0:
+            return []
+        mejores = np.argpartition(-puntuaciones, limit - 1)[:limit]
+        mejores = mejores[np.argsort(-puntuaciones[mejores])]
+        return [self._documento(snapshot.documentos[i], puntuaciones[i]) for i in mejores if np.isfinite(puntuaciones[i])]
+
+    @staticmethod
+    def _documento(registro: Dict[str, Any], puntuacion: float) -> Document:
+        meta_data = {**registro["meta_data"], "puntuacion": round(float(puntuacion), 6)}
+        return Document(id=registro["id"], name=registro["name"], meta_data=meta_data, content=registro["content"])
+
+    def vector_search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        snapshot = self.cargar()
+        if snapshot is None:
+            return []
+        similitudes = self._similitudes(snapshot, query, limit, filters)
+        return [] if similitudes is None else self._top(snapshot, similitudes, limit, filters)
+
+    def keyword_search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        snapshot = self.cargar()
+        if snapshot is None:
+            return []
+        puntuaciones = self._puntuaciones_bm25(snapshot, query)
+        return self._top(snapshot, np.where(puntuaciones > 0, puntuaciones, -np.inf), limit, filters)
+
+    def hybrid_search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        snapshot = self.cargar()
+        if snapshot is None:
+            return []
+        bm25 = self._puntuaciones_bm25(snapshot, query)
+        # Los aciertos de BM25 entran siempre en la segunda pasada, como en la unión de candidatos de PgVector
+        similitudes = self._similitudes(snapshot, query, limit, filters, adicionales=np.flatnonzero(bm25))
+        if similitudes is None:
+            return []
+        # Misma escala que PgVector: 1 / (1 + distancia coseno) para el vector, BM25 normalizado para el texto
+        puntuacion_vector = 1.0 / (2.0 - similitudes)
+        puntuaciones = self.vector_score_weight * puntuacion_vector + (1 - self.vector_score_weight) * bm25
+        if self.cuantizacion != "float32":
+            puntuaciones = np.where(np.isfinite(similitudes), puntuaciones, -np.inf)
+        return self._top(snapshot, puntuaciones, limit, filters)
+
+    @medir("busqueda.local")
+    def search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        inicio = time.perf_counter()
+        documentos = self.hybrid_search(query, limit=limit, filters=filters)
+        log_debug(f"Búsqueda local: {len(documentos)} documentos en {(time.perf_counter() - inicio) * 1000:.2f} ms")
+        return documentos
+
+    async def async_search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        # El embedding de la consulta es una llamada HTTP bloqueante: fuera del event loop
+        return await asyncio.to_thread(self.search, query, limit=limit, filters=filters)
+
+    def bytes_indice(self) -> Optional[int]:
+        """Memoria de los vectores que recorre la primera pasada de cada búsqueda."""
+        snapshot = self.cargar()
+        if snapshot is None:
+            return None
+        if self.cuantizacion == "float32":
+            return int(snapshot.embeddings.nbytes)
+        return snapshot.compacto(self.cuantizacion, self.dimensiones_reducidas).bytes
+
+    # ---- existencia ----
+
+    def exists(self) -> bool:
+        return directorio_snapshot(self.ruta) is not None
+
+    async def async_exists(self) -> bool:
+        return self.exists()
+
+    def doc_exists(self, document: Document) -> bool:
+        snapshot = self.cargar()
+        return snapshot is not None and document.id in snapshot.ids
+
+    async def async_doc_exists(self, document: Document) -> bool:
+        return self.doc_exists(document)
+
+    def name_exists(self, name: str) -> bool:
+        snapshot = self.cargar()
+        return snapshot is not None and name in snapshot.nombres
+
+    def id_exists(self, id: str) -> bool:
+        snapshot = self.cargar()
+        return snapshot is not None and id in snapshot.ids
+
+    # ---- escritura: la instantánea solo se modifica exportando desde PgVector ----
+
+    def _solo_lectura(self, operacion: str) -> None:
+        # Sin error: `AgentKnowledge.load()` llama a `create()`/`upsert()` y no debe tumbar al agente
+        logger.warning(
+            f"VectorDbLocal.{operacion} ignorado: la instantánea es de solo lectura. Indexa con "
+            "`python ingesta.py` y regenérala con `python recuperacion_local.py`"
+        )
+
+    def create(self) -> None:
+        if not self.exists():
+            self._solo_lectura("create")
+
+    async def async_create(self) -> None:
+        self.create()
+
+    def insert(self, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        self._solo_lectura("insert")
+
+    async def async_insert(self, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        self.insert(documents, filters)
+
+    def upsert(self, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        self._solo_lectura("upsert")
+
+    async def async_upsert(self, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        self.upsert(documents, filters)
+
+    def drop(self) -> None:
+        self._solo_lectura("drop")
+
+    async def async_drop(self) -> None:
+        self.drop()
+
+    def delete(self) -> bool:
+        return False
+
+    def upsert_available(self) -> bool:
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta la tabla `legislacion` a la instantánea de búsqueda local")
+    parser.add_argument("--ruta", type=Path, default=RECUPERACION_LOCAL_PATH, help="Carpeta de la instantánea")
+    parser.add_argument(
+        "--cuantizaciones", default=EMBEDDINGS_CUANTIZACION, help="Copias compactas a incluir, p. ej. int8,binario,reducido"
+    )
+    args = parser.parse_args()
+    exportar_snapshot(ruta=args.ruta, cuantizaciones=[c.strip() for c in args.cuantizaciones.split(",") if c.strip()])
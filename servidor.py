@@ -0,0 +1,230 @@
+"""Servidor de producción del Playground: varios workers de uvicorn con arranque en caliente.
+
+`serve_playground_app` levanta un solo proceso (y registra el endpoint en agno). Este módulo
+arranca `--workers` procesos de uvicorn con uvloop y httptools. Cada worker importa la app,
+prepara sus recursos antes de aceptar tráfico y se retira de forma ordenada:
+
+- `/health/live` responde siempre que el proceso esté vivo,
+- `/health/ready` responde 503 hasta que el worker llenó el pool de conexiones y calentó las
+  cachés (tabla vectorial, índice de artículos, embeddings y prototipos del enrutador), y de
+  nuevo 503 mientras se drena,
+- al recibir SIGTERM, el worker se marca como no listo durante `DRENAJE_PREVIO_SEGUNDOS` para que
+  el balanceador deje de enviarle peticiones. Después uvicorn deja de aceptar conexiones y espera
+  hasta `DRENAJE_SEGUNDOS` a que terminen las respuestas en curso (streams incluidos). Por último
+  se vacían las escrituras diferidas de las sesiones y se cierran los pools.
+
+Cada worker tiene sus propias métricas. Con más de un worker, `servir` define `METRICAS_DIR` (un
+directorio temporal si no se indicó otro) para que `/metrics` sume las de todos (ver trazas.py).
+Los contadores de `estadisticas()` de las cachés siguen siendo de cada worker.
+
+Uso: python servidor.py --app playgroundteam:app --workers 4
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import tempfile
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from agno.utils.log import log_debug, log_info, logger
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from trazas import span
+
+
+class EstadoServidor:
+    """Estado de preparación del worker."""
+
+    def __init__(self):
+        self.listo = False
+        self.drenando = False
+        self.pasos: Dict[str, Dict[str, Any]] = {}
+        self.inicio = time.monotonic()
+
+    def resumen(self) -> Dict[str, Any]:
+        return {
+            "listo": self.listo and not self.drenando,
+            "drenando": self.drenando,
+            "pid": os.getpid(),
+            "segundos_activo": round(time.monotonic() - self.inicio, 1),
+            "pasos": self.pasos,
+        }
+
+
+def llenar_pool(engine, conexiones: int) -> None:
+    """Abre `conexiones` conexiones a la vez y las devuelve al pool, para no pagarlas en la primera petición."""
+    from sqlalchemy import text
+
+    def abrir(_):
+        conexion = engine.connect()
+        conexion.execute(text("SELECT 1"))
+        return conexion
+
+    with ThreadPoolExecutor(max_workers=conexiones) as hilos:
+        abiertas = list(hilos.map(abrir, range(conexiones)))
+    for conexion in abiertas:
+        conexion.close()
+
+
+def recorrer_entidades(entidades: Iterable[Any]) -> List[Any]:
+    """Agentes y equipos junto con todos sus miembros."""
+    encontradas, pendientes = [], list(entidades)
+    while pendientes:
+        entidad = pendientes.pop(0)
+        if any(entidad is e for e in encontradas):
+            continue
+        encontradas.append(entidad)
+        pendientes.extend(getattr(entidad, "team", None) or [])
+        pendientes.extend(getattr(entidad, "members", None) or [])
+    return encontradas
+
+
+def _preparar(estado: EstadoServidor, pasos: Dict[str, Callable[[], Any]], obligatorios: Iterable[str]) -> None:
+    """Ejecuta los pasos de calentamiento; el worker queda listo si los obligatorios terminan bien."""
+    obligatorios = set(obligatorios)
+    correctos = True
+    for nombre, paso in pasos.items():
+        inicio = time.perf_counter()
+        try:
+            with span(f"arranque.{nombre}"):
+                paso()
+            estado.pasos[nombre] = {"ok": True, "segundos": round(time.perf_counter() - inicio, 3)}
+            log_debug(f"Arranque: {nombre} en {time.perf_counter() - inicio:.2f} s")
+        except Exception as e:
+            estado.pasos[nombre] = {"ok": False, "error": str(e)}
+            if nombre in obligatorios:
+                correctos = False
+                logger.error(f"Arranque: falló el paso obligatorio {nombre}: {e}")
+            else:
+                logger.warning(f"Arranque: falló el paso {nombre}: {e}")
+    estado.listo = correctos
+    log_info(f"Worker {os.getpid()} {'listo' if correctos else 'no listo'} en {time.monotonic() - estado.inicio:.1f} s")
+
+
+def _drenar_al_recibir_sigterm(estado: EstadoServidor, espera: float) -> None:
+    """Retrasa el manejador de SIGTERM de uvicorn mientras `/health/ready` responde 503."""
+    if espera <= 0:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+        original = signal.getsignal(signal.SIGTERM)
+    except (RuntimeError, ValueError):
+        return
+    if not callable(original):
+        return
+
+    def al_terminar(sig, frame):
+        if estado.drenando:
+            return
+        estado.drenando = True
+        log_info(f"Worker {os.getpid()} drenando: sale del balanceo durante {espera:g} s")
+        loop.call_soon_threadsafe(loop.call_later, espera, original, sig, frame)
+
+    try:
+        signal.signal(signal.SIGTERM, al_terminar)
+    except ValueError:
+        # Solo se pueden instalar manejadores desde el hilo principal
+        pass
+
+
+def registrar_arranque(
+    app,
+    pasos: Dict[str, Callable[[], Any]],
+    obligatorios: Iterable[str] = ("db",),
+    al_cerrar: Iterable[Callable[[], Any]] = (),
+    drenaje_previo: float = 0.0,
+) -> EstadoServidor:
+    """Registra los endpoints de salud, el calentamiento al arrancar y el cierre ordenado."""
+    estado = EstadoServidor()
+    app.state.estado_servidor = estado
+    al_cerrar = list(al_cerrar)
+
+    async def vivo(request: Request):
+        return JSONResponse({"vivo": True, "pid": os.getpid()})
+
+    async def listo(request: Request):
+        resumen = estado.resumen()
+        return JSONResponse(resumen, status_code=200 if resumen["listo"] else 503)
+
+    async def al_arrancar():
+        _drenar_al_recibir_sigterm(estado, drenaje_previo)
+        # uvicorn no acepta conexiones hasta que termina el arranque
+        await run_in_threadpool(_preparar, estado, pasos, obligatorios)
+
+    async def al_apagar():
+        estado.drenando = True
+        for cierre in al_cerrar:
+            try:
+                await run_in_threadpool(cierre)
+            except Exception as e:
+                logger.warning(f"Error al cerrar el worker: {e}")
+        log_info(f"Worker {os.getpid()} detenido")
+
+    app.add_api_route("/health/live", vivo, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/health/ready", listo, methods=["GET"], include_in_schema=False)
+    app.add_event_handler("startup", al_arrancar)
+    app.add_event_handler("shutdown", al_apagar)
+    return estado
+
+
+def preparar_metricas(workers: int) -> Optional[Path]:
+    """Directorio donde los workers vuelcan sus métricas, vacío al arrancar; ninguno con un solo worker."""
+    if workers <= 1 and not os.getenv("METRICAS_DIR"):
+        return None
+    directorio = Path(os.getenv("METRICAS_DIR") or tempfile.mkdtemp(prefix="veredix-metricas-"))
+    directorio.mkdir(parents=True, exist_ok=True)
+    # Los volcados de una ejecución anterior sumarían contadores de procesos que ya no existen
+    for volcado in directorio.glob("*.json"):
+        volcado.unlink()
+    # Los workers heredan el entorno del proceso principal
+    os.environ["METRICAS_DIR"] = str(directorio)
+    return directorio
+
+
+def servir(
+    app: str, host: str, port: int, workers: int, drenaje: float, limite_concurrencia: Optional[int] = None, fabrica: bool = False
+) -> None:
+    import uvicorn
+
+    directorio_metricas = preparar_metricas(workers)
+    log_info(f"Sirviendo {app} en http://{host}:{port} con {workers} workers")
+    if directorio_metricas is not None:
+        log_debug(f"Métricas de los workers en {directorio_metricas}")
+    uvicorn.run(
+        app,
+        host=host,
+        port=port,
+        workers=workers,
+        # "auto" usa uvloop y httptools (fijados en requirements.txt) y cae a asyncio/h11 si faltan
+        loop="auto",
+        http="auto",
+        lifespan="on",
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        timeout_keep_alive=15,
+        timeout_graceful_shutdown=int(drenaje),
+        limit_concurrency=limite_concurrencia,
+        backlog=2048,
+        factory=fabrica,
+    )
+
+
+if __name__ == "__main__":
+    from configuracion import DRENAJE_SEGUNDOS, SERVIDOR_WORKERS
+
+    parser = argparse.ArgumentParser(description="Servidor de producción del Playground de Veredix")
+    parser.add_argument("--app", default="playground:app", help="Aplicación a servir (módulo:variable)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--workers", type=int, default=SERVIDOR_WORKERS, help="Procesos de uvicorn (por defecto, uno por núcleo)")
+    parser.add_argument("--drenaje", type=float, default=DRENAJE_SEGUNDOS, help="Segundos de espera a las respuestas en curso al detenerse")
+    parser.add_argument("--factory", action="store_true", help="`--app` es una fábrica, p. ej. playgroundteam:crear_app")
+    parser.add_argument("--limite-concurrencia", type=int, default=None, help="Conexiones simultáneas por worker antes de responder 503")
+    args = parser.parse_args()
+    servir(args.app, args.host, args.port, args.workers, args.drenaje, args.limite_concurrencia, args.factory)
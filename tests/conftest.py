@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import JSON, Column, DateTime, MetaData, String, Table, Text, create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+# Los módulos del proyecto viven en la raíz del repositorio, sin paquete
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from indice_articulos import IndiceArticulos  # noqa: E402
+
+
+@pytest.fixture
+def indice(tmp_path):
+    """Índice de artículos pequeño guardado en disco: arts. 10, 11, 12, 66 y 140 de tres códigos."""
+    indice = IndiceArticulos(tmp_path / "indice_articulos.json.gz")
+    indice.codigos = {
+        codigo: {
+            numero: {"numero": numero, "texto": f"Art. {numero}.- Texto de {codigo}.", "jerarquia": "", "pagina": 1}
+            for numero in ("10", "11", "12", "66", "140")
+        }
+        for codigo in ("COIP", "CONSTITUCION", "CODIGO TRABAJO")
+    }
+    indice.guardar()
+    return IndiceArticulos(indice.ruta)
+
+
+@pytest.fixture
+def vector_db(tmp_path):
+    """Tabla `legislacion` en SQLite con las columnas de PgVector; el vector se guarda como JSON."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legislacion.db'}")
+    tabla = Table(
+        "legislacion",
+        MetaData(),
+        Column("id", String, primary_key=True),
+        Column("name", String),
+        Column("meta_data", JSON),
+        Column("filters", JSON),
+        Column("content", Text),
+        Column("embedding", JSON),
+        Column("usage", JSON),
+        Column("content_hash", String),
+        Column("updated_at", DateTime(timezone=True), onupdate=func.now()),
+    )
+    tabla.create(engine)
+    return SimpleNamespace(db_engine=engine, Session=sessionmaker(bind=engine), table=tabla)
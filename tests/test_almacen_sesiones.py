@@ -0,0 +1,177 @@
+import copy
+import threading
+
+import pytest
+from agno.storage.postgres import PostgresStorage
+from agno.storage.session.agent import AgentSession
+from sqlalchemy import MetaData, Table, create_engine, select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+
+from almacen_sesiones import PostgresStorageCompacto
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_en_sqlite(tipo, compilador, **kw):
+    return "JSON"
+
+
+def _crear_tabla_base(storage: PostgresStorageCompacto) -> None:
+    # La tabla de agno usa un DEFAULT propio de Postgres; el resto del SQL se ejecuta tal cual
+    columnas = [columna._copy() for columna in storage.table.columns]
+    for columna in columnas:
+        columna.server_default = None
+    Table(storage.table_name, MetaData(), *columnas).create(storage.db_engine, checkfirst=True)
+
+
+@pytest.fixture
+def nuevo_almacen(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sesiones.db'}")
+
+    def nuevo_almacen(**kwargs) -> PostgresStorageCompacto:
+        kwargs.setdefault("espera_reintento", 0)
+        storage = PostgresStorageCompacto("sesiones", schema=None, db_engine=engine, **kwargs)
+        _crear_tabla_base(storage)
+        return storage
+
+    return nuevo_almacen
+
+
+def conversar(storage, session_id, turnos, memoria=None):
+    """Simula `turnos` respuestas del agente sobre la sesión, como hace agno tras cada run."""
+    memoria = memoria if memoria is not None else {"runs": [], "messages": []}
+    for _ in range(turnos):
+        n = len(memoria["runs"]) + 1
+        mensajes = [
+            {"role": "user", "content": f"pregunta {n}"},
+            {"role": "assistant", "content": None, "tool_calls": [{"id": f"llamada-{n}"}]},
+            {"role": "tool", "content": "artículos recuperados " * 20},
+            {"role": "assistant", "content": f"respuesta {n} " * 10},
+        ]
+        memoria["runs"].append({"run_id": f"{session_id}-{n}", "messages": mensajes})
+        memoria["messages"] += [{"role": "user", "content": f"pregunta {n}"}, {"role": "assistant", "content": f"respuesta {n}"}]
+        sesion = AgentSession(session_id=session_id, user_id="usuario", memory={k: list(v) for k, v in memoria.items()})
+        storage.upsert(sesion)
+    return memoria
+
+
+def test_ida_y_vuelta_con_turnos_diferidos_y_compactacion(nuevo_almacen):
+    almacen = nuevo_almacen(compactar_cada=3, turnos_completos=1, max_caracteres_turno=20)
+    conversar(almacen, "s1", 5)
+    almacen.vaciar()
+
+    # Otro proceso, sin caché: la fila base más los turnos posteriores reconstruyen la sesión
+    leida = nuevo_almacen().read("s1")
+
+    runs = leida.memory["runs"]
+    assert [run["run_id"] for run in runs] == [f"s1-{n}" for n in range(1, 6)]
+    assert [m["content"] for m in leida.memory["messages"] if m["role"] == "user"] == [f"pregunta {n}" for n in range(1, 6)]
+    # Solo el último turno conserva las llamadas a herramientas; los anteriores quedan en pregunta y respuesta recortada
+    assert len(runs[-1]["messages"]) == 4
+    assert [[m["role"] for m in run["messages"]] for run in runs[:-1]] == [["user", "assistant"]] * 4
+    assert runs[0]["messages"][1]["content"] == "respuesta 1 respuest […]"
+    tabla = almacen._compartido.tabla_turnos
+    with almacen.Session() as sess:
+        assert [fila.indice for fila in sess.execute(select(tabla.c.indice).order_by(tabla.c.indice))] == [2, 3, 4, 5]
+
+
+def test_leer_una_sesion_no_espera_las_escrituras_de_otras(nuevo_almacen):
+    almacen = nuevo_almacen()
+    conversar(almacen, "lenta", 1)
+    conversar(almacen, "rapida", 1)
+    almacen.vaciar()
+    liberar, insertar = threading.Event(), almacen._insertar_sin_conflicto
+
+    def insertar_lento(filas):
+        liberar.wait(5)
+        return insertar(filas)
+
+    almacen._insertar_sin_conflicto = insertar_lento
+    conversar(almacen, "lenta", 1, {"runs": [{"run_id": "lenta-1"}], "messages": []})
+
+    # Sin caché (otra copia del proceso la invalidó) la lectura vuelve sin esperar a "lenta"
+    almacen._compartido.sesiones.clear()
+    assert nuevo_almacen().read("rapida") is not None
+    assert almacen.read("rapida").session_id == "rapida"
+    assert almacen._compartido.pendientes == {"lenta": 1}
+
+    liberar.set()
+    assert len(almacen.read("lenta").memory["runs"]) == 2
+
+
+def test_las_copias_por_peticion_no_registran_mas_vaciados(nuevo_almacen, monkeypatch):
+    registrados = []
+    monkeypatch.setattr("almacen_sesiones.atexit.register", registrados.append)
+    almacen = nuevo_almacen()
+
+    copias = [copy.deepcopy(almacen) for _ in range(3)]
+
+    assert len(registrados) == 1
+    assert all(copia._compartido is almacen._compartido for copia in copias)
+
+
+def test_un_fallo_transitorio_se_reintenta(nuevo_almacen):
+    almacen = nuevo_almacen()
+    conversar(almacen, "s1", 1)
+    fallos, insertar = [ConnectionError("conexión perdida")] * 2, almacen._insertar_sin_conflicto
+
+    def insertar_con_fallos(filas):
+        if fallos:
+            raise fallos.pop()
+        return insertar(filas)
+
+    almacen._insertar_sin_conflicto = insertar_con_fallos
+    conversar(almacen, "s1", 1, {"runs": [{"run_id": "s1-1"}], "messages": []})
+    almacen.vaciar()
+
+    assert [run["run_id"] for run in nuevo_almacen().read("s1").memory["runs"]] == ["s1-1", "s1-2"]
+    assert almacen.estadisticas()["escrituras_fallidas"] == 0
+
+
+def test_el_fallo_de_una_sesion_no_descarta_las_demas_y_la_marca_sucia(nuevo_almacen, monkeypatch):
+    almacen = nuevo_almacen(compactar_cada=1, reintentos_escritura=1)
+    conversar(almacen, "s1", 1)
+    conversar(almacen, "s2", 1)
+    almacen.vaciar()
+    upsert = PostgresStorage.upsert
+
+    def upsert_falla_s1(storage, sesion, *args, **kwargs):
+        return None if sesion.session_id == "s1" else upsert(storage, sesion, *args, **kwargs)
+
+    monkeypatch.setattr(PostgresStorage, "upsert", upsert_falla_s1)
+    conversar(almacen, "s1", 1, {"runs": [{"run_id": "s1-1"}], "messages": []})
+    conversar(almacen, "s2", 1, {"runs": [{"run_id": "s2-1"}], "messages": []})
+    almacen.vaciar()
+
+    assert len(nuevo_almacen().read("s2").memory["runs"]) == 2
+    assert almacen.estadisticas()["escrituras_fallidas"] == 1
+    assert almacen._compartido.sesiones[almacen._clave("s1")].sucia
+
+    # El siguiente turno reescribe la fila base aunque no tocara compactar
+    monkeypatch.setattr(PostgresStorage, "upsert", upsert)
+    almacen.compactar_cada = 100
+    conversar(almacen, "s1", 1, {"runs": [{"run_id": "s1-1"}, {"run_id": "s1-2"}], "messages": []})
+    almacen.vaciar()
+    leida = nuevo_almacen().read("s1")
+    assert leida.session_data["turnos_base"] == 3
+    assert not almacen._compartido.sesiones[almacen._clave("s1")].sucia
+
+
+def test_un_conflicto_de_indice_renumera_el_turno(nuevo_almacen):
+    almacen, otro_proceso = nuevo_almacen(verificar_version=False), nuevo_almacen()
+    memoria = conversar(almacen, "s1", 1)
+    almacen.vaciar()
+    # Otro proceso atiende la misma sesión y escribe el turno 2 antes
+    conversar(otro_proceso, "s1", 1, {"runs": list(memoria["runs"]), "messages": []})
+    otro_proceso.vaciar()
+
+    conversar(almacen, "s1", 1, memoria)
+    almacen.vaciar()
+
+    tabla = almacen._compartido.tabla_turnos
+    with almacen.Session() as sess:
+        filas = sess.execute(select(tabla.c.indice, tabla.c.run).order_by(tabla.c.indice)).fetchall()
+    assert [fila.indice for fila in filas] == [2, 3]
+    # La caché ya no refleja la sesión: la próxima lectura la reconstruye con los dos turnos
+    assert almacen._clave("s1") not in almacen._compartido.sesiones
+    assert len(almacen.read("s1").memory["runs"]) == 3
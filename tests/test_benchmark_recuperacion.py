@@ -0,0 +1,72 @@
+import json
+from dataclasses import asdict, replace
+
+import pytest
+from agno.document import Document
+
+from benchmark_recuperacion import Configuracion, EmbedderFalso, Pregunta, comparar, construir_backend, embeber, evaluar
+
+ARTICULOS = {
+    "47": "Toda persona trabajadora tendrá derecho a la jornada máxima de ocho horas diarias",
+    "69": "Las vacaciones anuales pagadas serán de quince días ininterrumpidos",
+    "111": "El décimo tercer sueldo se pagará hasta el veinticuatro de diciembre",
+    "169": "El contrato individual de trabajo termina por desahucio o despido",
+    "188": "La indemnización por despido intempestivo depende del tiempo de servicio",
+}
+PREGUNTAS = [
+    Pregunta("jornada máxima de horas diarias", [("CODIGO TRABAJO", "47")]),
+    Pregunta("cuántos días de vacaciones anuales", [("CODIGO TRABAJO", "69")]),
+    Pregunta("hasta cuándo se paga el décimo tercer sueldo", [("CODIGO TRABAJO", "111")]),
+    Pregunta("indemnización por despido intempestivo", [("CODIGO TRABAJO", "188")]),
+]
+
+
+class Invertida:
+    """Búsqueda rota a propósito: devuelve primero los fragmentos menos relevantes."""
+
+    def __init__(self, vector_db, total: int):
+        self.vector_db, self.total = vector_db, total
+
+    def hybrid_search(self, query, limit=5, filters=None):
+        return self.vector_db.hybrid_search(query, limit=self.total)[::-1][:limit]
+
+
+@pytest.fixture
+def ejecucion(tmp_path):
+    embedder = EmbedderFalso()
+    documentos = [
+        Document(id=f"ct-{numero}", name="CODIGO TRABAJO", content=f"Art. {numero}.- {texto}", meta_data={"articulo": numero})
+        for numero, texto in ARTICULOS.items()
+    ]
+    embeber(documentos, embedder)
+    configuracion = Configuracion(k=2)
+    vector_db = construir_backend(configuracion, documentos, embedder, tmp_path)
+    resultado = evaluar(configuracion, PREGUNTAS, vector_db, len(documentos))
+    # Mismo formato que escribe `--guardar`
+    referencia = json.loads(json.dumps({resultado.configuracion: asdict(resultado)}))
+    return configuracion, vector_db, resultado, referencia
+
+
+def test_comparar_sin_regresiones_en_la_misma_ejecucion(ejecucion):
+    configuracion, vector_db, resultado, referencia = ejecucion
+
+    repetido = evaluar(configuracion, PREGUNTAS, vector_db, len(ARTICULOS))
+
+    assert resultado.recall == 1.0
+    # Latencia fuera de la comparación: en una ejecución tan corta el p95 es ruido
+    assert comparar([repetido], referencia, tolerancia=0.02, factor_latencia=float("inf")) == []
+
+
+def test_comparar_detecta_caida_de_recall_y_de_latencia(ejecucion):
+    configuracion, vector_db, resultado, referencia = ejecucion
+
+    roto = evaluar(configuracion, PREGUNTAS, Invertida(vector_db, len(ARTICULOS)), len(ARTICULOS))
+    lento = replace(resultado, p95_ms=resultado.p95_ms * 3 + 1)
+
+    regresiones = comparar([roto], referencia, tolerancia=0.02, factor_latencia=float("inf"))
+    assert {regresion.split()[1] for regresion in regresiones} == {"recall", "acierto", "mrr"}
+    assert comparar([lento], referencia, tolerancia=0.02, factor_latencia=2.0) == [
+        f"{resultado.configuracion}: p95 {resultado.p95_ms}ms -> {lento.p95_ms}ms"
+    ]
+    # Las configuraciones sin referencia no se comparan
+    assert comparar([replace(roto, configuracion="otra")], referencia, tolerancia=0.02, factor_latencia=2.0) == []
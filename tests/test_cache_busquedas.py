@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from cache_busquedas import BackendSimulado, CacheBusquedas, TavilyCacheado
+
+
+class Reloj:
+    def __init__(self, ahora: float = 1000.0):
+        self.ahora = ahora
+
+    def __call__(self) -> float:
+        return self.ahora
+
+
+def test_ttl_corto_para_novedades_y_largo_para_el_resto():
+    reloj, backend = Reloj(), BackendSimulado()
+    cache = CacheBusquedas(backend=backend, ttl_segundos=3600, ttl_recientes_segundos=60, reloj=reloj)
+
+    cache.buscar("jornada laboral máxima")
+    cache.buscar("última reforma al COIP")
+    reloj.ahora += 61
+    cache.buscar("jornada laboral máxima")
+    cache.buscar("última reforma al COIP")
+    assert [consulta for consulta, _ in backend.llamadas] == ["jornada laboral máxima", "última reforma al COIP", "última reforma al COIP"]
+
+    reloj.ahora += 3600
+    cache.buscar("Jornada  laboral MÁXIMA")
+    assert len(backend.llamadas) == 4
+
+
+def test_parametros_distintos_no_comparten_entrada():
+    backend = BackendSimulado()
+    cache = CacheBusquedas(backend=backend)
+
+    cache.buscar("despido intempestivo", max_results=3)
+    cache.buscar("despido intempestivo", max_results=5)
+    cache.buscar("despido intempestivo", max_results=3)
+
+    assert len(backend.llamadas) == 2
+
+
+def test_hilos_con_la_misma_busqueda_hacen_una_sola_llamada():
+    backend = BackendSimulado(latencia=0.2)
+    cache = CacheBusquedas(backend=backend)
+    respuestas = []
+
+    hilos = [threading.Thread(target=lambda: respuestas.append(cache.buscar("prescripción de deudas"))) for _ in range(5)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(backend.llamadas) == 1
+    assert len(respuestas) == 5 and all(r == respuestas[0] for r in respuestas)
+    assert cache.estadisticas()["agrupadas"] == 4
+
+
+def test_abuscar_agrupa_en_el_loop_sin_bloquearlo():
+    backend = BackendSimulado(latencia=0.3)
+    cache = CacheBusquedas(backend=backend)
+
+    async def escenario():
+        latidos = 0
+
+        async def latir():
+            nonlocal latidos
+            while True:
+                await asyncio.sleep(0.01)
+                latidos += 1
+
+        latido = asyncio.create_task(latir())
+        respuestas = await asyncio.gather(*(cache.abuscar("tenencia de menores") for _ in range(4)))
+        latido.cancel()
+        return respuestas, latidos
+
+    respuestas, latidos = asyncio.run(escenario())
+
+    assert len(backend.llamadas) == 1
+    assert all(r == respuestas[0] for r in respuestas)
+    # Durante los 0.3 s de Tavily el loop siguió atendiendo otras tareas
+    assert latidos >= 10
+
+
+def test_cancelar_una_peticion_no_cancela_la_busqueda_compartida():
+    backend = BackendSimulado(latencia=0.2)
+    cache = CacheBusquedas(backend=backend)
+
+    async def escenario():
+        primera = asyncio.create_task(cache.abuscar("pensión alimenticia"))
+        segunda = asyncio.create_task(cache.abuscar("pensión alimenticia"))
+        await asyncio.sleep(0.05)
+        primera.cancel()
+        return await segunda
+
+    assert asyncio.run(escenario())["query"] == "pensión alimenticia"
+    assert len(backend.llamadas) == 1
+
+
+def test_herramienta_asincrona_en_el_formato_de_tavily():
+    tools = TavilyCacheado(CacheBusquedas(backend=BackendSimulado()), include_domains=["funcionjudicial.gob.ec"])
+    funcion = tools.functions["web_search_using_tavily"]
+
+    salida = asyncio.run(funcion.entrypoint(query="habeas corpus", max_results=2))
+
+    assert salida.startswith("# habeas corpus\n\n### Summary\n")
+    assert "https://funcionjudicial.gob.ec/simulado/2" in salida
+    sincrona = TavilyCacheado(CacheBusquedas(backend=BackendSimulado()), include_domains=["funcionjudicial.gob.ec"], asincrono=False)
+    assert sincrona.web_search_using_tavily("habeas corpus", max_results=2) == salida
+
+
+def test_persistencia_en_sqlite_sobrevive_al_reinicio(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'cache.db'}"
+    reloj = Reloj()
+    primera = CacheBusquedas(backend=BackendSimulado(), db_url=db_url, ttl_segundos=100, reloj=reloj)
+    respuesta = primera.buscar("acción de protección")
+
+    backend = BackendSimulado()
+    reiniciada = CacheBusquedas(backend=backend, db_url=db_url, ttl_segundos=100, reloj=reloj)
+    assert reiniciada.buscar("acción de protección") == respuesta
+    assert backend.llamadas == []
+    assert reiniciada.estadisticas()["aciertos_persistente"] == 1
+
+    reloj.ahora += 101
+    caducada = CacheBusquedas(backend=backend, db_url=db_url, ttl_segundos=100, reloj=reloj)
+    caducada.buscar("acción de protección")
+    assert len(backend.llamadas) == 1
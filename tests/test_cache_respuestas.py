@@ -0,0 +1,130 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import cache_respuestas
+from benchmark_recuperacion import EmbedderFalso
+from cache_respuestas import CacheRespuestas, CacheRespuestasMiddleware, EntradaCache, solicitar_invalidacion
+from playground_runs import RespuestaCapturada, SolicitudRun
+
+EQUIPO = SimpleNamespace(name="Veredix", model=SimpleNamespace(id="claude"), instructions=["Responde con citas."], members=[])
+
+
+def solicitud(mensaje="¿Cómo calculo mi liquidación?", stream=False):
+    return SolicitudRun("teams", "veredix", mensaje, stream, session_id=None, user_id="u1", tiene_archivos=False)
+
+
+def entrada(cache, consulta, contenido="respuesta"):
+    return EntradaCache(
+        consulta=consulta,
+        embedding=cache.embeber(consulta),
+        cuerpos=[json.dumps({"content": contenido}).encode()],
+        media_type="application/json",
+        session_id=None,
+        run_id=None,
+        sesion=None,
+    )
+
+
+@pytest.fixture
+def cache(tmp_path):
+    manifiesto = tmp_path / "manifiesto.json"
+    manifiesto.write_text(json.dumps({"version_corpus": "v1"}))
+    return CacheRespuestas(EmbedderFalso(), umbral=0.95, ruta_manifiesto=manifiesto, ruta_invalidacion=tmp_path / "invalidar")
+
+
+def test_misma_pregunta_y_particion_acierta(cache):
+    particion = cache.particion(solicitud(), EQUIPO)
+    cache.guardar(particion, entrada(cache, "¿Cómo calculo mi liquidación?"))
+
+    assert cache.buscar(particion, cache.embeber("¿cómo calculo mi liquidación?")) is not None
+    assert cache.buscar(particion, cache.embeber("requisitos del divorcio")) is None
+    # Otro modo de respuesta u otra configuración del equipo no comparten entradas
+    assert cache.buscar(cache.particion(solicitud(stream=True), EQUIPO), cache.embeber("¿Cómo calculo mi liquidación?")) is None
+    otro_equipo = SimpleNamespace(**{**vars(EQUIPO), "instructions": ["Otras instrucciones."]})
+    assert cache.buscar(cache.particion(solicitud(), otro_equipo), cache.embeber("¿Cómo calculo mi liquidación?")) is None
+    assert cache.estadisticas()["aciertos"] == 1
+
+
+def test_las_entradas_expiran_por_ttl(cache, monkeypatch):
+    cache.ttl_segundos = 60
+    ahora = [1000.0]
+    monkeypatch.setattr(cache_respuestas.time, "time", lambda: ahora[0])
+    particion = cache.particion(solicitud(), EQUIPO)
+    guardada = entrada(cache, "¿Cómo calculo mi liquidación?")
+    guardada.creado = ahora[0]
+    cache.guardar(particion, guardada)
+
+    ahora[0] += 59
+    assert cache.buscar(particion, cache.embeber("¿Cómo calculo mi liquidación?")) is not None
+    ahora[0] += 2
+    assert cache.buscar(particion, cache.embeber("¿Cómo calculo mi liquidación?")) is None
+    assert cache.estadisticas()["entradas"] == 0
+
+
+def test_reingestar_el_corpus_invalida(cache):
+    cache.guardar(cache.particion(solicitud(), EQUIPO), entrada(cache, "¿Cómo calculo mi liquidación?"))
+    cache.ruta_manifiesto.write_text(json.dumps({"version_corpus": "v2"}))
+    os.utime(cache.ruta_manifiesto, (2_000_000_000, 2_000_000_000))
+
+    particion = cache.particion(solicitud(), EQUIPO)
+
+    assert particion[3] == "v2"
+    assert cache.estadisticas()["entradas"] == 0 and cache.contadores["invalidaciones"] == 1
+
+
+def test_la_invalidacion_explicita_llega_a_cada_worker(cache):
+    # Un aviso anterior al arranque no vacía la caché recién creada
+    solicitar_invalidacion(cache.ruta_invalidacion)
+    otro_worker = CacheRespuestas(EmbedderFalso(), ruta_manifiesto=cache.ruta_manifiesto, ruta_invalidacion=cache.ruta_invalidacion)
+    for instancia in (cache, otro_worker):
+        instancia.guardar(instancia.particion(solicitud(), EQUIPO), entrada(instancia, "¿Cómo calculo mi liquidación?"))
+    assert otro_worker.estadisticas()["entradas"] == 1
+
+    solicitar_invalidacion(cache.ruta_invalidacion)
+    os.utime(cache.ruta_invalidacion, ns=(2_000_000_000 * 10**9, 2_000_000_000 * 10**9))
+
+    for instancia in (cache, otro_worker):
+        instancia.particion(solicitud(), EQUIPO)
+        assert instancia.estadisticas()["entradas"] == 0
+
+
+@pytest.mark.parametrize(
+    "status, cuerpos, error",
+    [
+        (200, [b'{"event":"RunCancelled","content":"Operation cancelled by user"}'], True),
+        (200, [json.dumps({"event": "RunStarted"}, indent=2).encode(), b'{\n  "event"', b': "RunError"}'], True),
+        (200, [json.dumps({"event": "RunResponse", "content": 'ver "event": "RunError"'}, indent=2).encode()], False),
+        (200, [b'{"event": "RunResponse"', b"corte"], False),
+        (500, [b'{"detail": "error"}'], True),
+    ],
+)
+def test_tiene_error_lee_los_eventos_de_la_respuesta(status, cuerpos, error):
+    assert RespuestaCapturada(status=status, headers=[], cuerpos=cuerpos).tiene_error() is error
+
+
+def test_el_middleware_no_guarda_runs_cancelados(cache):
+    eventos = iter(["RunCancelled", "RunResponse"])
+    ejecuciones = []
+
+    async def run(request):
+        ejecuciones.append(1)
+        return JSONResponse({"event": next(eventos), "content": "Respuesta del equipo", "session_id": "s1", "run_id": "r1"})
+
+    app = Starlette(routes=[Route("/v1/playground/teams/veredix/runs", run, methods=["POST"])])
+    app.add_middleware(CacheRespuestasMiddleware, entidades={"veredix": EQUIPO}, cache=cache)
+    cliente = TestClient(app)
+    formulario = {"message": "¿Cómo calculo mi liquidación?", "stream": "false"}
+
+    for _ in range(3):
+        cliente.post("/v1/playground/teams/veredix/runs", data=formulario)
+
+    # El run cancelado no se guarda; el siguiente sí, y el tercero sale de la caché
+    assert len(ejecuciones) == 2
+    assert cache.estadisticas()["guardadas"] == 1 and cache.estadisticas()["aciertos"] == 1
@@ -0,0 +1,111 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from agno.document import Document
+
+from contexto_legal import EmpaquetadorContexto, deduplicar, pasaje_desde_documento, unir_contiguos
+
+
+def fragmento(articulo, texto, puntuacion=0.5, parte=1, partes=1, codigo="COIP", jerarquia="LIBRO I > TÍTULO II"):
+    return Document(
+        name=codigo,
+        content=f"{codigo} > {jerarquia} > Art. {articulo}\nArt. {articulo}.- {texto}",
+        meta_data={
+            "codigo": codigo,
+            "articulo": articulo,
+            "parte": parte,
+            "partes": partes,
+            "jerarquia": jerarquia,
+            "puntuacion": puntuacion,
+            "page": 1,
+        },
+    )
+
+
+def pasajes(*documentos):
+    return [pasaje_desde_documento(d, i) for i, d in enumerate(documentos)]
+
+
+@pytest.fixture
+def empaquetador():
+    empaquetador = EmpaquetadorContexto()
+    # Sin descargar la codificación de tiktoken: 4 caracteres por token
+    empaquetador.tokens._cargada = True
+    return empaquetador
+
+
+def test_deduplicar_conserva_el_de_mayor_puntuacion():
+    texto = "La pena por el delito de robo será de uno a tres años de privación de libertad cuando"
+    elegidos = deduplicar(
+        pasajes(
+            fragmento("189", texto, puntuacion=0.4),
+            fragmento("189", texto + " medie violencia.", puntuacion=0.9),
+            # Mismo artículo y parte desde otra búsqueda
+            fragmento("189", "Otro texto del mismo fragmento.", puntuacion=0.3),
+            fragmento("190", "Se sancionará la apropiación fraudulenta por medios electrónicos.", puntuacion=0.6),
+        )
+    )
+
+    assert [(p.articulos, p.puntuacion) for p in elegidos] == [(["189"], 0.9), (["190"], 0.6)]
+
+
+def test_deduplicar_quita_los_casi_iguales():
+    base = " ".join(f"palabra{n}" for n in range(40))
+    elegidos = deduplicar(pasajes(fragmento("10", base, codigo="A"), fragmento("11", base + " final", codigo="B")))
+
+    assert len(elegidos) == 1
+
+
+def test_unir_partes_y_articulos_contiguos_del_mismo_capitulo():
+    unidos = unir_contiguos(
+        pasajes(
+            fragmento("12", "Segunda parte.", parte=2, partes=2, puntuacion=0.8),
+            fragmento("12", "Primera parte.", parte=1, partes=2, puntuacion=0.3),
+            fragmento("13", "Artículo siguiente.", puntuacion=0.2),
+            fragmento("14", "Otro capítulo.", jerarquia="LIBRO I > TÍTULO III"),
+            fragmento("16", "No contiguo."),
+        )
+    )
+
+    assert [p.articulos for p in unidos] == [["12", "13"], ["16"], ["14"]]
+    assert unidos[0].contenido.index("Primera parte") < unidos[0].contenido.index("Segunda parte")
+    assert unidos[0].puntuacion == 0.8
+    assert unidos[0].a_dict()["content"].startswith("COIP > LIBRO I > TÍTULO II > Arts. 12, 13\n")
+
+
+def test_el_presupuesto_crece_con_num_documents(empaquetador):
+    # Cinco artículos de unos 600 tokens, por debajo del percentil 95 del corpus
+    documentos = [fragmento(str(n), "x" * 2400, puntuacion=1 - n / 100) for n in range(10, 60, 10)]
+
+    assert len(empaquetador.empaquetar(documentos, 5)) == 5
+    assert len(empaquetador.empaquetar(documentos, 2)) == 2
+    # Un presupuesto fijo deja fuera lo que no cabe
+    empaquetador.presupuesto_tokens = 1500
+    elegidos = empaquetador.empaquetar(documentos, 5)
+    assert [d["meta_data"]["articulos"] for d in elegidos] == ["10", "20"]
+    assert empaquetador._tokens_json(elegidos) <= 1500
+
+
+def test_el_mejor_pasaje_se_recorta_si_no_cabe(empaquetador):
+    empaquetador.presupuesto_tokens = 300
+
+    elegidos = empaquetador.empaquetar([fragmento("10", "y" * 4000), fragmento("11", "z" * 100, codigo="OTRO")], 5)
+
+    assert len(elegidos) == 1 and elegidos[0]["content"].endswith(" […]")
+    assert empaquetador._tokens_json(elegidos) <= 300 + 5
+
+
+def test_como_retriever_pide_candidatos_extra(empaquetador):
+    busquedas = []
+
+    def search(query, num_documents, **kwargs):
+        busquedas.append(num_documents)
+        return [fragmento("10", "Texto."), fragmento("10", "Texto.")]
+
+    agente = SimpleNamespace(knowledge=SimpleNamespace(num_documents=5, search=search))
+
+    resultado = empaquetador("robo", agent=agente)
+
+    assert busquedas == [8]
+    assert len(resultado) == 1 and json.loads(json.dumps(resultado)) == resultado
@@ -0,0 +1,82 @@
+import pytest
+from agno.document import Document
+
+import enrutador
+from benchmark_recuperacion import EmbedderFalso
+from enrutador import ClasificadorConsultas
+from indice_articulos import IndiceArticulos, extraer_referencias
+
+
+@pytest.fixture
+def clasificador(indice, monkeypatch):
+    monkeypatch.setattr(enrutador, "obtener_indice", indice.cargar)
+    return ClasificadorConsultas(EmbedderFalso())
+
+
+@pytest.mark.parametrize(
+    "texto, referencias",
+    [
+        ("arts. 10 y 11 del COIP", [("COIP", "10"), ("COIP", "11")]),
+        ("artículos 10, 11 y 12 del Código del Trabajo", [("CODIGO TRABAJO", n) for n in ("10", "11", "12")]),
+        ("Arts. 10 al 12 del COIP", [("COIP", n) for n in ("10", "11", "12")]),
+        ("art. 10 bis y 15.1 del COIP", [("COIP", "10 bis"), ("COIP", "15.1")]),
+        ("artículos 10 a 500 del COIP", [("COIP", "10"), ("COIP", "500")]),
+    ],
+)
+def test_extraer_referencias_enumeradas(texto, referencias):
+    assert extraer_referencias(texto) == referencias
+
+
+@pytest.mark.parametrize(
+    "mensaje, numeros",
+    [
+        ("arts. 10 y 11 del COIP", ["10", "11"]),
+        ("artículos 10, 11 y 12 del Código del Trabajo", ["10", "11", "12"]),
+        ("artículo 140 del COIP.", ["140"]),
+    ],
+)
+def test_varios_articulos_se_responden_completos(clasificador, mensaje, numeros):
+    clasificacion = clasificador.clasificar(mensaje)
+
+    assert clasificacion.categoria == "articulo"
+    assert [entrada["numero"] for entrada in clasificacion.articulos] == numeros
+
+
+@pytest.mark.parametrize(
+    "mensaje",
+    [
+        "art. 10 y 99 del COIP",  # el 99 no está en el índice
+        "art. 10 del COIP y luego el 11",  # el 11 no forma parte de la cita
+    ],
+)
+def test_citas_sin_resolver_van_al_equipo(clasificador, mensaje):
+    assert clasificador.clasificar(mensaje).categoria == "compleja"
+
+
+def test_un_numero_repetido_en_el_codigo_va_al_equipo(tmp_path, monkeypatch):
+    paginas = [
+        Document(
+            name="CONSTITUCION",
+            meta_data={"page": 1},
+            content=(
+                "Art. 146.- En caso de ausencia temporal lo reemplazará quien ejerza la Vicepresidencia.\n"
+                "Art. 147.- Son atribuciones de la Presidenta o Presidente de la República.\n"
+                "Art. 148.- La Presidenta o Presidente de la República podrá disolver la Asamblea Nacional.\n"
+                "Art. 149.- La Presidenta o Presidente cesará en sus funciones.\n"
+                "DISPOSICIONES REFORMATORIAS\n"
+                "Art. 147.- Agréguese un inciso a la ley reformada.\n"
+                "Art. 148.- Sustitúyase el artículo de la ley reformada.\n"
+            ),
+        )
+    ]
+    indice = IndiceArticulos(tmp_path / "indice.json.gz")
+    indice.actualizar_codigo("CONSTITUCION", paginas)
+    monkeypatch.setattr(enrutador, "obtener_indice", lambda: indice)
+    clasificador = ClasificadorConsultas(EmbedderFalso())
+
+    # El índice conserva el artículo de la numeración principal, marcado como ambiguo
+    entrada = indice.obtener("CONSTITUCION", "148")
+    assert entrada["texto"].startswith("Art. 148.- La Presidenta") and entrada["ambiguo"]
+    assert clasificador.clasificar("art. 148 de la Constitución").categoria == "compleja"
+    assert clasificador.clasificar("arts. 146 y 148 de la Constitución").categoria == "compleja"
+    assert clasificador.clasificar("art. 146 de la Constitución").categoria == "articulo"
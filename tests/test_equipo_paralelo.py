@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from agno.agent import Agent
+from agno.exceptions import RunCancelledException
+from agno.media import ImageArtifact
+from agno.memory.team import TeamMemory
+from agno.run.response import RunEvent, RunResponse
+from agno.run.team import TeamRunResponse
+from agno.team.team import Team
+
+from equipo_paralelo import EquipoParalelo
+
+
+def test_la_multimedia_del_equipo_llega_al_miembro_sin_acumularse():
+    equipo = object.__new__(EquipoParalelo)
+    equipo.enable_agentic_context = False
+    equipo.share_member_interactions = True
+    equipo.memory = SimpleNamespace(
+        get_team_member_interactions_str=lambda: "",
+        get_team_context_images=lambda: [ImageArtifact(id="grafico", url="https://ejemplo.ec/grafico.png")],
+        get_team_context_videos=lambda: [],
+        get_team_context_audio=lambda: [],
+    )
+    imagenes_turno = []
+
+    for _ in range(3):
+        _, imagenes, videos, audio = equipo._tarea_miembro("tarea", "resultado", imagenes_turno, [], [])
+        assert [imagen.url for imagen in imagenes] == ["https://ejemplo.ec/grafico.png"]
+        assert videos == [] and audio == []
+    assert imagenes_turno == []
+
+
+def _equipo(**kwargs) -> EquipoParalelo:
+    miembros = [Agent(name="Agente legal"), Agent(name="Buscador web")]
+    equipo = EquipoParalelo(members=miembros, mode="coordinate", miembros_suficientes=["Agente legal"], **kwargs)
+    equipo.memory = TeamMemory()
+    equipo.run_response = TeamRunResponse()
+    return equipo
+
+
+def _responder(miembro: Agent, demora: float, **respuesta):
+    async def arun(*args, **kwargs):
+        await asyncio.sleep(demora)
+        miembro.run_response = RunResponse(content=f"respuesta de {miembro.name}", **respuesta)
+        return miembro.run_response
+
+    miembro.arun = arun
+
+
+def test_los_runs_simultaneos_no_comparten_turno(monkeypatch):
+    equipo = _equipo(timeout_miembro=5, gracia_evidencia=0.05)
+    legal, web = equipo.members
+    _responder(legal, 0)
+    _responder(web, 0.3)
+    transferir = equipo.get_transfer_task_function(async_mode=True).entrypoint
+
+    async def run_del_modelo(self, miembros):
+        # Lo que hace el modelo al pedir varias transferencias en la misma respuesta
+        return await asyncio.gather(*(transferir(nombre, "tarea", "resultado") for nombre in miembros))
+
+    monkeypatch.setattr(Team, "arun", run_del_modelo)
+
+    async def peticiones():
+        return await asyncio.gather(equipo.arun(["Agente legal", "Buscador web"]), equipo.arun(["Buscador web"]))
+
+    con_evidencia, solo_web = asyncio.run(peticiones())
+
+    # La evidencia del agente legal recorta la búsqueda web de su run, no la de la otra petición
+    assert con_evidencia[0] == "respuesta de Agente legal"
+    assert "no respondió a tiempo" in con_evidencia[1]
+    assert solo_web == ["respuesta de Buscador web"]
+
+
+def test_la_cancelacion_del_miembro_detiene_el_run():
+    equipo = _equipo()
+    legal, _ = equipo.members
+    _responder(legal, 0, event=RunEvent.run_cancelled)
+    transferir = equipo.get_transfer_task_function(async_mode=True).entrypoint
+
+    async def transferir_y_consumir():
+        resultado = await transferir("Agente legal", "tarea", "resultado")
+        # El modelo consume el resultado con `async for`, fuera del try de la herramienta
+        return [parte async for parte in resultado]
+
+    with pytest.raises(RunCancelledException):
+        asyncio.run(transferir_y_consumir())
+    assert equipo.run_response.member_responses == []
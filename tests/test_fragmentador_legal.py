@@ -0,0 +1,105 @@
+import pytest
+from agno.document import Document
+
+from fragmentador_legal import ChunkingLegal, _partir, fragmentar_articulos
+from indice_articulos import entradas_de_codigo
+
+
+def test_partir_conserva_el_orden_al_cortar_una_unidad_larga():
+    assert _partir("aaa. " + "b" * 25, 10) == ["aaa.", "bbbbbbbbbb", "bbbbbbbbbb", "bbbbb"]
+    assert "".join(_partir("uno. dos. " + "x" * 40 + ". tres.", 12)).replace(" ", "") == ("uno.dos." + "x" * 40 + ".tres.")
+
+
+@pytest.mark.parametrize("max_caracteres", [300, 1000, 2000])
+def test_los_fragmentos_con_cabecera_no_superan_el_tope(max_caracteres):
+    oraciones = " ".join(f"La oración número {n} del artículo establece una regla distinta." for n in range(60))
+    texto = (
+        "LIBRO PRIMERO DE LAS PERSONAS\nTÍTULO II DE LOS DERECHOS Y GARANTÍAS CONSTITUCIONALES\n"
+        f"Art. 1.- {oraciones}\nArt. 2.- Breve.\n"
+    )
+
+    fragmentos = ChunkingLegal(max_caracteres=max_caracteres).dividir("CODIGO CIVIL", texto, [(0, 1)])
+
+    assert max(len(f.content) for f in fragmentos) <= max_caracteres
+    partes = [f for f in fragmentos if f.meta_data["articulo"] == "1"]
+    assert len(partes) > 1 and partes[1].content.startswith("CODIGO CIVIL > LIBRO PRIMERO")
+    # Sin cabeceras, las partes reconstruyen el artículo en orden
+    assert " ".join(p.content.split("\n", 1)[1] for p in partes).split() == f"Art. 1.- {oraciones}".split()
+
+
+def _articulos(texto: str):
+    fragmentos = ChunkingLegal(max_caracteres=10**6, incluir_contexto=False).dividir("CONSTITUCION", texto, [(0, 1)])
+    return [(f.meta_data.get("articulo"), bool(f.meta_data.get("repetido")), f.content) for f in fragmentos]
+
+
+def test_las_citas_dentro_de_una_nota_no_abren_articulos():
+    texto = (
+        "Art. 146.- En caso de ausencia temporal lo reemplazará quien ejerza la Vicepresidencia.\n"
+        "Nota: la Corte interpretó los artículos:\n"
+        'Art. 114.- "Las autoridades de elección popular podrán reelegirse por una sola vez."\n'
+        "Art. 148.- de la Constitución: La Presidenta o Presidente podrá disolver la Asamblea.\n"
+        "Art. 147.- Son atribuciones de la Presidenta o Presidente de la República.\n"
+        "Art. 148.- La Presidenta o Presidente de la República podrá disolver la Asamblea Nacional.\n"
+    )
+
+    articulos = _articulos(texto)
+
+    assert [numero for numero, _, _ in articulos] == ["146", "147", "148"]
+    assert "Art. 114.-" in articulos[0][2] and "de la Constitución" in articulos[0][2]
+    assert articulos[2][2].startswith("Art. 148.- La Presidenta")
+
+
+def test_un_articulo_real_en_minuscula_se_conserva_si_sigue_la_numeracion():
+    articulos = _articulos("Art. 29.- La libertad de enseñanza.\nArt. 30.- las personas tienen derecho a un hábitat seguro.\nArt. 31.- Las personas tienen derecho a la ciudad.\n")
+
+    assert [numero for numero, _, _ in articulos] == ["29", "30", "31"]
+
+
+def test_repeticiones_seguidas_sufijos_con_guion_y_leyes_anexas():
+    texto = (
+        "Art. 80.- Texto anterior.\n"
+        "Art. 81.- Matrimonio es un contrato solemne por el cual dos personas se unen.\n"
+        "Art. 81.- Matrimonio es un contrato solemne por el cual un hombre y una mujer se unen.\n"
+        "Art. 82.- Texto siguiente.\n"
+        "Art. 82-b.- Artículo agregado por una reforma.\n"
+        "DISPOSICIONES REFORMATORIAS\n"
+        "Art. 81.- Trámite de la ley reformada.\n"
+        "Art. 82.- Sentencia de la ley reformada.\n"
+    )
+
+    articulos = _articulos(texto)
+
+    assert [(numero, repetido) for numero, repetido, _ in articulos] == [
+        ("80", False),
+        ("81", False),
+        ("82", False),
+        ("82-b", False),
+        ("81", True),
+        ("82", True),
+    ]
+    # Las dos versiones seguidas quedan en un solo artículo
+    assert "dos personas" in articulos[1][2] and "un hombre y una mujer" in articulos[1][2]
+
+
+def test_el_indice_usa_la_aparicion_que_sigue_la_numeracion():
+    paginas = [
+        Document(
+            name="CONSTITUCION",
+            meta_data={"page": 1},
+            content=(
+                "Art. 313.- Sectores estratégicos.\n"
+                "Art. 315.- Texto citado en una nota.\n"
+                "Art. 316.- El estado podrá delegar (nota).\n"
+                "Art. 314.- Servicios públicos.\n"
+                "Art. 315.- El Estado constituirá empresas públicas.\n"
+                "Art. 316.- El Estado podrá delegar la participación.\n"
+                "Art. 317.- Los recursos naturales no renovables.\n"
+            ),
+        )
+    ]
+
+    entradas = entradas_de_codigo("CONSTITUCION", paginas)
+
+    assert entradas["315"]["texto"] == "Art. 315.- El Estado constituirá empresas públicas."
+    assert entradas["316"]["texto"] == "Art. 316.- El Estado podrá delegar la participación."
+    assert len(fragmentar_articulos("CONSTITUCION", paginas)) == 7
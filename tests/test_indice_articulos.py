@@ -0,0 +1,25 @@
+import pytest
+
+from indice_articulos import ArticulosTools, extraer_referencias, resolver_codigo
+
+
+@pytest.mark.parametrize(
+    "texto, codigo",
+    [
+        ("artículo 140 del COIP.", "COIP"),
+        ("Art. 66 de la Constitución.", "CONSTITUCION"),
+        ("¿Qué dice el art. 10 del Código del Trabajo?", "CODIGO TRABAJO"),
+        ("COIP, artículo 140", "COIP"),
+        ("el coipo no existe", None),
+    ],
+)
+def test_resolver_codigo_ignora_la_puntuacion(texto, codigo):
+    assert resolver_codigo(texto) == codigo
+
+
+def test_referencia_al_final_de_la_frase(indice):
+    assert extraer_referencias("artículo 140 del COIP.") == [("COIP", "140")]
+
+    respuesta = ArticulosTools(indice).buscar_articulos_citados("Art. 66 de la Constitución.")
+
+    assert respuesta.startswith("CONSTITUCION, Art. 66")
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+
+import pytest
+from agno.vectordb.pgvector.index import HNSW
+
+from benchmark_recuperacion import EmbedderFalso
+from indices_vectoriales import PgVectorIndexado, ef_search_efectivo
+
+
+class SesionGrabadora:
+    """Sesión de SQLAlchemy falsa que guarda las sentencias ejecutadas y no devuelve filas."""
+
+    def __init__(self):
+        self.sentencias = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @contextmanager
+    def begin(self):
+        yield
+
+    def execute(self, sentencia, *args, **kwargs):
+        self.sentencias.append(str(sentencia))
+        return self
+
+    def fetchall(self):
+        return []
+
+
+@pytest.fixture
+def vector_db():
+    # create_engine no conecta: basta una URL válida
+    vector_db = PgVectorIndexado(
+        table_name="legislacion_prueba",
+        db_url="postgresql+psycopg://u:p@localhost:5432/db",
+        embedder=EmbedderFalso(),
+        vector_index=HNSW(ef_search=40),
+        candidatos=100,
+    )
+    vector_db.sesion = SesionGrabadora()
+    vector_db.Session = lambda: vector_db.sesion
+    return vector_db
+
+
+def _ef_search(sesion: SesionGrabadora) -> list:
+    return [s for s in sesion.sentencias if "hnsw.ef_search" in s]
+
+
+def test_ef_search_efectivo_cubre_los_candidatos():
+    assert ef_search_efectivo(40, 100) == 100
+    assert ef_search_efectivo(200, 100) == 200
+    assert ef_search_efectivo(40, 5000) == 1000
+
+
+def test_busqueda_hibrida_eleva_ef_search_a_los_candidatos(vector_db):
+    vector_db.hybrid_search("pena por robo", limit=5)
+
+    assert _ef_search(vector_db.sesion) == ["SET LOCAL hnsw.ef_search = 100"]
+
+
+def test_busqueda_cuantizada_eleva_ef_search_a_la_lista_de_reordenacion(vector_db):
+    vector_db.cuantizacion, vector_db.factor_rerank = "reducido", 50
+
+    vector_db.vector_search("pena por robo", limit=5)
+    vector_db.hybrid_search("pena por robo", limit=5)
+
+    assert _ef_search(vector_db.sesion) == ["SET LOCAL hnsw.ef_search = 250"] * 2
@@ -0,0 +1,96 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from agno.document import Document
+from sqlalchemy import select
+
+import ingesta
+
+
+class ClienteEmbeddings:
+    """Imita `client.embeddings.create` de OpenAI y guarda los textos embebidos."""
+
+    def __init__(self):
+        self.textos = []
+
+    def create(self, input, **kwargs):
+        self.textos.extend(input)
+        datos = [SimpleNamespace(index=i, embedding=[float(len(texto)), 1.0]) for i, texto in enumerate(input)]
+        return SimpleNamespace(data=datos, usage=SimpleNamespace(total_tokens=10 * len(input)))
+
+
+@pytest.fixture
+def corpus(tmp_path, vector_db, monkeypatch):
+    documentos = tmp_path / "documentos"
+    documentos.mkdir()
+    leidos = []
+
+    # Los "PDFs" son texto plano: cada archivo es una página
+    def extraer_paginas(rutas, procesos=None):
+        leidos.extend(ruta.name for ruta in rutas)
+        return {ruta: [Document(name=ruta.stem, content=ruta.read_text(), meta_data={"page": 1})] for ruta in rutas}
+
+    monkeypatch.setattr(ingesta, "extraer_paginas", extraer_paginas)
+    monkeypatch.setattr(ingesta, "construir_indices", lambda vector_db: None)
+    monkeypatch.setattr(ingesta, "RECUPERACION_BACKEND", "pgvector")
+    monkeypatch.setattr(ingesta, "RECUPERACION_LOCAL_PATH", tmp_path / "sin_instantanea")
+    cliente = ClienteEmbeddings()
+    vector_db.embedder = SimpleNamespace(id="falso", dimensions=2, request_params=None, client=SimpleNamespace(embeddings=cliente))
+
+    def ingestar():
+        leidos.clear()
+        cliente.textos.clear()
+        return ingesta.ingestar(documentos, tmp_path / "manifiesto.json", tmp_path / "indice.json.gz", vector_db=vector_db, procesos=1)
+
+    return SimpleNamespace(documentos=documentos, manifiesto=tmp_path / "manifiesto.json", leidos=leidos, cliente=cliente, ingestar=ingestar)
+
+
+def filas(vector_db):
+    with vector_db.Session() as sess:
+        return {fila.id: fila for fila in sess.execute(select(vector_db.table))}
+
+
+def test_la_ingesta_solo_procesa_lo_que_cambio(corpus, vector_db):
+    (corpus.documentos / "COIP.pdf").write_text("Art. 1.- Infracción penal.\nArt. 2.- Pena de multa.\n")
+    (corpus.documentos / "CONSTITUCION.pdf").write_text("Art. 1.- Estado constitucional.\n")
+
+    primera = corpus.ingestar()
+    assert (primera["actualizados"], primera["fragmentos_nuevos"]) == (2, 3)
+    assert sorted(fila.name for fila in filas(vector_db).values()) == ["COIP", "COIP", "CONSTITUCION"]
+
+    # Sin cambios: no se lee, embebe ni escribe nada
+    ids = set(filas(vector_db))
+    segunda = corpus.ingestar()
+    assert (segunda["sin_cambios"], segunda["actualizados"]) == (2, 0)
+    assert corpus.leidos == [] and corpus.cliente.textos == []
+    assert set(filas(vector_db)) == ids
+
+    # Un artículo reformado: solo se embebe ese fragmento y se borra su versión anterior
+    (corpus.documentos / "COIP.pdf").write_text("Art. 1.- Infracción penal.\nArt. 2.- Pena de multa reformada.\n")
+    tercera = corpus.ingestar()
+    assert (tercera["sin_cambios"], tercera["actualizados"]) == (1, 1)
+    assert (tercera["fragmentos_nuevos"], tercera["fragmentos_borrados"]) == (1, 1)
+    assert corpus.leidos == ["COIP.pdf"]
+    assert [texto.splitlines()[-1] for texto in corpus.cliente.textos] == ["Art. 2.- Pena de multa reformada."]
+    actuales = filas(vector_db)
+    assert len(actuales) == 3 and len(ids & set(actuales)) == 2
+    manifiesto = json.loads(corpus.manifiesto.read_text())
+    assert set(manifiesto["archivos"]["COIP.pdf"]["fragmentos"]) == {i for i, f in actuales.items() if f.name == "COIP"}
+
+
+def test_un_archivo_eliminado_borra_sus_filas(corpus, vector_db):
+    (corpus.documentos / "COIP.pdf").write_text("Art. 1.- Infracción penal.\n")
+    (corpus.documentos / "CONSTITUCION.pdf").write_text("Art. 1.- Estado constitucional.\nArt. 2.- Principios.\n")
+    corpus.ingestar()
+    version = json.loads(corpus.manifiesto.read_text())["version_corpus"]
+
+    (corpus.documentos / "CONSTITUCION.pdf").unlink()
+    resultado = corpus.ingestar()
+
+    assert (resultado["eliminados"], resultado["sin_cambios"], resultado["fragmentos_borrados"]) == (1, 1, 2)
+    assert [fila.name for fila in filas(vector_db).values()] == ["COIP"]
+    manifiesto = json.loads(corpus.manifiesto.read_text())
+    assert list(manifiesto["archivos"]) == ["COIP.pdf"]
+    # La caché de respuestas se invalida con la nueva versión del corpus
+    assert manifiesto["version_corpus"] != version
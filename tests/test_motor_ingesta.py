@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from agno.document import Document
+from sqlalchemy import select
+
+import motor_ingesta
+from motor_ingesta import MAX_TOKENS_POR_TEXTO, EmbedderPorLotes, escribir_filas
+
+
+def test_los_lotes_respetan_textos_y_tokens_estimados():
+    embedder = EmbedderPorLotes(SimpleNamespace(), max_textos=3, max_tokens=1000)
+    # 1500 caracteres ~ 500 tokens estimados; el texto enorme se acota al máximo de la API
+    textos = ["a" * 1500, "b" * 1500, "c" * 30, "d" * 30, "e" * 30, "f" * 30, "g" * 10**6]
+
+    lotes = embedder.lotes(textos)
+
+    assert [indices for indices, _ in lotes] == [[0], [1, 2, 3], [4, 5], [6]]
+    assert lotes[-1][1] == MAX_TOKENS_POR_TEXTO
+    assert all(tokens <= 1000 for _, tokens in lotes[:-1])
+
+
+def _documentos(contenidos, n=0):
+    return [
+        Document(id=f"doc{i}", name="COIP", content=contenido, meta_data={"articulo": str(i)}, embedding=[float(i), n])
+        for i, contenido in enumerate(contenidos)
+    ]
+
+
+def test_sin_psycopg_se_escribe_con_inserciones_multifila(vector_db, monkeypatch):
+    multifila = motor_ingesta._escribir_multifila
+    lotes = []
+
+    def multifila_en_lotes_de_dos(vector_db, filas):
+        lotes.append(len(filas))
+        return multifila(vector_db, filas, lote=2)
+
+    monkeypatch.setattr(motor_ingesta, "_escribir_multifila", multifila_en_lotes_de_dos)
+
+    escribir_filas(vector_db, _documentos(["uno", "dos", "tres"]))
+    # Reingesta: el mismo id actualiza la fila en lugar de fallar por conflicto
+    escribir_filas(vector_db, _documentos(["uno", "dos modificado\x00"], n=1))
+
+    with vector_db.Session() as sess:
+        filas = sess.execute(select(vector_db.table).order_by(vector_db.table.c.id)).fetchall()
+    assert lotes == [3, 2]
+    assert [(f.id, f.content, f.embedding) for f in filas] == [
+        ("doc0", "uno", [0.0, 1]),
+        ("doc1", "dos modificado�", [1.0, 1]),
+        ("doc2", "tres", [2.0, 0]),
+    ]
+    assert filas[1].content_hash == motor_ingesta.hash_contenido("dos modificado\x00")
+    assert filas[1].updated_at is not None and filas[2].updated_at is None
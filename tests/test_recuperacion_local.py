@@ -0,0 +1,176 @@
+import asyncio
+import shutil
+import threading
+
+import numpy as np
+import pytest
+from agno.document import Document
+
+from benchmark_recuperacion import EmbedderFalso
+from recuperacion_local import CUANTIZACIONES, VectorDbLocal, VectoresCompactos, directorio_snapshot, snapshot_desde_documentos
+
+TEXTOS = [
+    "El empleador pagará el décimo tercer sueldo hasta el veinticuatro de diciembre",
+    "La jornada máxima de trabajo será de ocho horas diarias",
+    "Las vacaciones anuales pagadas serán de quince días ininterrumpidos",
+    "El robo será sancionado con pena privativa de libertad de uno a tres años",
+    "El hurto de bienes ajenos se sanciona con prisión de seis meses a dos años",
+    "Toda persona tiene derecho a la defensa en cualquier etapa del procedimiento",
+    "El contrato de arrendamiento termina por la expiración del plazo pactado",
+    "Los tributos se extinguen por prescripción en el plazo de cinco años",
+]
+
+
+def _normalizadas(matriz: np.ndarray) -> np.ndarray:
+    return matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+
+
+def test_binario_no_premia_filas_dispersas_casi_vacias():
+    rng = np.random.default_rng(0)
+    rasgos = rng.choice(512, 32, replace=False)
+    consulta = np.zeros(512, dtype=np.float32)
+    consulta[rasgos[:12]] = [1.0, -1.0] * 6
+    filas = np.zeros((200, 512), dtype=np.float32)
+    # Filas con un único rasgo positivo: con Hamming sobre el signo quedaban más cerca que el documento relevante
+    filas[np.arange(200), rng.integers(0, 512, 200)] = 1.0
+    filas[17] = consulta
+    filas[17, rasgos[12:]] = 1.0
+    filas[42] = consulta * -1
+    compacto = VectoresCompactos.desde_matriz(_normalizadas(filas), "binario")
+
+    puntuaciones = compacto.puntuar(consulta / np.linalg.norm(consulta))
+
+    assert int(np.argmax(puntuaciones)) == 17
+    assert puntuaciones[17] == pytest.approx(12 / np.sqrt(12 * 32))
+    assert puntuaciones[42] == pytest.approx(-1.0)
+
+
+def test_binario_en_vectores_densos_equivale_a_hamming_de_signos():
+    rng = np.random.default_rng(1)
+    matriz = _normalizadas(rng.standard_normal((50, 100)).astype(np.float32))
+    consulta = matriz[0]
+    compacto = VectoresCompactos.desde_matriz(matriz, "binario")
+
+    hamming = ((matriz > 0) != (consulta > 0)).sum(axis=1)
+
+    np.testing.assert_allclose(compacto.puntuar(consulta), 1 - 2 * hamming / 100, atol=1e-6)
+    assert compacto.bytes == 50 * VectoresCompactos.ancho_binario(100)
+
+
+@pytest.mark.parametrize("modo", ["float16", "int8", "reducido"])
+def test_copias_compactas_aproximan_el_coseno(modo):
+    rng = np.random.default_rng(2)
+    matriz = _normalizadas(rng.standard_normal((300, 128)).astype(np.float32))
+    consulta = matriz[5]
+
+    aproximadas = VectoresCompactos.desde_matriz(matriz, modo, dimensiones_reducidas=64).puntuar(consulta)
+
+    assert int(np.argmax(aproximadas)) == 5
+    if modo != "reducido":
+        np.testing.assert_allclose(aproximadas, matriz @ consulta, atol=0.02)
+
+
+def test_cargar_descarta_binario_de_otro_formato(tmp_path):
+    np.save(tmp_path / "compacto_binario.npy", np.zeros((3, 64), dtype=np.uint8))
+
+    assert VectoresCompactos.cargar(tmp_path, "binario", 256, 1536) is None
+
+
+@pytest.fixture(scope="module")
+def instantanea(tmp_path_factory):
+    embedder = EmbedderFalso()
+    documentos = [Document(id=f"doc{i}", name="CODIGO", content=texto, meta_data={}) for i, texto in enumerate(TEXTOS)]
+    for documento in documentos:
+        documento.embedding = embedder.get_embedding(documento.content)
+    ruta = tmp_path_factory.mktemp("instantanea")
+    snapshot_desde_documentos(documentos, ruta, embedder, cuantizaciones=["int8", "binario"])
+    return ruta, embedder
+
+
+@pytest.mark.parametrize("modo", [c for c in CUANTIZACIONES if c != "float32"])
+def test_reordenacion_con_vectores_completos_reproduce_float32(instantanea, modo):
+    ruta, embedder = instantanea
+    completa = VectorDbLocal(ruta=ruta, embedder=embedder)
+    # Con una lista corta que cubre el corpus, la segunda pasada da exactamente el orden de float32
+    cuantizada = VectorDbLocal(ruta=ruta, embedder=embedder, cuantizacion=modo, factor_rerank=len(TEXTOS))
+
+    for consulta in ("pena por robo", "vacaciones del trabajador", "prescripción de tributos"):
+        esperados = [(d.id, d.meta_data["puntuacion"]) for d in completa.vector_search(consulta, limit=3)]
+        assert [(d.id, d.meta_data["puntuacion"]) for d in cuantizada.vector_search(consulta, limit=3)] == esperados
+        assert [d.id for d in cuantizada.hybrid_search(consulta, limit=3)] == [d.id for d in completa.hybrid_search(consulta, limit=3)]
+
+
+def test_escrituras_se_ignoran_sin_tocar_la_instantanea(instantanea, monkeypatch):
+    ruta, embedder = instantanea
+    avisos = []
+    monkeypatch.setattr("recuperacion_local.logger.warning", avisos.append)
+    vector_db = VectorDbLocal(ruta=ruta, embedder=embedder)
+    nuevo = Document(id="nuevo", name="CODIGO", content="Texto que no está en la instantánea")
+
+    vector_db.create()
+    vector_db.upsert([nuevo])
+    vector_db.insert([nuevo])
+
+    assert len(avisos) == 2
+    assert not vector_db.doc_exists(nuevo)
+    assert len(vector_db.vector_search("pena por robo", limit=len(TEXTOS) + 1)) == len(TEXTOS)
+
+
+def _exportar(ruta, textos):
+    embedder = EmbedderFalso()
+    documentos = [Document(id=f"doc{i}", name="CODIGO", content=texto, meta_data={}) for i, texto in enumerate(textos)]
+    for documento in documentos:
+        documento.embedding = embedder.get_embedding(documento.content)
+    return snapshot_desde_documentos(documentos, ruta, embedder), embedder
+
+
+def test_cada_exportacion_publica_una_version_completa(tmp_path):
+    ruta = tmp_path / "instantanea"
+    primera, embedder = _exportar(ruta, TEXTOS)
+    vector_db = VectorDbLocal(ruta=ruta, embedder=embedder)
+    assert len(vector_db.cargar().documentos) == len(TEXTOS)
+
+    segunda, _ = _exportar(ruta, TEXTOS[:3])
+    tercera, _ = _exportar(ruta, TEXTOS[:2])
+
+    assert directorio_snapshot(ruta) == ruta / tercera["directorio"]
+    # Solo se conserva la versión anterior, por si otro proceso acaba de leer el puntero
+    assert sorted(p.name for p in ruta.iterdir()) == sorted(["actual", segunda["directorio"], tercera["directorio"]])
+    assert len(vector_db.cargar().documentos) == 2
+
+
+def test_una_version_inconsistente_no_reemplaza_la_cargada(tmp_path, monkeypatch):
+    ruta = tmp_path / "instantanea"
+    meta, embedder = _exportar(ruta, TEXTOS)
+    vector_db = VectorDbLocal(ruta=ruta, embedder=embedder)
+    vector_db.cargar()
+    avisos = []
+    monkeypatch.setattr("recuperacion_local.logger.warning", avisos.append)
+    # meta.json de una exportación con embeddings.npy de otra
+    otra = ruta / "v-mezclada"
+    shutil.copytree(ruta / meta["directorio"], otra)
+    np.save(otra / "embeddings.npy", np.zeros((3, embedder.dimensions), dtype=np.float32))
+    (ruta / "actual").write_text("v-mezclada")
+
+    assert len(vector_db.cargar().documentos) == len(TEXTOS)
+    assert "inconsistente" in avisos[0]
+    assert vector_db._directorio == ruta / meta["directorio"]
+
+
+def test_async_search_no_bloquea_el_event_loop(instantanea, monkeypatch):
+    ruta, embedder = instantanea
+    vector_db = VectorDbLocal(ruta=ruta, embedder=embedder)
+    hilos = []
+
+    def search(query, limit=5, filters=None):
+        hilos.append(threading.get_ident())
+        return []
+
+    monkeypatch.setattr(vector_db, "search", search)
+
+    async def buscar():
+        return await vector_db.async_search("pena por robo"), threading.get_ident()
+
+    resultado, hilo_loop = asyncio.run(buscar())
+
+    assert resultado == [] and hilos and hilos[0] != hilo_loop
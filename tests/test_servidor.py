@@ -0,0 +1,108 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import servidor
+import trazas
+from servidor import preparar_metricas, registrar_arranque, servir
+from trazas import Contador, Histograma, agregar_endpoint_metricas, exponer_metricas, volcar_metricas
+
+
+def test_el_worker_solo_esta_listo_tras_los_pasos_obligatorios():
+    cerrados = []
+    app = FastAPI()
+
+    def vector_db():
+        raise RuntimeError("tabla no encontrada")
+
+    estado = registrar_arranque(app, {"db": lambda: None, "vector_db": vector_db}, al_cerrar=[lambda: cerrados.append(True)])
+    cliente = TestClient(app)
+
+    assert cliente.get("/health/ready").status_code == 503
+    with cliente:
+        listo = cliente.get("/health/ready")
+        # Un paso opcional que falla no saca al worker del balanceo
+        assert listo.status_code == 200
+        assert listo.json()["pasos"]["vector_db"] == {"ok": False, "error": "tabla no encontrada"}
+        assert cliente.get("/health/live").json()["vivo"]
+    assert estado.drenando and cerrados == [True]
+
+
+def test_un_paso_obligatorio_fallido_deja_el_worker_fuera():
+    app = FastAPI()
+
+    def db():
+        raise ConnectionError("sin conexión")
+
+    registrar_arranque(app, {"db": db})
+
+    with TestClient(app) as cliente:
+        assert cliente.get("/health/ready").status_code == 503
+
+
+def test_servir_con_varios_workers_prepara_las_metricas_compartidas(monkeypatch, tmp_path):
+    import uvicorn
+
+    llamadas = []
+    monkeypatch.setattr(uvicorn, "run", lambda app, **kwargs: llamadas.append((app, kwargs)))
+    monkeypatch.setenv("METRICAS_DIR", str(tmp_path))
+    (tmp_path / "999.json").write_text("{}")
+
+    servir("playgroundteam:crear_app", "127.0.0.1", 7777, workers=4, drenaje=30, fabrica=True)
+
+    app, opciones = llamadas[0]
+    assert app == "playgroundteam:crear_app"
+    assert opciones["workers"] == 4 and opciones["factory"] and opciones["timeout_graceful_shutdown"] == 30
+    # Los volcados de la ejecución anterior se descartan
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_con_un_solo_worker_no_hay_directorio_de_metricas(monkeypatch, tmp_path):
+    monkeypatch.delenv("METRICAS_DIR", raising=False)
+    monkeypatch.setattr(servidor.tempfile, "mkdtemp", lambda prefix: str(tmp_path / prefix))
+
+    assert preparar_metricas(1) is None
+    directorio = preparar_metricas(2)
+    assert directorio.is_dir() and servidor.os.environ["METRICAS_DIR"] == str(directorio)
+
+
+@pytest.fixture
+def metricas(monkeypatch):
+    contador = Contador("prueba_total", "Contador de prueba", ("ruta",))
+    histograma = Histograma("prueba_segundos", "Histograma de prueba", buckets=(0.1, 1))
+    monkeypatch.setattr(trazas, "METRICAS", [contador, histograma])
+    return contador, histograma
+
+
+def test_metrics_suma_las_de_todos_los_workers(metricas, monkeypatch, tmp_path):
+    contador, histograma = metricas
+    # Otro worker volcó sus métricas
+    monkeypatch.setattr(trazas.os, "getpid", lambda: 101)
+    contador.incrementar(2, ruta="/a")
+    histograma.observar(0.05)
+    volcar_metricas(tmp_path)
+    # Este worker: las suyas se leen en vivo, no de su volcado anterior
+    monkeypatch.setattr(trazas.os, "getpid", lambda: 102)
+    volcar_metricas(tmp_path)
+    contador.incrementar(1, ruta="/a")
+    contador.incrementar(1, ruta="/b")
+    histograma.observar(5)
+
+    texto = exponer_metricas(tmp_path)
+
+    assert 'prueba_total{ruta="/a"} 5' in texto
+    assert 'prueba_total{ruta="/b"} 1' in texto
+    assert 'prueba_segundos_bucket{le="0.1"} 2' in texto
+    assert 'prueba_segundos_bucket{le="+Inf"} 3' in texto
+    assert "prueba_segundos_count 3" in texto
+
+
+def test_el_endpoint_de_metricas_usa_el_directorio(metricas, monkeypatch, tmp_path):
+    contador, _ = metricas
+    monkeypatch.setattr(trazas, "iniciar_volcado", lambda directorio, intervalo: None)
+    (tmp_path / "101.json").write_text('{"prueba_total": [[["/a"], 7]]}')
+    app = FastAPI()
+    agregar_endpoint_metricas(app, directorio=tmp_path)
+    contador.incrementar(ruta="/a")
+
+    assert 'prueba_total{ruta="/a"} 8' in TestClient(app).get("/metrics").text
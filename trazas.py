@@ -0,0 +1,527 @@
+"""Instrumentación de latencia por etapa para las ejecuciones de Veredix.
+
+Registra spans (etapa, inicio, duración, atributos) dentro de la traza de cada petición HTTP y
+alimenta métricas acumuladas en formato de texto de Prometheus:
+
+- `veredix_etapa_duracion_segundos{etapa=...}`: histograma por etapa (modelo, agente miembro,
+  embedding, búsqueda, herramienta, storage),
+- `veredix_tokens_total{modelo=..., tipo=input|output}`: tokens por modelo,
+- `veredix_contexto_tokens_total{tipo=recuperado|empaquetado}`: tokens de los pasajes recuperados
+  antes y después de empaquetarlos (contexto_legal.py),
+- `veredix_solicitud_duracion_segundos{ruta=..., estado=...}`: duración total de cada petición,
+- `veredix_enrutador_total{categoria=...}`: mensajes clasificados por el enrutador (enrutador.py).
+
+Las métricas se exponen en `GET /metrics` y, si `TRAZAS_PATH` está definido, cada traza se añade
+como una línea JSON a ese archivo. Con varios workers cada proceso tiene sus propias métricas:
+si `METRICAS_DIR` está definido (servidor.py lo define al arrancar más de un worker), cada worker
+vuelca las suyas en `<METRICAS_DIR>/<pid>.json` y `/metrics` responde con la suma de todos. Los objetos de agno se instrumentan cambiando su clase por una
+subclase que mide (así sobrevive a los `deep_copy` que hace el Playground en cada petición).
+"""
+
+import functools
+import inspect
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from agno.utils.log import log_debug, logger
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+# ---- métricas ----
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _etiquetas(self, valores: Tuple[str, ...], extra: str = "") -> str:
+        pares = [f'{k}="{_escapar(v)}"' for k, v in zip(self.etiquetas, valores)]
+        if extra:
+            pares.append(extra)
+        return "{" + ",".join(pares) + "}" if pares else ""
+
+    def instantanea(self) -> Dict[Tuple[str, ...], Any]:
+        """Copia de los valores por combinación de etiquetas."""
+        raise NotImplementedError
+
+    @staticmethod
+    def sumar(a: Any, b: Any) -> Any:
+        return a + b
+
+    def exponer(self, valores: Optional[Dict[Tuple[str, ...], Any]] = None) -> List[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def incrementar(self, valor: float = 1.0, **etiquetas) -> None:
+        clave = tuple(str(etiquetas.get(e, "")) for e in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0.0) + valor
+
+    def instantanea(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._valores)
+
+    def exponer(self, valores: Optional[Dict[Tuple[str, ...], float]] = None) -> List[str]:
+        lineas = super().exponer()
+        for clave, valor in sorted((self.instantanea() if valores is None else valores).items()):
+            lineas.append(f"{self.nombre}{self._etiquetas(clave)} {valor:g}")
+        return lineas
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = BUCKETS_SEGUNDOS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observar(self, valor: float, **etiquetas) -> None:
+        clave = tuple(str(etiquetas.get(e, "")) for e in self.etiquetas)
+        with self._lock:
+            # [conteos por bucket..., +Inf, suma]
+            serie = self._series.setdefault(clave, [0.0] * (len(self.buckets) + 2))
+            serie[bisect_left(self.buckets, valor)] += 1
+            serie[-1] += valor
+
+    def instantanea(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {clave: list(serie) for clave, serie in self._series.items()}
+
+    @staticmethod
+    def sumar(a: List[float], b: List[float]) -> List[float]:
+        return [x + y for x, y in zip(a, b)]
+
+    def exponer(self, valores: Optional[Dict[Tuple[str, ...], List[float]]] = None) -> List[str]:
+        lineas = super().exponer()
+        for clave, serie in sorted((self.instantanea() if valores is None else valores).items()):
+            acumulado = 0.0
+            for limite, conteo in zip(self.buckets, serie):
+                acumulado += conteo
+                etiquetas = self._etiquetas(clave, 'le="%g"' % limite)
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado:g}")
+            acumulado += serie[len(self.buckets)]
+            etiquetas = self._etiquetas(clave, 'le="+Inf"')
+            lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado:g}")
+            lineas.append(f"{self.nombre}_sum{self._etiquetas(clave)} {serie[-1]:.6f}")
+            lineas.append(f"{self.nombre}_count{self._etiquetas(clave)} {acumulado:g}")
+        return lineas
+
+
+DURACION_ETAPAS = Histograma("veredix_etapa_duracion_segundos", "Duración de cada etapa de una ejecución", ("etapa",))
+ERRORES_ETAPAS = Contador("veredix_etapa_errores_total", "Etapas que terminaron con excepción", ("etapa",))
+TOKENS = Contador("veredix_tokens_total", "Tokens consumidos por modelo", ("modelo", "tipo"))
+TOKENS_CONTEXTO = Contador("veredix_contexto_tokens_total", "Tokens de pasajes recuperados antes y después de empaquetar", ("tipo",))
+LLAMADAS_MODELO = Contador("veredix_llamadas_modelo_total", "Llamadas a la API de cada modelo", ("modelo",))
+DURACION_SOLICITUDES = Histograma(
+    "veredix_solicitud_duracion_segundos", "Duración total de las peticiones HTTP", ("ruta", "estado")
+)
+CLASIFICACIONES = Contador("veredix_enrutador_total", "Mensajes clasificados por el enrutador, por categoría", ("categoria",))
+METRICAS: List[_Metrica] = [
+    DURACION_SOLICITUDES,
+    DURACION_ETAPAS,
+    ERRORES_ETAPAS,
+    LLAMADAS_MODELO,
+    TOKENS,
+    TOKENS_CONTEXTO,
+    CLASIFICACIONES,
+]
+
+
+def exponer_metricas(directorio: Optional[Path] = None) -> str:
+    """Todas las métricas en formato de texto de Prometheus, sumando las de los workers que volcaron en `directorio`."""
+    if directorio is None:
+        return "\n".join(linea for metrica in METRICAS for linea in metrica.exponer()) + "\n"
+    totales = {metrica.nombre: metrica.instantanea() for metrica in METRICAS}
+    propio = f"{os.getpid()}.json"
+    for ruta in Path(directorio).glob("*.json"):
+        if ruta.name == propio:
+            # Las de este proceso se toman en vivo
+            continue
+        try:
+            volcado = json.loads(ruta.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"No se pudieron leer las métricas de {ruta}: {e}")
+            continue
+        for metrica in METRICAS:
+            valores = totales[metrica.nombre]
+            for clave, valor in volcado.get(metrica.nombre, []):
+                clave = tuple(clave)
+                valores[clave] = metrica.sumar(valores[clave], valor) if clave in valores else valor
+    return "\n".join(linea for metrica in METRICAS for linea in metrica.exponer(totales[metrica.nombre])) + "\n"
+
+
+def volcar_metricas(directorio: Path) -> None:
+    """Escribe las métricas de este proceso en `<directorio>/<pid>.json` (reemplazo atómico)."""
+    volcado = {metrica.nombre: [[list(clave), valor] for clave, valor in metrica.instantanea().items()] for metrica in METRICAS}
+    ruta = Path(directorio) / f"{os.getpid()}.json"
+    temporal = ruta.with_suffix(".tmp")
+    try:
+        temporal.write_text(json.dumps(volcado), encoding="utf-8")
+        os.replace(temporal, ruta)
+    except OSError as e:
+        logger.warning(f"No se pudieron volcar las métricas en {ruta}: {e}")
+
+
+_lock_volcado = threading.Lock()
+_hilos_volcado: Dict[str, threading.Thread] = {}
+
+
+def iniciar_volcado(directorio: Path, intervalo: float) -> None:
+    """Vuelca las métricas del worker cada `intervalo` segundos y al salir (una vez por proceso)."""
+    directorio = Path(directorio)
+    with _lock_volcado:
+        if str(directorio) in _hilos_volcado:
+            return
+        directorio.mkdir(parents=True, exist_ok=True)
+
+        def volcar_periodicamente():
+            while True:
+                time.sleep(intervalo)
+                volcar_metricas(directorio)
+
+        hilo = threading.Thread(target=volcar_periodicamente, name="volcado-metricas", daemon=True)
+        _hilos_volcado[str(directorio)] = hilo
+        atexit.register(volcar_metricas, directorio)
+        hilo.start()
+
+
+# ---- trazas y spans ----
+
+
+@dataclass
+class Traza:
+    ruta: str
+    traza_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    inicio: float = field(default_factory=time.time)
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+    _reloj: float = field(default_factory=time.perf_counter, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"traza_id": self.traza_id, "ruta": self.ruta, "inicio": self.inicio, "spans": self.spans}
+
+
+_traza: ContextVar[Optional[Traza]] = ContextVar("veredix_traza", default=None)
+_span_padre: ContextVar[Optional[str]] = ContextVar("veredix_span_padre", default=None)
+
+
+@contextmanager
+def span(etapa: str, **atributos) -> Iterator[Dict[str, Any]]:
+    """Mide una etapa; los atributos pueden completarse dentro del bloque."""
+    traza = _traza.get()
+    padre = _span_padre.get()
+    span_id = uuid.uuid4().hex[:16]
+    token = _span_padre.set(span_id)
+    inicio = time.perf_counter()
+    error = None
+    try:
+        yield atributos
+    except BaseException as e:
+        error = e.__class__.__name__
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        try:
+            _span_padre.reset(token)
+        except ValueError:
+            # Iteradores consumidos desde otro contexto (p. ej. en el threadpool de Starlette)
+            pass
+        DURACION_ETAPAS.observar(duracion, etapa=etapa)
+        if error is not None:
+            ERRORES_ETAPAS.incrementar(etapa=etapa)
+        if traza is not None:
+            traza.spans.append(
+                {
+                    "id": span_id,
+                    "padre": padre,
+                    "etapa": etapa,
+                    "inicio_ms": round((inicio - traza._reloj) * 1000, 3),
+                    "duracion_ms": round(duracion * 1000, 3),
+                    **({"error": error} if error else {}),
+                    **({"atributos": atributos} if atributos else {}),
+                }
+            )
+
+
+def registrar_tokens(modelo: str, entrada: Optional[int], salida: Optional[int]) -> None:
+    LLAMADAS_MODELO.incrementar(modelo=modelo)
+    if entrada:
+        TOKENS.incrementar(entrada, modelo=modelo, tipo="input")
+    if salida:
+        TOKENS.incrementar(salida, modelo=modelo, tipo="output")
+
+
+def _medir_iterador(etapa: str, iterador, **atributos):
+    with span(etapa, **atributos):
+        yield from iterador
+
+
+async def _medir_iterador_async(etapa: str, iterador, **atributos):
+    with span(etapa, **atributos):
+        async for elemento in iterador:
+            yield elemento
+
+
+# ---- instrumentación de objetos de agno ----
+
+
+class _ModeloInstrumentado:
+    def _etapa_modelo(self) -> str:
+        return f"modelo:{getattr(self, 'id', self.__class__.__name__)}"
+
+    def invoke(self, *args, **kwargs):
+        with span(self._etapa_modelo()):
+            return _original(self).invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        with span(self._etapa_modelo()):
+            return await _original(self).ainvoke(*args, **kwargs)
+
+    def invoke_stream(self, *args, **kwargs):
+        return _medir_iterador(self._etapa_modelo(), _original(self).invoke_stream(*args, **kwargs))
+
+    def ainvoke_stream(self, *args, **kwargs):
+        return _medir_iterador_async(self._etapa_modelo(), _original(self).ainvoke_stream(*args, **kwargs))
+
+    def _add_usage_metrics_to_assistant_message(self, assistant_message, response_usage) -> None:
+        _original(self)._add_usage_metrics_to_assistant_message(assistant_message, response_usage)
+        metricas = assistant_message.metrics
+        registrar_tokens(getattr(self, "id", "desconocido"), metricas.input_tokens, metricas.output_tokens)
+
+
+class _AgenteInstrumentado:
+    def _etapa_agente(self) -> str:
+        return f"agente:{self.name or self.agent_id}"
+
+    def _es_stream(self, kwargs) -> bool:
+        stream = kwargs.get("stream")
+        return bool(self.stream if stream is None else stream)
+
+    def run(self, *args, **kwargs):
+        if self._es_stream(kwargs):
+            # Con stream, la ejecución ocurre mientras se consume el iterador
+            return _medir_iterador(self._etapa_agente(), _original(self).run(*args, **kwargs))
+        with span(self._etapa_agente()):
+            return _original(self).run(*args, **kwargs)
+
+    async def arun(self, *args, **kwargs):
+        if self._es_stream(kwargs):
+            return _medir_iterador_async(self._etapa_agente(), await _original(self).arun(*args, **kwargs))
+        with span(self._etapa_agente()):
+            return await _original(self).arun(*args, **kwargs)
+
+
+class _StorageInstrumentado:
+    def read(self, *args, **kwargs):
+        with span("storage:read"):
+            return _original(self).read(*args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        with span("storage:upsert"):
+            return _original(self).upsert(*args, **kwargs)
+
+
+_CLASES: Dict[Tuple[type, type], type] = {}
+
+
+def _original(objeto: Any):
+    """`super()` de la subclase instrumentada, para llamar a la implementación de agno."""
+    clase = next(c for c in type(objeto).__mro__ if "_mixin_instrumentacion" in c.__dict__)
+    return super(clase, objeto)
+
+
+def _cambiar_clase(objeto: Any, mixin: type) -> None:
+    base = type(objeto)
+    if getattr(base, "_mixin_instrumentacion", None) is mixin:
+        return
+    clase = _CLASES.get((base, mixin))
+    if clase is None:
+        # Subclase directa con los métodos del mixin copiados: una base extra cambiaría el layout
+        # del objeto y Python no permitiría reasignar `__class__`
+        metodos = {k: v for k, v in vars(mixin).items() if not k.startswith("__")}
+        atributos = {**metodos, "_mixin_instrumentacion": mixin, "__module__": base.__module__}
+        clase = type(f"{base.__name__}Instrumentado", (base,), atributos)
+        _CLASES[(base, mixin)] = clase
+    objeto.__class__ = clase
+
+
+_inicios_herramientas: Dict[int, float] = {}
+
+
+def _antes_herramienta(fc) -> None:
+    _inicios_herramientas[id(fc)] = time.perf_counter()
+
+
+def _despues_herramienta(fc) -> None:
+    inicio = _inicios_herramientas.pop(id(fc), None)
+    if inicio is None:
+        return
+    etapa = f"herramienta:{fc.function.name}"
+    duracion = time.perf_counter() - inicio
+    DURACION_ETAPAS.observar(duracion, etapa=etapa)
+    traza = _traza.get()
+    if traza is not None:
+        traza.spans.append(
+            {
+                "id": uuid.uuid4().hex[:16],
+                "padre": _span_padre.get(),
+                "etapa": etapa,
+                "inicio_ms": round((inicio - traza._reloj) * 1000, 3),
+                "duracion_ms": round(duracion * 1000, 3),
+            }
+        )
+
+
+def _instrumentar_herramientas(herramientas) -> None:
+    from agno.tools import Toolkit
+
+    for herramienta in herramientas or []:
+        if isinstance(herramienta, Toolkit):
+            for funcion in herramienta.functions.values():
+                # Se respetan los hooks propios de la herramienta
+                if funcion.pre_hook is None and funcion.post_hook is None:
+                    funcion.pre_hook = _antes_herramienta
+                    funcion.post_hook = _despues_herramienta
+
+
+def instrumentar(entidad: Any) -> Any:
+    """Instrumenta un agente o equipo y, recursivamente, sus modelos, storage, herramientas y miembros."""
+    from agno.agent import Agent
+
+    if isinstance(entidad, Agent):
+        _cambiar_clase(entidad, _AgenteInstrumentado)
+    if getattr(entidad, "model", None) is not None:
+        _cambiar_clase(entidad.model, _ModeloInstrumentado)
+    if getattr(entidad, "storage", None) is not None:
+        _cambiar_clase(entidad.storage, _StorageInstrumentado)
+    _instrumentar_herramientas(getattr(entidad, "tools", None))
+    for miembro in getattr(entidad, "members", None) or getattr(entidad, "team", None) or []:
+        instrumentar(miembro)
+    return entidad
+
+
+# ---- integración con el Playground ----
+
+
+class _EscritorTrazas:
+    def __init__(self, ruta: Path):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def escribir(self, traza: Traza, duracion: float, estado: int) -> None:
+        datos = {**traza.to_dict(), "duracion_ms": round(duracion * 1000, 3), "estado": estado}
+        linea = json.dumps(datos, ensure_ascii=False, default=str)
+        try:
+            with self._lock, open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+        except OSError as e:
+            logger.warning(f"No se pudo escribir la traza en {self.ruta}: {e}")
+
+
+def _ruta_plantilla(scope) -> str:
+    """Ruta con los ids reemplazados, para no crear una serie por sesión."""
+    ruta = scope.get("path", "")
+    partes = ruta.strip("/").split("/")
+    for i, parte in enumerate(partes):
+        if i > 0 and partes[i - 1] in ("agents", "teams", "workflows", "sessions"):
+            partes[i] = "{id}"
+    return "/" + "/".join(partes)
+
+
+class TrazasMiddleware:
+    """Abre una traza por petición HTTP y mide su duración hasta el último byte enviado."""
+
+    def __init__(self, app, ruta_trazas: Optional[Path] = None, excluir: Sequence[str] = ("/metrics", "/health/live", "/health/ready")):
+        self.app = app
+        self.escritor = _EscritorTrazas(ruta_trazas) if ruta_trazas else None
+        self.excluir = tuple(excluir)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].endswith(self.excluir):
+            return await self.app(scope, receive, send)
+
+        ruta = _ruta_plantilla(scope)
+        traza = Traza(ruta=f"{scope['method']} {scope['path']}")
+        token = _traza.set(traza)
+        estado = 500
+
+        async def _send(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                mensaje.setdefault("headers", [])
+                mensaje["headers"] = list(mensaje["headers"]) + [(b"x-veredix-traza", traza.traza_id.encode())]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            duracion = time.perf_counter() - traza._reloj
+            _traza.reset(token)
+            DURACION_SOLICITUDES.observar(duracion, ruta=ruta, estado=estado)
+            if self.escritor is not None:
+                self.escritor.escribir(traza, duracion, estado)
+            log_debug(f"Traza {traza.traza_id}: {len(traza.spans)} spans en {duracion * 1000:.1f} ms")
+
+
+def agregar_endpoint_metricas(app, ruta: str = "/metrics", directorio: Optional[Path] = None, intervalo: float = 5.0) -> None:
+    from fastapi.responses import PlainTextResponse
+
+    if directorio is not None:
+        iniciar_volcado(directorio, intervalo)
+
+    async def metricas():
+        return PlainTextResponse(exponer_metricas(directorio), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    app.add_api_route(ruta, metricas, methods=["GET"], include_in_schema=False)
+
+
+def medir(etapa: str):
+    """Decorador para medir funciones propias como una etapa."""
+
+    def decorador(funcion):
+        if inspect.iscoroutinefunction(funcion):
+
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                with span(etapa):
+                    return await funcion(*args, **kwargs)
+
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with span(etapa):
+                return funcion(*args, **kwargs)
+
+        return envoltura
+
+    return decorador